@@ -1,46 +1,298 @@
-from typing import Any
+import hashlib
+import json
+import os
+import queue
+import random
+import threading
+import time
+from functools import partial
+from typing import Any, Callable
+import numpy as np
 import torch
 from pathlib import Path
 from ai.models import CoincheAgent
+from ai.tensor_store import TensorStore
+from ai.training import CoincheTrainer
+from ai.utils import MmapReplayBuffer
 
 
 class CheckpointManager:
-    def __init__(self, save_dir: str = "src/ai/checkpoints"):
+    """Saves agent checkpoints from a background thread.
+
+    `save_checkpoint` copies the weights to CPU and returns, the writer thread
+    then writes the file under a temporary name and renames it into place.
+    Each agent writes to its own subdirectory, where the `keep_last` latest
+    checkpoints are kept, plus the first one of every `keep_every` episodes.
+
+    Given the trainer, a checkpoint also holds its optimizers, schedulers,
+    replay reference and the random generators, plus any resumable counters
+    passed as `state`, so `load_training_state` restarts where it stopped.
+    A memory-mapped replay is flushed up to the saved size by the writer
+    thread, just before the checkpoint is written.
+
+    Every directory has a `manifest.json` listing its checkpoints with their
+    size, SHA-256 and metrics, and pointing at the latest one, rewritten
+    atomically after each save so readers never scan the directory.
+
+    With `dedup`, checkpoints are JSON manifests over a content-addressed
+    `TensorStore` shared by every agent, identical tensors are written once
+    and blobs left unreferenced by retention are deleted.
+    """
+
+    MANIFEST_FILE = "manifest.json"
+
+    def __init__(
+        self,
+        save_dir: str = "src/ai/checkpoints",
+        keep_last: int = 5,
+        keep_every: int | None = None,
+        dedup: bool = False,
+    ):
         self.save_dir = Path(save_dir)
         self.save_dir.mkdir(exist_ok=True)
+        self.keep_last = keep_last
+        self.keep_every = keep_every
+        self.store = TensorStore(self.save_dir / "blobs") if dedup else None
+        self.suffix = ".json" if dedup else ".pt"
+        self._queue: queue.Queue[
+            tuple[Path, dict[str, Any], Callable[[], None] | None] | None
+        ] = queue.Queue()
+        self._error: BaseException | None = None
+        # Manifests of the directories written by this manager
+        self._manifests: dict[Path, dict[str, Any]] = {}
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def _dir(self, name: str | None) -> Path:
+        return self.save_dir / name if name else self.save_dir
 
     def save_checkpoint(
-        self, agent: CoincheAgent, episode: int, metrics: dict[str, Any] = {}
+        self,
+        agent: CoincheAgent,
+        episode: int,
+        metrics: dict[str, Any] = {},
+        name: str | None = None,
+        trainer: CoincheTrainer | None = None,
+        state: dict[str, Any] | None = None,
     ):
+        self._raise_error()
         checkpoint: dict[str, Any] = {
             "episode": episode,
-            "state_encoder": agent.state_encoder.state_dict(),
-            "bidding_network": agent.bidding_network.state_dict(),
-            "card_play_network": agent.card_play_network.state_dict(),
-            "metrics": metrics,
+            "state_encoder": _cpu_copy(agent.state_encoder.state_dict()),
+            "bidding_network": _cpu_copy(agent.bidding_network.state_dict()),
+            "card_play_network": _cpu_copy(agent.card_play_network.state_dict()),
+            "metrics": dict(metrics),
         }
+        flush_replay = None
+        if trainer is not None:
+            checkpoint["trainer"] = _cpu_copy(trainer.state_dict())
+            checkpoint["rng"] = _rng_state()
+            checkpoint["state"] = _cpu_copy(state or {})
+            replay = trainer.replay_buffer
+            if isinstance(replay, MmapReplayBuffer):
+                # Publishes the records referenced now, off the learner thread
+                flush_replay = partial(replay.flush, replay.index())
 
-        path = self.save_dir / f"checkpoint_ep{episode}.pt"
-        torch.save(checkpoint, path)  # type: ignore
+        path = self._dir(name) / f"checkpoint_ep{episode}{self.suffix}"
+        self._queue.put((path, checkpoint, flush_replay))
 
-    def load_checkpoint(
-        self, agent: CoincheAgent, episode: int | None = None
-    ) -> dict[str, Any]:
+    def wait(self):
+        """Block until every queued checkpoint is on disk."""
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        self._queue.put(None)
+        self._writer.join()
+        self._raise_error()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("Checkpoint writer failed") from error
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                path, checkpoint, flush_replay = item
+                if flush_replay is not None:
+                    flush_replay()
+                path.parent.mkdir(parents=True, exist_ok=True)
+                if self.store is not None:
+                    self.store.save(checkpoint, path)
+                else:
+                    tmp_path = path.with_suffix(path.suffix + ".tmp")
+                    torch.save(checkpoint, tmp_path)  # type: ignore
+                    os.replace(tmp_path, path)
+                self._record(path, checkpoint)
+            except BaseException as error:
+                self._error = error
+            finally:
+                self._queue.task_done()
+
+    def _record(self, path: Path, checkpoint: dict[str, Any]):
+        directory = path.parent
+        if directory not in self._manifests:
+            self._manifests[directory] = self._read_manifest(directory)
+        manifest = self._manifests[directory]
+        entries: dict[str, dict[str, Any]] = manifest["checkpoints"]
+        with open(path, "rb") as f:
+            digest = hashlib.file_digest(f, "sha256").hexdigest()
+        entries[str(checkpoint["episode"])] = {
+            "file": path.name,
+            "size": path.stat().st_size,
+            "sha256": digest,
+            "saved_at": time.time(),
+            "metrics": checkpoint["metrics"],
+        }
+
+        # Retention
+        episodes = sorted(int(episode) for episode in entries)
+        keep = set(episodes[-self.keep_last :])
+        if self.keep_every:
+            milestones: dict[int, int] = {}
+            for episode in episodes:
+                milestones.setdefault(episode // self.keep_every, episode)
+            keep |= set(milestones.values())
+        removed = [episode for episode in episodes if episode not in keep]
+        for episode in removed:
+            (directory / entries.pop(str(episode))["file"]).unlink(missing_ok=True)
+        if removed and self.store is not None:
+            self.store.collect_garbage(self.save_dir.rglob("checkpoint_ep*.json"))
+
+        manifest["latest"] = max(keep)
+        tmp_path = directory / (self.MANIFEST_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, directory / self.MANIFEST_FILE)
+
+    def manifest(self, name: str | None = None) -> dict[str, Any]:
+        """Latest episode and metadata of the checkpoints saved under `name`."""
+        self.wait()
+        return self._read_manifest(self._dir(name))
+
+    def _read_manifest(self, directory: Path) -> dict[str, Any]:
+        path = directory / self.MANIFEST_FILE
+        if path.exists():
+            with open(path, "r") as f:
+                return json.load(f)
+        # Directories written before manifests existed
+        entries = {
+            p.stem.split("ep")[1]: {"file": p.name, "size": p.stat().st_size}
+            for p in directory.glob(f"checkpoint_ep*{self.suffix}")
+        }
+        return {
+            "latest": max(map(int, entries)) if entries else None,
+            "checkpoints": entries,
+        }
+
+    def _find(self, episode: int | None, name: str | None, verify: bool) -> Path:
+        # Checkpoints still queued for writing may be the latest
+        self.wait()
+        directory = self._dir(name)
+        manifest = self._read_manifest(directory)
         if episode is None:
             # Load latest checkpoint
-            checkpoints = list(self.save_dir.glob("checkpoint_ep*.pt"))
-            if not checkpoints:
+            if manifest["latest"] is None:
                 raise FileNotFoundError("No checkpoints found")
-            path = max(checkpoints, key=lambda p: int(p.stem.split("ep")[1]))
-        else:
-            path = self.save_dir / f"checkpoint_ep{episode}.pt"
+            episode = manifest["latest"]
+        entry = manifest["checkpoints"].get(str(episode), {})
+        path = directory / entry.get("file", f"checkpoint_ep{episode}{self.suffix}")
 
         if not path.exists():
             raise FileNotFoundError(f"Checkpoint {path} not found")
+        if verify and "sha256" in entry:
+            with open(path, "rb") as f:
+                if hashlib.file_digest(f, "sha256").hexdigest() != entry["sha256"]:
+                    raise ValueError(f"Checkpoint {path} does not match its hash")
+        return path
 
-        checkpoint: dict[str, Any] = torch.load(path, weights_only=True)  # type: ignore
+    def _load(
+        self,
+        agent: CoincheAgent,
+        episode: int | None,
+        name: str | None,
+        verify: bool = False,
+    ) -> dict[str, Any]:
+        path = self._find(episode, name, verify)
+        # Tensors are paged in from the files as they are copied into place
+        if self.store is not None:
+            checkpoint: dict[str, Any] = self.store.load(path)
+        else:
+            checkpoint = torch.load(path, weights_only=True, mmap=True)  # type: ignore
         agent.state_encoder.load_state_dict(checkpoint["state_encoder"])
         agent.bidding_network.load_state_dict(checkpoint["bidding_network"])
         agent.card_play_network.load_state_dict(checkpoint["card_play_network"])
+        return checkpoint
+
+    def load_checkpoint(
+        self,
+        agent: CoincheAgent,
+        episode: int | None = None,
+        name: str | None = None,
+        verify: bool = False,
+    ) -> dict[str, Any]:
+        return self._load(agent, episode, name, verify).get("metrics", {})
+
+    def load_training_state(
+        self,
+        trainer: CoincheTrainer,
+        episode: int | None = None,
+        name: str | None = None,
+        verify: bool = False,
+    ) -> dict[str, Any]:
+        """Restore the agent and trainer, returns the episode and saved counters.
+
+        Checkpoints saved without a trainer only restore the weights.
+        """
+        checkpoint = self._load(trainer.agent, episode, name, verify)
+        if "trainer" in checkpoint:
+            trainer.load_state_dict(checkpoint["trainer"])
+            _set_rng_state(checkpoint["rng"])
+        return {
+            "episode": checkpoint["episode"],
+            "metrics": checkpoint.get("metrics", {}),
+            **checkpoint.get("state", {}),
+        }
+
+
+def _cpu_copy(value: Any) -> Any:
+    """Detached CPU copy of nested containers, safe to write in the background."""
+    if isinstance(value, torch.Tensor):
+        return value.detach().to("cpu", copy=True)
+    if isinstance(value, dict):
+        return {key: _cpu_copy(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_cpu_copy(item) for item in value)
+    return value
+
+
+def _rng_state() -> dict[str, Any]:
+    # NumPy arrays are stored as tensors, which weights_only loading accepts
+    kind, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    return {
+        "python": random.getstate(),
+        "numpy": (
+            kind,
+            torch.from_numpy(keys.astype(np.int64)),
+            pos,
+            has_gauss,
+            cached_gaussian,
+        ),
+        "torch": torch.get_rng_state(),
+        "cuda": torch.cuda.get_rng_state_all() if torch.cuda.is_available() else [],
+    }
+
 
-        return checkpoint.get("metrics", {})
+def _set_rng_state(state: dict[str, Any]):
+    random.setstate(state["python"])
+    kind, keys, pos, has_gauss, cached_gaussian = state["numpy"]
+    np.random.set_state(
+        (kind, keys.numpy().astype(np.uint32), pos, has_gauss, cached_gaussian)
+    )
+    torch.set_rng_state(state["torch"])
+    if state["cuda"] and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
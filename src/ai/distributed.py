@@ -0,0 +1,245 @@
+"""Asynchronous actor/learner self-play.
+
+Actor processes play deals with a shared-seat policy whose weights are views
+into shared memory, and send packed transition records to the learner through
+shared-memory queues. The learner fills a central replay buffer from them,
+trains continuously and publishes fresh weights into that memory every
+`weight_sync_interval` updates.
+"""
+
+import queue
+import random
+import time
+from dataclasses import dataclass
+from multiprocessing.synchronize import Event
+from typing import Any
+
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+
+from models import Bid, Card, GameStage
+from game import CoincheGame
+from game_rules import GameRules
+from ai.encoding import action_to_index, candidate_bids, valid_cards
+from ai.envs import new_game
+from ai.models import CoincheAgent
+from ai.shared_weights import SharedWeights
+from ai.symmetry import encode_decision
+from ai.training import CoincheTrainer
+from ai.utils import CompactReplayBuffer, NStepAccumulator, calculate_reward
+from ai.utils.compact_replay import transition_dtype
+
+
+@dataclass
+class ActorLearnerConfig:
+    num_actors: int = max(mp.cpu_count() - 1, 1)
+    total_updates: int = 10_000
+    weight_sync_interval: int = 100
+    batch_size: int = 256
+    replay_capacity: int = 1_000_000
+    warmup: int = 1_000
+    n_step: int = 5
+    gamma: float = 0.99
+    epsilon: float = 0.1
+    queue_size: int = 64
+
+
+def choose_action(
+    agent: CoincheAgent,
+    game: CoincheGame,
+    player_id: int,
+    epsilon: float = 0.0,
+    rng: random.Random | None = None,
+) -> Card | Bid:
+    """Epsilon-greedy decision for the player to act."""
+    rng = rng or random.Random()
+    explore = rng.random() < epsilon
+    if game.phase == GameStage.BID:
+        if not explore:
+            return agent.select_bid(game, player_id)
+        bids = candidate_bids(game, player_id)
+        if GameRules.is_pass_valid(game.current_bid, player_id):
+            bids.append(Bid(player=player_id, is_pass=True, points=None, suit=None))
+        return rng.choice(bids)
+    if not explore:
+        return agent.select_card(game, player_id)
+    return rng.choice(valid_cards(game, player_id))
+
+
+def play_deal(
+    game: CoincheGame,
+    agent: CoincheAgent,
+    accumulator: NStepAccumulator,
+    epsilon: float = 0.0,
+    rng: random.Random | None = None,
+    weights: SharedWeights | None = None,
+):
+    """Play one deal with `agent` in every seat, feeding its decisions to `accumulator`.
+
+    An agent attached to `weights` decides through its seqlock.
+    """
+
+    def decide(player_id: int) -> Card | Bid:
+        if weights is None:
+            return choose_action(agent, game, player_id, epsilon, rng)
+        return weights.read(
+            lambda: choose_action(agent, game, player_id, epsilon, rng)
+        )
+
+    def record(player_id: int, action: Card | Bid):
+        state, action_index, mask = encode_decision(
+            game,
+            player_id,
+            action_to_index(action),
+            agent.relative_seats,
+            agent.canonical_suits,
+        )
+        accumulator.observe(
+            player_id, state, action_index, isinstance(action, Card), mask
+        )
+
+    # Bidding phase
+    while game.phase == GameStage.BID:
+        current_player = game.current_player
+        bid = decide(current_player)
+        record(current_player, bid)
+        if bid.is_pass:
+            game.pass_bid(game.get_current_player())
+            # Everybody passed and the cards were dealt again
+            if not game.bids:
+                for player_id in range(4):
+                    accumulator.end(player_id)
+        else:
+            game.place_bid(bid)
+
+    # Card play, rewards come in after each trick
+    while game.phase == GameStage.GAME:
+        current_player = game.current_player
+        card = decide(current_player)
+        record(current_player, card)
+        game.play_card(game.get_current_player(), card)
+        if not game.current_trick:
+            for player_id in range(4):
+                accumulator.reward(player_id, calculate_reward(game, player_id))
+
+    for player_id in range(4):
+        accumulator.end(player_id)
+    game.new_game()
+
+
+def run_actor(
+    actor_id: int,
+    config: ActorLearnerConfig,
+    transitions: Any,
+    weights: SharedWeights,
+    stop: Event,
+):
+    torch.set_num_threads(1)
+    rng = random.Random(actor_id)
+    agent = CoincheAgent(device="cpu", relative_seats=True)
+    weights.attach(agent)
+    staging = CompactReplayBuffer(capacity=4096, relative_seats=True)
+    accumulator = NStepAccumulator(staging, config.n_step, config.gamma)
+    game = new_game()
+
+    while not stop.is_set():
+        play_deal(game, agent, accumulator, config.epsilon, rng, weights)
+        records = staging.data[: len(staging)].copy()
+        staging.clear()
+        # The tensor's storage is moved to shared memory, not pickled
+        message = (actor_id, torch.from_numpy(records.view(np.uint8)))
+        while not stop.is_set():
+            try:
+                transitions.put(message, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+
+
+class ActorLearner:
+    """Runs `num_actors` self-play processes feeding a learner in this process."""
+
+    def __init__(self, config: ActorLearnerConfig | None = None):
+        self.config = config or ActorLearnerConfig()
+        self.agent = CoincheAgent(relative_seats=True)
+        self.replay_buffer = CompactReplayBuffer(
+            self.config.replay_capacity, relative_seats=True
+        )
+        self.trainer = CoincheTrainer(
+            self.agent,
+            gamma=self.config.gamma,
+            batch_size=self.config.batch_size,
+            replay_buffer=self.replay_buffer,
+            fused=True,
+        )
+        self.weights = SharedWeights(self.agent)
+        self.record_dtype = transition_dtype(relative_seats=True)
+        self.deals = 0
+        self.updates = 0
+
+    def collect(self, transitions: Any, block: bool) -> int:
+        received = 0
+        while True:
+            try:
+                _, records = transitions.get(block=block and not received, timeout=1.0)
+            except queue.Empty:
+                return received
+            self.replay_buffer.push_records(records.numpy().view(self.record_dtype))
+            self.deals += 1
+            received += 1
+
+    def run(self) -> dict[str, float]:
+        ctx = mp.get_context("spawn")
+        transitions = ctx.Queue(self.config.queue_size)
+        stop = ctx.Event()
+        actors = [
+            ctx.Process(
+                target=run_actor,
+                args=(i, self.config, transitions, self.weights, stop),
+                daemon=True,
+            )
+            for i in range(self.config.num_actors)
+        ]
+        for actor in actors:
+            actor.start()
+
+        start = time.perf_counter()
+        ready = max(self.config.warmup, self.config.batch_size)
+        try:
+            while self.updates < self.config.total_updates:
+                # Only wait for the actors while the buffer is warming up
+                self.collect(transitions, block=len(self.replay_buffer) < ready)
+                if len(self.replay_buffer) < ready:
+                    continue
+                # Batches with fewer than two rows for each head train nothing
+                if not self.trainer.update_networks():
+                    continue
+                self.updates += 1
+                if self.updates % self.config.weight_sync_interval == 0:
+                    self.weights.publish(self.agent)
+        finally:
+            stop.set()
+            for actor in actors:
+                actor.join(timeout=5)
+                if actor.is_alive():
+                    actor.terminate()
+
+        elapsed = time.perf_counter() - start
+        return {
+            "deals_per_sec": self.deals / elapsed,
+            "updates_per_sec": self.updates / elapsed,
+            "transitions": float(len(self.replay_buffer)),
+        }
+
+
+def main():
+    stats = ActorLearner().run()
+    print(
+        f"{stats['deals_per_sec']:.1f} deals/s, "
+        f"{stats['updates_per_sec']:.1f} updates/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Torch-free game state encoding shared by the torch agent and the NumPy runtime."""
+
+from itertools import product
+
+import numpy as np
+
+from models import Bid, Card, GameStage, Suit
+from game import CoincheGame
+from game_rules import GameRules
+
+STATE_DIM = 32 * 3  # 32 cards * 3 (in hand, played, visible)
+SEAT_DIM = 4  # contract holder, relative to the encoded seat
+NUM_CARD_ACTIONS = 32
+BID_POINTS = list(range(80, 120, 10)) + list(range(115, 165, 5))
+# Size of the BiddingNetwork output layer (player, points, suit, coinche)
+NUM_BID_ACTIONS = 4 * len(BID_POINTS) * len(Suit) * 2
+
+SUIT_OFFSET = {
+    Suit.HEARTS: 0,
+    Suit.DIAMONDS: 8,
+    Suit.CLUBS: 16,
+    Suit.SPADES: 24,
+}
+
+
+def card_to_index(card: Card) -> int:
+    return SUIT_OFFSET[card.suit] + card.order
+
+
+def bid_to_index(bid: Bid) -> int:
+    """Bidding head slot trained for this bid by CoincheTrainer."""
+    return bid.points or 0
+
+
+def action_to_index(action: Card | Bid) -> int:
+    if isinstance(action, Card):
+        return card_to_index(action)
+    return bid_to_index(action)
+
+
+def state_dim(relative_seats: bool = False) -> int:
+    return STATE_DIM + (SEAT_DIM if relative_seats else 0)
+
+
+def encode_game_state(
+    game: CoincheGame, player_id: int, relative_seats: bool = False
+) -> np.ndarray:
+    encoded = np.zeros(state_dim(relative_seats), dtype=np.float32)
+
+    # Encode cards in hand
+    for card in game.players[player_id].hand:
+        encoded[card_to_index(card)] = 1
+
+    # Encode cards played in current trick
+    for card in game.current_trick:
+        encoded[card_to_index(card) + 32] = 1
+
+    # Encode cards won
+    for trick in game.tricks:
+        for card in trick:
+            encoded[card_to_index(card) + 32 * 2] = 1
+
+    # Encode seats relative to the player so one network can play every seat.
+    # The encoded player is always the one to act, so only the contract
+    # holder needs a seat.
+    if relative_seats:
+        if game.current_bid and not game.current_bid.is_pass:
+            encoded[STATE_DIM + (game.current_bid.player - player_id) % 4] = 1
+
+    return encoded
+
+
+def candidate_bids(game: CoincheGame, player_id: int) -> list[Bid]:
+    """Valid bids for the player, in bidding head order."""
+    return [
+        bid
+        for bid in (
+            Bid(player=player_id, points=points, suit=suit, is_coinche=is_coinche)
+            for points, suit, is_coinche in product(
+                BID_POINTS, list(Suit), [True, False]
+            )
+        )
+        if GameRules.is_valid_bid(bid, game.current_bid)
+    ]
+
+
+def valid_cards(game: CoincheGame, player_id: int) -> list[Card]:
+    player = game.players[player_id]
+    return [
+        card
+        for card in player.hand
+        if game.current_bid
+        and game.current_bid.suit
+        and GameRules.is_play_valid(
+            card,
+            player,
+            game.current_trick,
+            game.current_bid.suit,
+            game.players,
+        )
+    ]
+
+
+def legal_action_mask(game: CoincheGame, player_id: int) -> np.ndarray:
+    """Head slots the player may choose from, padded to the bidding head width."""
+    mask = np.zeros(NUM_BID_ACTIONS, dtype=np.bool_)
+    if game.phase == GameStage.BID:
+        for bid in candidate_bids(game, player_id):
+            mask[bid_to_index(bid)] = True
+        if GameRules.is_pass_valid(game.current_bid, player_id):
+            mask[0] = True
+    else:
+        for card in valid_cards(game, player_id):
+            mask[card_to_index(card)] = True
+    return mask
@@ -0,0 +1,28 @@
+from .actions import (
+    NUM_ACTIONS,
+    PASS_ACTION,
+    action_mask,
+    decode_action,
+    encode_action,
+    new_game,
+)
+from .vector_env import EnvStep, SubprocVectorEnv, VectorEnv
+from .policies import HeuristicPolicy, RandomPolicy, SnapshotPolicy
+from .single_seat import SeatStep, SingleSeatEnv
+
+__all__ = [
+    "NUM_ACTIONS",
+    "PASS_ACTION",
+    "action_mask",
+    "decode_action",
+    "encode_action",
+    "new_game",
+    "EnvStep",
+    "SubprocVectorEnv",
+    "VectorEnv",
+    "HeuristicPolicy",
+    "RandomPolicy",
+    "SnapshotPolicy",
+    "SeatStep",
+    "SingleSeatEnv",
+]
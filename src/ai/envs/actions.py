@@ -0,0 +1,80 @@
+"""Integer action space of the environments.
+
+Actions are the head slots of `ai.encoding.action_to_index`, the ones the
+trainer and the replay buffers use: card play uses the card index (0-31),
+bidding uses the bid's points and 0 passes. Bid slots carry no suit, a bid
+is made in the bidder's strongest trump suit.
+"""
+
+import random
+
+import numpy as np
+
+from models import Bid, Card, GameStage, Player, Suit
+from game import CoincheGame
+from ai.encoding import (
+    NUM_BID_ACTIONS,
+    action_to_index,
+    card_to_index,
+    legal_action_mask,
+)
+
+PASS_ACTION = 0
+NUM_ACTIONS = NUM_BID_ACTIONS
+
+
+def new_game(rng: random.Random | None = None) -> CoincheGame:
+    game = CoincheGame(rng=rng)
+    for i in range(4):
+        game.add_player(Player(id=i, name=f"Player {i}", team=i % 2))
+    return game
+
+
+def strongest_suit(hand: list[Card]) -> Suit:
+    """Suit whose cards are worth the most as trumps."""
+    strength = {
+        suit: sum(card.value_atout for card in hand if card.suit == suit)
+        for suit in Suit
+    }
+    return max(strength, key=strength.__getitem__)
+
+
+def encode_action(action: Card | Bid) -> int:
+    return action_to_index(action)
+
+
+def decode_action(game: CoincheGame, player_id: int, action: int) -> Card | Bid:
+    """The card or bid `action` stands for in the player's current decision."""
+    if game.phase == GameStage.GAME:
+        for card in game.players[player_id].hand:
+            if card_to_index(card) == action:
+                return card
+        raise ValueError(f"Card {action} is not in the player's hand")
+    if action == PASS_ACTION:
+        return Bid(player=player_id, is_pass=True, points=None, suit=None)
+    suit = strongest_suit(game.players[player_id].hand)
+    return Bid(player=player_id, points=action, suit=suit)
+
+
+def apply_action(game: CoincheGame, action: int) -> tuple[bool, bool]:
+    """Take `action` for the seat to act.
+
+    Returns whether a trick was completed and whether the deal is over. A
+    deal that was played out is left as it is for scoring, one everybody
+    passed has already been dealt again by the engine.
+    """
+    player = game.get_current_player()
+    move = decode_action(game, game.current_player, action)
+    if isinstance(move, Card):
+        game.play_card(player, move)
+        trick_completed = not game.current_trick
+        return trick_completed, trick_completed and len(game.tricks) == 8
+    if move.is_pass:
+        game.pass_bid(player)
+        return False, not game.bids
+    game.place_bid(move)
+    return False, False
+
+
+def action_mask(game: CoincheGame, player_id: int) -> np.ndarray:
+    return legal_action_mask(game, player_id)
@@ -0,0 +1,153 @@
+"""Fast fixed policies auto-playing the other seats of `SingleSeatEnv`.
+
+A policy decides for a batch of tables at once, always for the seat to act.
+"""
+
+import random
+from pathlib import Path
+
+import numpy as np
+
+from models import GameStage
+from game import CoincheGame
+from game_rules import GameRules
+from ai.encoding import BID_POINTS, NUM_CARD_ACTIONS, candidate_bids, valid_cards
+from ai.runtime import NumpyAgent
+from ai.symmetry import from_canonical_bid
+from .actions import (
+    NUM_ACTIONS,
+    PASS_ACTION,
+    action_mask,
+    encode_action,
+    strongest_suit,
+)
+
+
+class RandomPolicy:
+    """Uniform over legal actions, passing with `pass_probability` while bidding."""
+
+    def __init__(self, pass_probability: float = 0.5, seed: int | None = None):
+        self.pass_probability = pass_probability
+        self.rng = random.Random(seed)
+
+    def act(self, games: list[CoincheGame]) -> np.ndarray:
+        actions = np.empty(len(games), dtype=np.int64)
+        for i, game in enumerate(games):
+            mask = action_mask(game, game.current_player)
+            if (
+                game.phase == GameStage.BID
+                and mask[PASS_ACTION]
+                and self.rng.random() < self.pass_probability
+            ):
+                actions[i] = PASS_ACTION
+                continue
+            actions[i] = self.rng.choice(np.flatnonzero(mask))
+        return actions
+
+
+class HeuristicPolicy:
+    """Rule of thumb play.
+
+    Bids in its strongest trump suit while the hand is worth the contract,
+    lets the partner's winning tricks through with its cheapest card,
+    otherwise wins as cheaply as it can or discards.
+    """
+
+    def __init__(self, min_strength: int = 40):
+        self.min_strength = min_strength
+
+    def act(self, games: list[CoincheGame]) -> np.ndarray:
+        return np.array(
+            [
+                self._bid(game) if game.phase == GameStage.BID else self._card(game)
+                for game in games
+            ],
+            dtype=np.int64,
+        )
+
+    def _bid(self, game: CoincheGame) -> int:
+        player_id = game.current_player
+        hand = game.players[player_id].hand
+        suit = strongest_suit(hand)
+        strength = sum(card.value_atout for card in hand if card.suit == suit)
+        # Every 2 points above the threshold are worth one step up
+        ceiling = 80 + 2 * (strength - self.min_strength)
+        mask = action_mask(game, player_id)
+        for points in BID_POINTS:
+            if points <= ceiling and mask[points]:
+                return points
+        return PASS_ACTION
+
+    def _card(self, game: CoincheGame) -> int:
+        player_id = game.current_player
+        atout = game.atout
+        cards = valid_cards(game, player_id)
+        assert atout is not None
+
+        def cost(card):
+            return card.points(atout), card.order
+
+        if not game.current_trick:
+            return encode_action(max(cards, key=cost))
+        best = GameRules.get_best_card_in_trick(game.current_trick, atout)
+        best_seat = (
+            player_id - len(game.current_trick) + game.current_trick.index(best)
+        ) % 4
+        if best_seat != (player_id + 2) % 4:
+            winners = [
+                card
+                for card in cards
+                if GameRules.get_best_card_in_trick([*game.current_trick, card], atout)
+                == card
+            ]
+            if winners:
+                return encode_action(min(winners, key=cost))
+        return encode_action(min(cards, key=cost))
+
+
+class SnapshotPolicy:
+    """Frozen network exported with `export_weights`, one forward pass per batch."""
+
+    def __init__(self, agent: NumpyAgent | str | Path):
+        self.agent = agent if isinstance(agent, NumpyAgent) else NumpyAgent(agent)
+
+    def act(self, games: list[CoincheGame]) -> np.ndarray:
+        actions = np.empty(len(games), dtype=np.int64)
+        bidding = [i for i, game in enumerate(games) if game.phase == GameStage.BID]
+        playing = [i for i, game in enumerate(games) if game.phase != GameStage.BID]
+
+        if bidding:
+            states, card_perms = self._encode(games, bidding)
+            probs = self.agent.bid_probs(states)
+            for i, row, card_perm in zip(bidding, probs, card_perms):
+                # Same choice as NumpyAgent.select_bid
+                bids = candidate_bids(games[i], games[i].current_player)
+                actions[i] = (
+                    encode_action(
+                        from_canonical_bid(
+                            bids[int(np.argmax(row[: len(bids)]))], card_perm
+                        )
+                    )
+                    if bids
+                    else PASS_ACTION
+                )
+        if playing:
+            states, card_perms = self._encode(games, playing)
+            probs = self.agent.card_probs(states)
+            # Back from the labelling the network saw to the real cards
+            probs = np.take_along_axis(probs, card_perms, axis=1)
+            masks = np.stack(
+                [action_mask(games[i], games[i].current_player) for i in playing]
+            )
+            probs = np.pad(probs, ((0, 0), (0, NUM_ACTIONS - NUM_CARD_ACTIONS)))
+            actions[playing] = np.where(masks, probs, -1).argmax(axis=1)
+        return actions
+
+    def _encode(
+        self, games: list[CoincheGame], rows: list[int]
+    ) -> tuple[np.ndarray, np.ndarray]:
+        views = [self.agent.encode_view(games[i], games[i].current_player) for i in rows]
+        return (
+            np.stack([state for state, _ in views]),
+            np.stack([card_perm for _, card_perm in views]),
+        )
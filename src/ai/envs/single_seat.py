@@ -0,0 +1,134 @@
+import random
+from dataclasses import dataclass
+from typing import Protocol
+
+import numpy as np
+
+from models import GameStage
+from game import CoincheGame
+from ai.encoding import state_dim
+from ai.symmetry import IDENTITY, encode_view, from_canonical_action, permute_mask
+from ai.utils.rewards import calculate_reward
+from .actions import NUM_ACTIONS, action_mask, apply_action, new_game
+from .policies import RandomPolicy
+
+
+class Policy(Protocol):
+    def act(self, games: list[CoincheGame]) -> np.ndarray: ...
+
+
+@dataclass
+class SeatStep:
+    observations: np.ndarray  # (N, state_dim)
+    masks: np.ndarray  # (N, NUM_ACTIONS)
+    rewards: np.ndarray  # (N,) earned since the learner's previous decision
+    dones: np.ndarray  # (N,) that decision was the last of a deal played out
+
+
+class SingleSeatEnv:
+    """`num_envs` tables where only `seat` is played from outside.
+
+    The other seats are auto-played by `opponents`, either one policy for
+    all of them or one per seat. Every `step()` takes the learner's actions
+    and plays on until each table waits on the learner again, grouping the
+    tables by policy so each policy decides for all its tables in one call.
+    A deal everybody passed is not an end: the engine deals again and the
+    table plays on to the learner's next decision, counted in `redeals`.
+    With `canonical_suits`, the learner's observations, masks and card
+    actions use its canonical suit labelling, as `CoincheAgent` sees them.
+    """
+
+    def __init__(
+        self,
+        num_envs: int = 1,
+        opponents: Policy | dict[int, Policy] | None = None,
+        seat: int = 0,
+        relative_seats: bool = False,
+        seed: int | None = None,
+        canonical_suits: bool = False,
+    ):
+        opponents = opponents if opponents is not None else RandomPolicy()
+        self.seat = seat
+        self.policies = {
+            s: opponents[s] if isinstance(opponents, dict) else opponents
+            for s in range(4)
+            if s != seat
+        }
+        self.num_envs = num_envs
+        self.relative_seats = relative_seats
+        self.canonical_suits = canonical_suits
+        self.observation_dim = state_dim(relative_seats)
+        self.num_actions = NUM_ACTIONS
+        # Labelling of each table's last observation
+        self.card_perms = np.tile(IDENTITY, (num_envs, 1))
+        self.rng = random.Random(seed)
+        self.games = [new_game(self.rng) for _ in range(num_envs)]
+        self.redeals = 0
+
+    def reset(self) -> SeatStep:
+        rewards = np.zeros(self.num_envs, dtype=np.float32)
+        dones = np.zeros(self.num_envs, dtype=np.bool_)
+        for game in self.games:
+            game.start_game()
+        self._advance(rewards, dones)
+        return self._observe(rewards, dones)
+
+    def step(self, actions: np.ndarray) -> SeatStep:
+        rewards = np.zeros(self.num_envs, dtype=np.float32)
+        dones = np.zeros(self.num_envs, dtype=np.bool_)
+        for i, action in enumerate(actions):
+            is_card = self.games[i].phase == GameStage.GAME
+            action = from_canonical_action(int(action), self.card_perms[i], is_card)
+            self._apply(i, action, rewards, dones)
+        self._advance(rewards, dones)
+        return self._observe(rewards, dones)
+
+    def _apply(self, i: int, action: int, rewards: np.ndarray, dones: np.ndarray):
+        game = self.games[i]
+        trick_completed, deal_over = apply_action(game, action)
+        if trick_completed:
+            rewards[i] += calculate_reward(game, self.seat)
+        if not deal_over:
+            return
+        if len(game.tricks) == 8:
+            dones[i] = True
+            game.new_game()
+        else:
+            self.redeals += 1
+
+    def _advance(self, rewards: np.ndarray, dones: np.ndarray):
+        while True:
+            groups: dict[int, list[int]] = {}
+            for i, game in enumerate(self.games):
+                if game.current_player != self.seat:
+                    policy = self.policies[game.current_player]
+                    groups.setdefault(id(policy), []).append(i)
+            if not groups:
+                return
+            for rows in groups.values():
+                policy = self.policies[self.games[rows[0]].current_player]
+                actions = policy.act([self.games[i] for i in rows])
+                for i, action in zip(rows, actions):
+                    self._apply(i, int(action), rewards, dones)
+
+    def _observe(self, rewards: np.ndarray, dones: np.ndarray) -> SeatStep:
+        observations = []
+        masks = []
+        for i, game in enumerate(self.games):
+            state, self.card_perms[i] = encode_view(
+                game, self.seat, self.relative_seats, self.canonical_suits
+            )
+            observations.append(state)
+            masks.append(
+                permute_mask(
+                    action_mask(game, self.seat),
+                    self.card_perms[i],
+                    game.phase == GameStage.GAME,
+                )
+            )
+        return SeatStep(
+            observations=np.stack(observations),
+            masks=np.stack(masks),
+            rewards=rewards,
+            dones=dones,
+        )
@@ -0,0 +1,204 @@
+import multiprocessing as mp
+import random
+from dataclasses import dataclass
+from multiprocessing.connection import Connection
+
+import numpy as np
+
+from models import GameStage
+from ai.encoding import state_dim
+from ai.symmetry import IDENTITY, encode_view, from_canonical_action, permute_mask
+from ai.utils.rewards import calculate_reward
+from .actions import NUM_ACTIONS, action_mask, apply_action, new_game
+
+
+@dataclass
+class EnvStep:
+    """Batched view of N tables, rows follow the table order."""
+
+    observations: np.ndarray  # (N, state_dim), encoded for the seat to act
+    masks: np.ndarray  # (N, NUM_ACTIONS) legal actions of the seat to act
+    players: np.ndarray  # (N,) seat to act
+    rewards: np.ndarray  # (N, 4) reward of every seat for the last step
+    dones: np.ndarray  # (N,) the deal ended and a new one was dealt
+
+    @classmethod
+    def concatenate(cls, steps: list["EnvStep"]) -> "EnvStep":
+        return cls(
+            observations=np.concatenate([s.observations for s in steps]),
+            masks=np.concatenate([s.masks for s in steps]),
+            players=np.concatenate([s.players for s in steps]),
+            rewards=np.concatenate([s.rewards for s in steps]),
+            dones=np.concatenate([s.dones for s in steps]),
+        )
+
+
+class VectorEnv:
+    """Self-play over `num_envs` tables, one decision per table per step.
+
+    A finished deal is reported through `dones` and the table is dealt again
+    straight away, so the returned observation already belongs to the next
+    deal. Rewards are those of `calculate_reward`, given to every seat when a
+    trick completes. A deal everybody passed ends with no reward, the engine
+    having already dealt the cards again. With `canonical_suits`,
+    observations, masks and card actions use the canonical suit labelling of
+    the seat to act, as `CoincheAgent` sees them.
+    """
+
+    def __init__(
+        self,
+        num_envs: int,
+        relative_seats: bool = False,
+        seed: int | None = None,
+        canonical_suits: bool = False,
+    ):
+        self.num_envs = num_envs
+        self.relative_seats = relative_seats
+        self.canonical_suits = canonical_suits
+        self.observation_dim = state_dim(relative_seats)
+        self.num_actions = NUM_ACTIONS
+        # Labelling of each table's last observation
+        self.card_perms = np.tile(IDENTITY, (num_envs, 1))
+        # Shuffles this env's decks, leaving the random module alone
+        self.rng = random.Random(seed)
+        self.games = [new_game(self.rng) for _ in range(num_envs)]
+        self.deals = 0
+        self.redeals = 0
+
+    def reset(self) -> EnvStep:
+        for game in self.games:
+            game.start_game()
+        return self._observe(
+            np.zeros((self.num_envs, 4), dtype=np.float32),
+            np.zeros(self.num_envs, dtype=np.bool_),
+        )
+
+    def step(self, actions: np.ndarray) -> EnvStep:
+        rewards = np.zeros((self.num_envs, 4), dtype=np.float32)
+        dones = np.zeros(self.num_envs, dtype=np.bool_)
+        for i, (game, action) in enumerate(zip(self.games, actions)):
+            is_card = game.phase == GameStage.GAME
+            action = from_canonical_action(int(action), self.card_perms[i], is_card)
+            trick_completed, dones[i] = apply_action(game, action)
+            if trick_completed:
+                for seat in range(4):
+                    rewards[i, seat] = calculate_reward(game, seat)
+            if not dones[i]:
+                continue
+            if len(game.tricks) == 8:
+                self.deals += 1
+                game.new_game()
+            else:
+                self.redeals += 1
+        return self._observe(rewards, dones)
+
+    def _observe(self, rewards: np.ndarray, dones: np.ndarray) -> EnvStep:
+        players = np.array([game.current_player for game in self.games], dtype=np.int64)
+        observations = []
+        masks = []
+        for i, (game, player_id) in enumerate(zip(self.games, players)):
+            state, self.card_perms[i] = encode_view(
+                game, player_id, self.relative_seats, self.canonical_suits
+            )
+            observations.append(state)
+            masks.append(
+                permute_mask(
+                    action_mask(game, player_id),
+                    self.card_perms[i],
+                    game.phase == GameStage.GAME,
+                )
+            )
+        return EnvStep(
+            observations=np.stack(observations),
+            masks=np.stack(masks),
+            players=players,
+            rewards=rewards,
+            dones=dones,
+        )
+
+    def close(self):
+        pass
+
+
+def _worker(
+    remote: Connection,
+    num_envs: int,
+    relative_seats: bool,
+    seed: int | None,
+    canonical_suits: bool,
+):
+    env = VectorEnv(num_envs, relative_seats, seed, canonical_suits)
+    while True:
+        command, data = remote.recv()
+        if command == "reset":
+            remote.send(env.reset())
+        elif command == "step":
+            remote.send(env.step(data))
+        elif command == "close":
+            remote.close()
+            return
+
+
+class SubprocVectorEnv:
+    """`VectorEnv` sharded over worker processes, same interface and row order."""
+
+    def __init__(
+        self,
+        num_envs: int,
+        num_workers: int | None = None,
+        relative_seats: bool = False,
+        seed: int | None = None,
+        canonical_suits: bool = False,
+    ):
+        num_workers = min(num_workers or mp.cpu_count(), num_envs)
+        self.num_envs = num_envs
+        self.relative_seats = relative_seats
+        self.observation_dim = state_dim(relative_seats)
+        self.num_actions = NUM_ACTIONS
+        shards = np.array_split(np.arange(num_envs), num_workers)
+        self.splits = np.cumsum([len(shard) for shard in shards])[:-1]
+
+        ctx = mp.get_context("spawn")
+        self.remotes: list[Connection] = []
+        self.processes = []
+        for i, shard in enumerate(shards):
+            remote, worker_remote = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker,
+                args=(
+                    worker_remote,
+                    len(shard),
+                    relative_seats,
+                    None if seed is None else seed + i,
+                    canonical_suits,
+                ),
+                daemon=True,
+            )
+            process.start()
+            worker_remote.close()
+            self.remotes.append(remote)
+            self.processes.append(process)
+
+    def reset(self) -> EnvStep:
+        for remote in self.remotes:
+            remote.send(("reset", None))
+        return EnvStep.concatenate([remote.recv() for remote in self.remotes])
+
+    def step(self, actions: np.ndarray) -> EnvStep:
+        for remote, shard in zip(self.remotes, np.split(np.asarray(actions), self.splits)):
+            remote.send(("step", shard))
+        return EnvStep.concatenate([remote.recv() for remote in self.remotes])
+
+    def close(self):
+        for remote in self.remotes:
+            remote.send(("close", None))
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+
+    def __enter__(self) -> "SubprocVectorEnv":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
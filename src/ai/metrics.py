@@ -1,8 +1,12 @@
+from collections import deque
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, Iterable
 import json
+import os
 from pathlib import Path
 import matplotlib.pyplot as plt
+import numpy as np
+from ai.metrics_log import MetricsLog
 
 
 @dataclass
@@ -31,58 +35,218 @@ class EpisodeMetrics:
         return cls(**data)
 
 
+class BucketedSeries:
+    """Min, mean and max of a series over at most `max_buckets` buckets.
+
+    Each bucket covers `width` points, when the buckets run out adjacent
+    pairs are merged and the width doubles, so memory and plotting cost stay
+    bounded however long the series grows.
+    """
+
+    def __init__(self, max_buckets: int = 512):
+        self.max_buckets = max_buckets
+        self.width = 1
+        # Per bucket: point count, sum of x, sum of y, min and max of y
+        self.buckets: list[list[float]] = []
+
+    def add(self, x: float, y: float):
+        if self.buckets and self.buckets[-1][0] < self.width:
+            bucket = self.buckets[-1]
+            bucket[0] += 1
+            bucket[1] += x
+            bucket[2] += y
+            bucket[3] = min(bucket[3], y)
+            bucket[4] = max(bucket[4], y)
+            return
+        self.buckets.append([1, x, y, y, y])
+        if len(self.buckets) > self.max_buckets:
+            self._merge()
+
+    def _merge(self):
+        merged = []
+        for first, second in zip(self.buckets[::2], self.buckets[1::2]):
+            merged.append(
+                [
+                    first[0] + second[0],
+                    first[1] + second[1],
+                    first[2] + second[2],
+                    min(first[3], second[3]),
+                    max(first[4], second[4]),
+                ]
+            )
+        if len(self.buckets) % 2:
+            merged.append(self.buckets[-1])
+        self.buckets = merged
+        self.width *= 2
+
+    def arrays(self) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Mean x, mean y, min y and max y of every bucket."""
+        data = np.array(self.buckets, dtype=np.float64).reshape(-1, 5)
+        count = data[:, 0]
+        return data[:, 1] / count, data[:, 2] / count, data[:, 3], data[:, 4]
+
+    def state_dict(self) -> dict[str, Any]:
+        return {"width": self.width, "buckets": self.buckets}
+
+    def load_state_dict(self, state: dict[str, Any]):
+        self.width = state["width"]
+        self.buckets = state["buckets"]
+
+
+class MetricsSummary:
+    """Bounded bucketed summaries of the plotted metrics, updated as they arrive."""
+
+    def __init__(self, max_buckets: int = 512):
+        self.max_buckets = max_buckets
+        self.total_reward = BucketedSeries(max_buckets)
+        self.win_rate = BucketedSeries(max_buckets)
+        self.player_rewards: dict[int, BucketedSeries] = {}
+
+    def add(self, metrics: EpisodeMetrics):
+        self.total_reward.add(metrics.episode, metrics.total_reward)
+        self.win_rate.add(metrics.episode, metrics.win_rate)
+        for player, reward in metrics.episode_rewards.items():
+            if int(player) not in self.player_rewards:
+                self.player_rewards[int(player)] = BucketedSeries(self.max_buckets)
+            self.player_rewards[int(player)].add(metrics.episode, reward)
+
+    def extend(self, metrics: Iterable[EpisodeMetrics]):
+        for m in metrics:
+            self.add(m)
+
+    def state_dict(self) -> dict[str, Any]:
+        return {
+            "total_reward": self.total_reward.state_dict(),
+            "win_rate": self.win_rate.state_dict(),
+            "player_rewards": {
+                str(player): series.state_dict()
+                for player, series in self.player_rewards.items()
+            },
+        }
+
+    def load_state_dict(self, state: dict[str, Any]):
+        self.total_reward.load_state_dict(state["total_reward"])
+        self.win_rate.load_state_dict(state["win_rate"])
+        self.player_rewards = {}
+        for player, series_state in state["player_rewards"].items():
+            series = BucketedSeries(self.max_buckets)
+            series.load_state_dict(series_state)
+            self.player_rewards[int(player)] = series
+
+
 class MetricsTracker:
-    def __init__(self, save_dir: str = "src/ai/training_metrics"):
+    """Appends episode metrics to `metrics.jsonl`, keeping the last `window`.
+
+    A bucketed summary of the whole run is kept alongside, which plots are
+    rendered from unless every point is asked for. It is saved with the
+    metrics, so resuming only reads the records logged after it.
+    """
+
+    LOG_FILE = "metrics.jsonl"
+    SUMMARY_FILE = "metrics_summary.json"
+
+    def __init__(self, save_dir: str = "src/ai/training_metrics", window: int = 1000):
         self.save_dir = Path(save_dir)
         self.save_dir.mkdir(exist_ok=True)
-        self.metrics: list[EpisodeMetrics] = []
+        self.window = window
+        self.metrics: deque[EpisodeMetrics] = deque(maxlen=window)
+        self.log = MetricsLog(self.save_dir / self.LOG_FILE)
+        self.summary = MetricsSummary()
+
+    @property
+    def position(self) -> int:
+        """Number of records in the log, to truncate back to on resume."""
+        return self.log.count
 
     def add_episode_metrics(self, metrics: EpisodeMetrics):
         self.metrics.append(metrics)
+        self.log.append(metrics.to_dict())
+        self.summary.add(metrics)
 
-    def save_metrics(self, filename: str = "metrics.json"):
-        path = self.save_dir / filename
-        with open(path, "w") as f:
-            json.dump([m.to_dict() for m in self.metrics], f)
+    def save_metrics(self):
+        """Make the appended metrics durable, nothing written before is rewritten."""
+        self.log.flush(fsync=True)
+        path = self.save_dir / self.SUMMARY_FILE
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"count": self.log.count, "summary": self.summary.state_dict()}, f)
+        os.replace(tmp_path, path)
 
-    def load_metrics(self, filename: str = "metrics.json"):
+    def load_metrics(self, last: int | None = None, filename: str = "metrics.json"):
+        """Load the last `last` logged metrics, at most `window` of them."""
         path = self.save_dir / filename
+        if self.log.count == 0 and path.exists():
+            # Move metrics saved before the log existed into it
+            with open(path, "r") as f:
+                for data in json.load(f):
+                    self.log.append(data)
+            self.log.flush(fsync=True)
+        records = self.log.tail(self.window if last is None else min(last, self.window))
+        self.metrics = deque(
+            (EpisodeMetrics.from_dict(m) for m in records), maxlen=self.window
+        )
+        self._summarize_log()
+
+    def _summarize_log(self):
+        """Rebuild the summary from the saved one and the records logged after it."""
+        summary = MetricsSummary(self.summary.max_buckets)
+        start = 0
+        path = self.save_dir / self.SUMMARY_FILE
         if path.exists():
             with open(path, "r") as f:
-                data = json.load(f)
-                self.metrics = [EpisodeMetrics.from_dict(m) for m in data]
-
-    def plot_metrics(self, save_path: str | None = None):
-        episodes = [m.episode for m in self.metrics]
-        rewards = [m.total_reward for m in self.metrics]
-        win_rates = [m.win_rate for m in self.metrics]
-        player_rewards: dict[int, list[float]] = {}
-        for m in self.metrics:
-            for player, reward in m.episode_rewards.items():
-                if player not in player_rewards:
-                    player_rewards[int(player)] = []
-                player_rewards[int(player)].append(reward)
+                saved = json.load(f)
+            if saved["count"] <= self.log.count:
+                summary.load_state_dict(saved["summary"])
+                start = saved["count"]
+        summary.extend(
+            EpisodeMetrics.from_dict(m) for m in self.log.records_after(start)
+        )
+        self.summary = summary
 
-        _, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(10, 12))  # type: ignore
+    def truncate(self, position: int):
+        """Drop the metrics logged after `position`."""
+        dropped = self.log.count - position
+        if dropped <= 0:
+            return
+        self.log.truncate(position)
+        for _ in range(min(dropped, len(self.metrics))):
+            self.metrics.pop()
+        path = self.save_dir / self.SUMMARY_FILE
+        if path.exists():
+            with open(path, "r") as f:
+                if json.load(f)["count"] > position:
+                    # It summarizes records that are gone
+                    path.unlink()
+        self._summarize_log()
+
+    def close(self):
+        self.log.close()
 
-        # Plot player rewards
+    def plot_metrics(self, save_path: str | None = None, full: bool = False):
+        """Plot the bucketed summary, or with `full` every logged episode."""
+        summary = self.summary
+        if full:
+            summary = MetricsSummary(max(self.log.count, 1))
+            summary.extend(EpisodeMetrics.from_dict(m) for m in self.log.records())
+
+        _, (ax1, ax2, ax3) = plt.subplots(3, 1, figsize=(10, 12))  # type: ignore
 
         # Plot rewards
-        ax1.plot(episodes, rewards, label="Total Reward")
+        _plot_series(ax1, summary.total_reward, "Total Reward")
         ax1.set_xlabel("Episode")
         ax1.set_ylabel("Total Reward")
         ax1.set_title("Training Rewards over Time")
         ax1.legend()
 
         # Plot win rate
-        ax2.plot(episodes, win_rates, label="Win Rate", color="green")
+        _plot_series(ax2, summary.win_rate, "Win Rate", color="green")
         ax2.set_xlabel("Episode")
         ax2.set_ylabel("Win Rate")
         ax2.set_title("Win Rate over Time")
         ax2.legend()
 
-        for player, rewards in player_rewards.items():
-            ax3.plot(episodes, rewards, label=f"Player {player} Reward")
+        for player, series in sorted(summary.player_rewards.items()):
+            _plot_series(ax3, series, f"Player {player} Reward")
         ax3.set_xlabel("Episode")
         ax3.set_ylabel("Reward")
         ax3.set_title("Player Rewards over Time")
@@ -92,3 +256,11 @@ class MetricsTracker:
         if save_path:
             plt.savefig(save_path)  # type: ignore
         plt.close()  # type: ignore
+
+
+def _plot_series(ax: Any, series: BucketedSeries, label: str, color: str | None = None):
+    """Bucket means as a line, with the min-max band once buckets hold several points."""
+    x, mean, low, high = series.arrays()
+    (line,) = ax.plot(x, mean, label=label, color=color)
+    if series.width > 1:
+        ax.fill_between(x, low, high, color=line.get_color(), alpha=0.2)
@@ -0,0 +1,188 @@
+"""Append-only JSON Lines log of episode metrics.
+
+Records are dicts with an integer "episode" key, which must not decrease
+from one record to the next. They are buffered and appended, the file is
+fsynced on request or every `fsync_interval` seconds, and nothing already
+written is rewritten. A sidecar index keeps the episode and byte offset of
+every `index_stride`-th record, so the tail or an episode range is read
+without parsing the rest. A last record left partly written by a crash is
+dropped when the log is reopened.
+"""
+
+import bisect
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Iterator
+
+BLOCK_SIZE = 1 << 16
+
+
+class MetricsLog:
+    def __init__(
+        self,
+        path: str | Path,
+        buffer_size: int = 64,
+        fsync_interval: float = 60.0,
+        index_stride: int = 256,
+    ):
+        self.path = Path(path)
+        self.index_path = self.path.with_suffix(self.path.suffix + ".idx")
+        self.buffer_size = buffer_size
+        self.fsync_interval = fsync_interval
+        self.index_stride = index_stride
+        # (record number, episode, byte offset) of every index_stride-th record
+        self.index: list[tuple[int, int, int]] = []
+        self._buffer: list[bytes] = []
+        self._pending_index: list[tuple[int, int, int]] = []
+        self._recover()
+        self._file = open(self.path, "ab")
+        self._index_file = open(self.index_path, "a")
+        self._last_fsync = time.monotonic()
+
+    def _recover(self):
+        """Drop a partly written last record and find where the log ends."""
+        self.path.touch()
+        with open(self.path, "r+b") as f:
+            self.size = f.seek(0, os.SEEK_END)
+            end = self.size
+            while end > 0:
+                f.seek(max(end - BLOCK_SIZE, 0))
+                block = f.read(end - max(end - BLOCK_SIZE, 0))
+                newline = block.rfind(b"\n")
+                if newline >= 0:
+                    end = max(end - BLOCK_SIZE, 0) + newline + 1
+                    break
+                end -= len(block)
+            if end != self.size:
+                f.truncate(end)
+                self.size = end
+
+        if self.index_path.exists():
+            with open(self.index_path, "r") as f:
+                entries = [tuple(map(int, line.split())) for line in f if line.strip()]
+            # Entries can outlive records lost before they reached the disk
+            self.index = [entry for entry in entries if entry[2] < self.size]  # type: ignore
+            if len(self.index) != len(entries):
+                self._rewrite_index()
+
+        record, offset = (self.index[-1][0], self.index[-1][2]) if self.index else (0, 0)
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            self.count = record + sum(1 for _ in f)
+
+    def _rewrite_index(self):
+        tmp_path = self.index_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            f.writelines(f"{r} {e} {o}\n" for r, e, o in self.index)
+        os.replace(tmp_path, self.index_path)
+
+    def append(self, record: dict[str, Any]):
+        line = (json.dumps(record) + "\n").encode()
+        if self.count % self.index_stride == 0:
+            self._pending_index.append((self.count, record["episode"], self.size))
+        self._buffer.append(line)
+        self.size += len(line)
+        self.count += 1
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self, fsync: bool = False):
+        if self._buffer:
+            self._file.write(b"".join(self._buffer))
+            self._buffer.clear()
+            self._file.flush()
+        # Index entries only ever point at records handed to the OS
+        if self._pending_index:
+            self.index.extend(self._pending_index)
+            self._index_file.writelines(
+                f"{r} {e} {o}\n" for r, e, o in self._pending_index
+            )
+            self._pending_index.clear()
+            self._index_file.flush()
+        if fsync or time.monotonic() - self._last_fsync >= self.fsync_interval:
+            os.fsync(self._file.fileno())
+            os.fsync(self._index_file.fileno())
+            self._last_fsync = time.monotonic()
+
+    def close(self):
+        self.flush(fsync=True)
+        self._file.close()
+        self._index_file.close()
+
+    def truncate(self, count: int):
+        """Forget every record after the first `count`, e.g. to match a checkpoint."""
+        self.flush()
+        if count >= self.count:
+            return
+        i = bisect.bisect_right([entry[0] for entry in self.index], count) - 1
+        record, _, offset = self.index[i] if i >= 0 else (0, 0, 0)
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            for _ in range(count - record):
+                offset += len(f.readline())
+        self._file.truncate(offset)
+        self.size = offset
+        self.count = count
+        self.index = [entry for entry in self.index if entry[0] < count]
+        self._rewrite_index()
+        self._index_file.close()
+        self._index_file = open(self.index_path, "a")
+        self.flush(fsync=True)
+
+    def _lines(self, offset: int) -> Iterator[bytes]:
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            yield from f
+
+    def records(
+        self, start_episode: int | None = None, end_episode: int | None = None
+    ) -> Iterator[dict[str, Any]]:
+        """Records of episodes `start_episode` to `end_episode`, both included."""
+        self.flush()
+        offset = 0
+        if start_episode is not None:
+            # Last indexed record strictly before the range
+            episodes = [entry[1] for entry in self.index]
+            i = bisect.bisect_left(episodes, start_episode) - 1
+            offset = self.index[i][2] if i >= 0 else 0
+
+        for line in self._lines(offset):
+            data = json.loads(line)
+            if start_episode is not None and data["episode"] < start_episode:
+                continue
+            if end_episode is not None and data["episode"] > end_episode:
+                break
+            yield data
+
+    def records_after(self, count: int) -> Iterator[dict[str, Any]]:
+        """Records following the first `count`, in order."""
+        self.flush()
+        i = bisect.bisect_right([entry[0] for entry in self.index], count) - 1
+        record, _, offset = self.index[i] if i >= 0 else (0, 0, 0)
+        for line in self._lines(offset):
+            if record >= count:
+                yield json.loads(line)
+            record += 1
+
+    def read(
+        self, start_episode: int | None = None, end_episode: int | None = None
+    ) -> list[dict[str, Any]]:
+        return list(self.records(start_episode, end_episode))
+
+    def tail(self, n: int) -> list[dict[str, Any]]:
+        """The last `n` records, read backwards from the end of the file."""
+        self.flush()
+        if n <= 0:
+            return []
+        with open(self.path, "rb") as f:
+            end = f.seek(0, os.SEEK_END)
+            data = b""
+            while end > 0 and data.count(b"\n") <= n:
+                start = max(end - BLOCK_SIZE, 0)
+                f.seek(start)
+                data = f.read(end - start) + data
+                end = start
+        lines = data.splitlines()[-n:]
+        return [json.loads(line) for line in lines]
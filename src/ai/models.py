@@ -1,3 +1,4 @@
+import numpy as np
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
@@ -5,13 +6,25 @@ from itertools import product
 
 from models import Bid, Card, Suit
 from game import CoincheGame
-from game_rules import GameRules
+from ai.encoding import (
+    STATE_DIM,
+    candidate_bids,
+    card_to_index,
+    state_dim,
+    valid_cards as legal_cards,
+)
+from ai.symmetry import encode_view, from_canonical_bid
+
+
+def autocast(device: str, enabled: bool) -> torch.autocast:
+    """bfloat16 autocast on the device when enabled, weights stay float32."""
+    return torch.autocast(
+        torch.device(device).type, dtype=torch.bfloat16, enabled=enabled
+    )
 
 
 class CoincheStateEncoder(nn.Module):
-    def __init__(
-        self, input_dim: int = 32 * 3
-    ):  # 32 cards * 3 (in hand, played, visible)
+    def __init__(self, input_dim: int = STATE_DIM):
         super().__init__()  # type: ignore
         self.fc1 = nn.Linear(input_dim, 256)
         self.bn1 = nn.BatchNorm1d(256)
@@ -68,79 +81,51 @@ class CardPlayNetwork(nn.Module):
 
 
 class CoincheAgent:
-    def __init__(self, device: str = "cuda" if torch.cuda.is_available() else "cpu"):
+    def __init__(
+        self,
+        device: str = "cuda" if torch.cuda.is_available() else "cpu",
+        relative_seats: bool = False,
+        bf16: bool = False,
+        canonical_suits: bool = False,
+    ):
         self.device = device
-        self.state_encoder = CoincheStateEncoder().to(device)
+        # A shared policy plays every seat, so it needs to know where it sits
+        self.relative_seats = relative_seats
+        # Run inference under bfloat16 autocast
+        self.bf16 = bf16
+        # See positions with trump first and the other suits in canonical order
+        self.canonical_suits = canonical_suits
+        self.state_encoder = CoincheStateEncoder(state_dim(relative_seats)).to(device)
         self.bidding_network = BiddingNetwork().to(device)
         self.card_play_network = CardPlayNetwork().to(device)
 
     def encode_game_state(self, game: CoincheGame, player_id: int) -> torch.Tensor:
-        encoded = torch.zeros(32 * 3, device=self.device)
-
-        # Encode cards in hand
-        player = game.players[player_id]
-        for card in player.hand:
-            idx = self.card_to_index(card)
-            encoded[idx] = 1
-
-        # Encode cards played in current trick
-        for card in game.current_trick:
-            idx = self.card_to_index(card) + 32
-            encoded[idx] = 1
-
-        # Encode cards won
-        for trick in game.tricks:
-            for card in trick:
-                idx = self.card_to_index(card) + 32 * 2
-                encoded[idx] = 1
-
-        return encoded.requires_grad_(True)
+        return self._encode(game, player_id)[0]
+
+    def _encode(
+        self, game: CoincheGame, player_id: int
+    ) -> tuple[torch.Tensor, np.ndarray]:
+        """Encoded state and the card permutation the networks see it through."""
+        state, card_perm = encode_view(
+            game, player_id, self.relative_seats, self.canonical_suits
+        )
+        encoded = torch.from_numpy(state).to(self.device)
+        return encoded.requires_grad_(True), card_perm
 
     def card_to_index(self, card: Card) -> int:
-        suit_offset = {
-            Suit.HEARTS: 0,
-            Suit.DIAMONDS: 8,
-            Suit.CLUBS: 16,
-            Suit.SPADES: 24,
-        }
-        return suit_offset[card.suit] + card.order
+        return card_to_index(card)
 
     def select_bid(self, game: CoincheGame, player_id: int) -> Bid:
         self.state_encoder.eval()
         self.bidding_network.eval()
 
-        with torch.no_grad():
-            encoded_state = self.encode_game_state(game, player_id)
+        with torch.no_grad(), autocast(self.device, self.bf16):
+            encoded_state, card_perm = self._encode(game, player_id)
             state_features = self.state_encoder(encoded_state.unsqueeze(0))
             bid_probs = self.bidding_network(state_features).squeeze(0)
 
             # Get valid bids and their indices
-            valid_bids = list(
-                enumerate(
-                    [
-                        Bid(
-                            player=player_id,
-                            points=points,
-                            suit=suit,
-                            is_coinche=is_coinche,
-                        )
-                        for points, suit, is_coinche in product(
-                            list(range(80, 120, 10)) + list(range(115, 165, 5)),
-                            list(Suit),
-                            [True, False],
-                        )
-                        if GameRules.is_valid_bid(
-                            Bid(
-                                player=player_id,
-                                points=points,
-                                suit=suit,
-                                is_coinche=is_coinche,
-                            ),
-                            game.current_bid,
-                        )
-                    ]
-                )
-            )
+            valid_bids = list(enumerate(candidate_bids(game, player_id)))
 
             # Create a mask for valid bids
             mask = torch.zeros_like(bid_probs, dtype=torch.bool)
@@ -152,8 +137,13 @@ class CoincheAgent:
             masked_probs[~mask] = float("-inf")
             selected_bid_idx = torch.argmax(masked_probs).item()
 
+        # Back from the suits the network saw to the real ones
         return next(
-            (bid for i, bid in valid_bids if i == selected_bid_idx),
+            (
+                from_canonical_bid(bid, card_perm)
+                for i, bid in valid_bids
+                if i == selected_bid_idx
+            ),
             Bid(player=player_id, is_pass=True, points=None, suit=None),
         )
 
@@ -161,33 +151,20 @@ class CoincheAgent:
         self.state_encoder.eval()
         self.card_play_network.eval()
 
-        with torch.no_grad():
-            encoded_state = self.encode_game_state(game, player_id)
+        with torch.no_grad(), autocast(self.device, self.bf16):
+            encoded_state, card_perm = self._encode(game, player_id)
             state_features = self.state_encoder(encoded_state.unsqueeze(0))
             card_probs = self.card_play_network(state_features).squeeze(0)
 
             # Get valid cards that can be played
-            player = game.players[player_id]
-            valid_cards = [
-                card
-                for card in player.hand
-                if game.current_bid
-                and game.current_bid.suit
-                and GameRules.is_play_valid(
-                    card,
-                    player,
-                    game.current_trick,
-                    game.current_bid.suit,
-                    game.players,
-                )
-            ]
+            valid_cards = legal_cards(game, player_id)
             if not valid_cards:
                 raise ValueError("No valid cards to play")
 
             # Create a mask for valid cards
             mask = torch.zeros_like(card_probs, dtype=torch.bool)
             for card in valid_cards:
-                mask[self.card_to_index(card)] = True
+                mask[card_perm[self.card_to_index(card)]] = True
 
             # Apply mask and select highest probability valid card
             masked_probs = card_probs.clone()
@@ -196,7 +173,7 @@ class CoincheAgent:
 
             # Find the corresponding card
             for card in valid_cards:
-                if self.card_to_index(card) == selected_card_idx:
+                if card_perm[self.card_to_index(card)] == selected_card_idx:
                     return card
 
             # Fallback to first valid card if something goes wrong
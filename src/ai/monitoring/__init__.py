@@ -1,5 +1,15 @@
 from .monitor import NetworkMonitor
 from .parameter_stats import ParameterStats, LayerStats
+from .reductions import ShadowParameters, layer_statistics
+from .stats_store import StatsStore
 from .visualization import ParameterVisualizer
 
-__all__ = ["NetworkMonitor", "ParameterStats", "LayerStats", "ParameterVisualizer"]
+__all__ = [
+    "NetworkMonitor",
+    "ParameterStats",
+    "LayerStats",
+    "ParameterVisualizer",
+    "ShadowParameters",
+    "StatsStore",
+    "layer_statistics",
+]
@@ -1,63 +1,147 @@
 from typing import Dict, Any
 import torch
-import json
+import threading
+from collections import deque
+from dataclasses import dataclass
 from pathlib import Path
-from datetime import datetime
 
-from .parameter_stats import ParameterStats
+import numpy as np
+
+from .parameter_stats import LayerStats, ParameterStats
 from .visualization import ParameterVisualizer
 
 
+@dataclass
+class Snapshot:
+    """A monitoring step as measured on the learner, a few hundred bytes."""
+
+    step: int
+    names: list[str]
+    rows: np.ndarray
+    has_rate: bool
+
+
 class NetworkMonitor:
+    """Measures the network on the learner and does the rest in the background.
+
+    `update` only reduces the parameters to one small array of stats. The
+    worker thread records it into `stats.sqlite`, appends the periodic
+    convergence metrics and anomalies there, and renders plots of the last
+    `plot_window` steps from it. Snapshots wait in a queue of `queue_size`,
+    and when the worker falls behind the oldest are dropped and counted in
+    `dropped`, so monitoring never blocks the learner.
+    """
+
     def __init__(
         self,
         save_dir: str = "src/ai/monitoring",
         visualization_interval: int = 1000,
         stats_interval: int = 100,
+        background: bool = True,
+        queue_size: int = 64,
+        plot_window: int | None = 10_000,
     ):
         self.save_dir = Path(save_dir)
         self.save_dir.mkdir(parents=True, exist_ok=True)
         self.stats = ParameterStats(str(self.save_dir / "stats"))
-        self.visualizer = ParameterVisualizer(str(self.save_dir / "plots"))
+        self.store = self.stats.store
+        self.visualizer = ParameterVisualizer(self.store, str(self.save_dir / "plots"))
         self.visualization_interval = visualization_interval
         self.stats_interval = stats_interval
-        self.step = 0
+        self.plot_window = plot_window
+        # Steps continue after those of a previous run in the same store
+        self.step = self.store.last_step() or 0
+        self.dropped = 0
+        self._snapshots: deque[Snapshot] = deque()
+        self._queue_size = queue_size
+        self._condition = threading.Condition()
+        self._busy = False
+        self._closed = False
+        self._error: BaseException | None = None
+        self._worker: threading.Thread | None = None
+        if background:
+            self._worker = threading.Thread(target=self._work_loop, daemon=True)
+            self._worker.start()
 
     def update(self, model: torch.nn.Module) -> Dict[str, Any]:
-        """Update monitoring statistics and generate visualizations."""
+        """Measure the model and hand the statistics to the worker."""
+        self._raise_error()
         self.step += 1
-        current_stats = self.stats.update_stats(model)
+        snapshot = Snapshot(self.step, *self.stats.measure(model))
+        if self._worker is None:
+            self._process(snapshot)
+        else:
+            with self._condition:
+                if len(self._snapshots) >= self._queue_size:
+                    self._snapshots.popleft()
+                    self.dropped += 1
+                self._snapshots.append(snapshot)
+                self._condition.notify()
+        return {
+            name: LayerStats.from_array(row)
+            for name, row in zip(snapshot.names, snapshot.rows)
+        }
+
+    def wait(self):
+        """Block until the worker has processed every queued snapshot."""
+        with self._condition:
+            self._condition.wait_for(lambda: not self._snapshots and not self._busy)
+        self._raise_error()
+
+    def close(self):
+        """Process the queued snapshots and write the stats history not yet on disk."""
+        if self._worker is not None:
+            with self._condition:
+                self._closed = True
+                self._condition.notify_all()
+            self._worker.join()
+            self._worker = None
+        self.stats.flush()
+        self.store.close()
+        self._raise_error()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("Monitoring worker failed") from error
+
+    def _work_loop(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._snapshots or self._closed)
+                if not self._snapshots:
+                    return
+                snapshot = self._snapshots.popleft()
+                self._busy = True
+            try:
+                self._process(snapshot)
+            except BaseException as error:
+                self._error = error
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
+
+    def _process(self, snapshot: Snapshot):
+        step = snapshot.step
+        self.stats.add_step(
+            snapshot.names, snapshot.rows, snapshot.has_rate, step=step
+        )
 
         # Generate periodic statistics
-        if self.step % self.stats_interval == 0:
-            convergence_metrics = self.stats.get_convergence_metrics()
-            anomalies = self.stats.detect_anomalies()
-
-            stats_data: dict[str, Any] = {
-                "step": self.step,
-                "timestamp": datetime.now().isoformat(),
-                "convergence_metrics": convergence_metrics,
-                "anomalies": anomalies,
-            }
-
-            # Save statistics to file
-            stats_file = self.save_dir / "stats" / f"stats_{self.step}.json"
-            with open(stats_file, "w") as f:
-                json.dump(stats_data, f, indent=2)
+        if step % self.stats_interval == 0:
+            self.store.append_convergence(step, self.stats.layer_convergence())
+            self.store.append_anomalies(step, self.stats.detect_anomalies())
 
         # Generate periodic visualizations
-        if self.step % self.visualization_interval == 0:
+        if step % self.visualization_interval == 0:
+            self.stats.flush()
+            start_step = step - self.plot_window + 1 if self.plot_window else None
             self.visualizer.plot_parameter_distributions(
-                self.stats.history, f"param_dist_{self.step}.png"
-            )
-            self.visualizer.plot_gradient_flow(
-                self.stats.history, f"grad_flow_{self.step}.png"
-            )
-            self.visualizer.plot_update_rates(
-                self.stats.history, f"update_rates_{self.step}.png"
+                f"param_dist_{step}.png", start_step
             )
+            self.visualizer.plot_gradient_flow(f"grad_flow_{step}.png", start_step)
+            self.visualizer.plot_update_rates(f"update_rates_{step}.png", start_step)
             self.visualizer.plot_convergence_heatmap(
-                self.stats.history, save_path=f"convergence_{self.step}.png"
+                save_path=f"convergence_{step}.png", end_step=step
             )
-
-        return current_stats
@@ -1,9 +1,13 @@
 import torch
 import numpy as np
-from typing import Dict, List, Any
-from dataclasses import dataclass
-from collections import defaultdict
+from typing import Dict, Iterator, List, Any, overload
+from dataclasses import astuple, dataclass
+from collections import defaultdict, deque
 from pathlib import Path
+import math
+
+from .reductions import SegmentBuffer, ShadowParameters, layer_statistics
+from .stats_store import StatsStore
 
 
 @dataclass
@@ -16,13 +20,132 @@ class LayerStats:
     grad_std: float | None
     update_rate: float
 
+    def to_array(self) -> np.ndarray:
+        """Fields in declaration order, NaN for missing gradients."""
+        return np.array(
+            [np.nan if value is None else value for value in astuple(self)],
+            dtype=np.float64,
+        )
+
+    @classmethod
+    def from_array(cls, row: np.ndarray) -> "LayerStats":
+        values = [None if math.isnan(value) else float(value) for value in row]
+        return cls(*values)  # type: ignore
+
+
+NUM_FIELDS = len(LayerStats.__dataclass_fields__)
+# Columns of the stat rows
+GRAD_MEAN = 4
+UPDATE_RATE = 6
+
+
+class LayerHistory:
+    """Ring buffer of a layer's latest stats, read oldest first."""
+
+    def __init__(self, capacity: int):
+        self.rows = np.full((capacity, NUM_FIELDS), np.nan)
+        self.steps = np.zeros(capacity, dtype=np.int64)
+        self.total = 0
+
+    def append(self, step: int, stats: LayerStats):
+        i = self.total % len(self.rows)
+        self.rows[i] = stats.to_array()
+        self.steps[i] = step
+        self.total += 1
+
+    def __len__(self) -> int:
+        return min(self.total, len(self.rows))
+
+    def _order(self) -> np.ndarray:
+        start = self.total - len(self)
+        return np.arange(start, self.total) % len(self.rows)
+
+    def array(self) -> tuple[np.ndarray, np.ndarray]:
+        """Steps and stat rows, oldest first."""
+        order = self._order()
+        return self.steps[order], self.rows[order]
+
+    @overload
+    def __getitem__(self, index: int) -> LayerStats: ...
+    @overload
+    def __getitem__(self, index: slice) -> List[LayerStats]: ...
+    def __getitem__(self, index: int | slice) -> LayerStats | List[LayerStats]:
+        rows = self.rows[self._order()[index]]
+        if isinstance(index, slice):
+            return [LayerStats.from_array(row) for row in rows]
+        return LayerStats.from_array(rows)
+
+    def __iter__(self) -> Iterator[LayerStats]:
+        return iter(self[:])
+
+
+class RunningStats:
+    """Welford's streaming mean and variance."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.m2 / self.count) if self.count else 0.0
+
 
 class ParameterStats:
-    def __init__(self, save_dir: str = "src/ai/monitoring/stats"):
-        self.history: Dict[str, List[LayerStats]] = defaultdict(list)
+    """Per-layer parameter statistics in bounded memory.
+
+    The latest `capacity` steps of each layer are kept in ring buffers, and
+    every step is appended to a `StatsStore`, `chunk_size` steps at a time.
+    Update rates are checked against running means and stds as they arrive,
+    anomalies wait in bounded queues until `detect_anomalies` collects them.
+
+    With `fused`, a model's stats are reduced on its device and copied back
+    in one transfer, measuring update rates against the previous step's
+    parameters, kept in the buffer their statistics are reduced in.
+    """
+
+    def __init__(
+        self,
+        save_dir: str = "src/ai/monitoring/stats",
+        capacity: int = 1000,
+        chunk_size: int = 100,
+        threshold: float = 3.0,
+        max_anomalies: int = 100,
+        warmup: int = 10,
+        fused: bool = True,
+        store: StatsStore | None = None,
+    ):
+        self.capacity = capacity
+        self.chunk_size = chunk_size
+        self.threshold = threshold
+        # Update rates seen before checking them, the first stds are noisy
+        self.warmup = warmup
+        self.history: Dict[str, LayerHistory] = defaultdict(
+            lambda: LayerHistory(capacity)
+        )
+        self.fused = fused
+        self.shadow = ShadowParameters()
+        self.grad_buffer = SegmentBuffer()
         self.prev_params: Dict[str, torch.Tensor] = {}
+        self.update_rates: Dict[str, RunningStats] = defaultdict(RunningStats)
+        self.grad_means: Dict[str, RunningStats] = defaultdict(RunningStats)
+        self.anomalies: Dict[str, deque[dict[str, Any]]] = defaultdict(
+            lambda: deque(maxlen=max_anomalies)
+        )
+        self.step = 0
+        # Rows not yet written to the store
+        self._chunk: list[tuple[int, str, np.ndarray]] = []
+        self._chunk_rows = 0
         self.save_dir = Path(save_dir)
         self.save_dir.mkdir(parents=True, exist_ok=True)
+        self.store = store or StatsStore(self.save_dir / "stats.sqlite")
 
     def compute_layer_stats(
         self, name: str, param: torch.Tensor, update_window: int = 10
@@ -59,71 +182,125 @@ class ParameterStats:
             )
 
     def update_stats(self, model: torch.nn.Module) -> Dict[str, LayerStats]:
+        return self.add_step(*self.measure(model))
+
+    def measure(self, model: torch.nn.Module) -> tuple[list[str], np.ndarray, bool]:
+        """Layer names, their stat rows and whether update rates were measured."""
+        named = [(n, p) for n, p in model.named_parameters() if p.requires_grad]
+        names = [name for name, _ in named]
+        if not named:
+            return names, np.zeros((0, NUM_FIELDS)), False
+        if self.fused:
+            params = [p for _, p in named]
+            has_rate = self.shadow.matches(params)
+            return names, layer_statistics(params, self.shadow, self.grad_buffer), has_rate
+        # The first step has no previous parameters to compare with
+        has_rate = all(name in self.prev_params for name in names)
+        rows = [self.compute_layer_stats(name, p).to_array() for name, p in named]
+        return names, np.stack(rows), has_rate
+
+    def add_step(
+        self,
+        names: list[str],
+        rows: np.ndarray,
+        has_rate: bool,
+        step: int | None = None,
+    ) -> Dict[str, LayerStats]:
+        """Record a step measured by `measure`, possibly in another thread."""
+        self.step = step if step is not None else self.step + 1
         current_stats: dict[str, LayerStats] = {}
-        for name, param in model.named_parameters():
-            if param.requires_grad:
-                stats = self.compute_layer_stats(name, param)
-                self.history[name].append(stats)
-                current_stats[name] = stats
+        for name, row in zip(names, rows):
+            stats = LayerStats.from_array(row)
+            self.record(name, stats, has_rate)
+            current_stats[name] = stats
+        self._chunk_rows += 1
+        if self._chunk_rows >= self.chunk_size:
+            self.flush()
         return current_stats
 
-    def get_convergence_metrics(self, window_size: int = 100) -> Dict[str, float]:
-        metrics: dict[str, float] = {}
+    def record(self, name: str, stats: LayerStats, has_rate: bool = True):
+        """Add a layer's stats for the current step, O(1) in the run length."""
+        self.history[name].append(self.step, stats)
+        self._chunk.append((self.step, name, stats.to_array()))
+
+        if has_rate:
+            rates = self.update_rates[name]
+            if (
+                rates.count >= self.warmup
+                and abs(stats.update_rate - rates.mean) > self.threshold * rates.std
+            ):
+                self.anomalies[name].append(
+                    {
+                        "type": "unusual_update",
+                        "step": self.step,
+                        "value": stats.update_rate,
+                        "mean": rates.mean,
+                        "std": rates.std,
+                    }
+                )
+            rates.add(stats.update_rate)
+        if stats.grad_mean is not None:
+            self.grad_means[name].add(stats.grad_mean)
+
+    def flush(self):
+        """Append the rows gathered since the last chunk to the store."""
+        if self._chunk:
+            self.store.append_stats(self._chunk)
+        self._chunk = []
+        self._chunk_rows = 0
+
+    def load_history(self, name: str) -> tuple[np.ndarray, np.ndarray]:
+        """Every step and stat row of a layer written to the store so far."""
+        return self.store.query(name)
+
+    def layer_convergence(
+        self, window_size: int = 100
+    ) -> Dict[str, tuple[float, float | None]]:
+        """Update rate std and mean gradient of each layer's last `window_size` steps."""
+        convergence: dict[str, tuple[float, float | None]] = {}
         for name, history in self.history.items():
             if len(history) < window_size:
                 continue
+            _, rows = history.array()
+            recent = rows[-window_size:]
+            recent_grads = recent[:, GRAD_MEAN][~np.isnan(recent[:, GRAD_MEAN])]
+            convergence[name] = (
+                float(np.std(recent[:, UPDATE_RATE])),
+                float(np.mean(recent_grads)) if len(recent_grads) else None,
+            )
+        return convergence
 
+    def get_convergence_metrics(self, window_size: int = 100) -> Dict[str, float]:
+        metrics: dict[str, float] = {}
+        for name, (stability, grad_trend) in self.layer_convergence(window_size).items():
             # Calculate parameter stability
-            recent_updates = [h.update_rate for h in history[-window_size:]]
-            metrics[f"{name}_stability"] = float(np.std(recent_updates))
+            metrics[f"{name}_stability"] = stability
 
             # Calculate gradient trend
-            recent_grads = [
-                h.grad_mean for h in history[-window_size:] if h.grad_mean is not None
-            ]
-            if recent_grads:
-                metrics[f"{name}_grad_trend"] = float(np.mean(recent_grads))
+            if grad_trend is not None:
+                metrics[f"{name}_grad_trend"] = grad_trend
 
         return metrics
 
-    def detect_anomalies(
-        self, threshold: float = 3.0
-    ) -> dict[str, list[dict[str, Any]]]:
+    def detect_anomalies(self) -> dict[str, list[dict[str, Any]]]:
+        """Unusual updates found since the last call, and current gradient health."""
         anomalies: dict[str, list[dict[str, Any]]] = defaultdict(list)
-        for name, history in self.history.items():
-            if len(history) < 2:
-                continue
+        for name, found in self.anomalies.items():
+            if found:
+                anomalies[name].extend(found)
+                found.clear()
 
-            # Check for unusual parameter changes
-            update_rates = [h.update_rate for h in history]
-            mean_rate = np.mean(update_rates)
-            std_rate = np.std(update_rates)
-
-            for i, rate in enumerate(update_rates):
-                if abs(rate - mean_rate) > threshold * std_rate:
-                    anomalies[name].append(
-                        {
-                            "type": "unusual_update",
-                            "step": i,
-                            "value": rate,
-                            "mean": mean_rate,
-                            "std": std_rate,
-                        }
-                    )
-
-            # Check for vanishing/exploding gradients
-            grads = [h.grad_mean for h in history if h.grad_mean is not None]
-            if grads:
-                grad_mean = np.mean(grads)
-                # grad_std = np.std(grads)
-
-                if abs(grad_mean) < 1e-7:
-                    anomalies[name].append(
-                        {"type": "vanishing_gradient", "mean": grad_mean}
-                    )
-                elif abs(grad_mean) > 1e3:
-                    anomalies[name].append(
-                        {"type": "exploding_gradient", "mean": grad_mean}
-                    )
+        # Check for vanishing/exploding gradients
+        for name, grads in self.grad_means.items():
+            if not grads.count:
+                continue
+            if abs(grads.mean) < 1e-7:
+                anomalies[name].append(
+                    {"type": "vanishing_gradient", "mean": grads.mean}
+                )
+            elif abs(grads.mean) > 1e3:
+                anomalies[name].append(
+                    {"type": "exploding_gradient", "mean": grads.mean}
+                )
 
         return dict(anomalies)
@@ -0,0 +1,121 @@
+"""Layer statistics reduced on the parameters' device.
+
+Every parameter (and every gradient) is copied into one preallocated vector,
+and the mean, std, min and max of all layers come out of a handful of
+segmented reductions over it instead of a few kernels per layer. Norms use
+the fused `foreach` kernels. Everything stays on the device and is stacked
+into one small tensor, so a monitoring step costs a single transfer and
+synchronisation instead of a host copy of every parameter and gradient plus
+one `.item()` per statistic.
+"""
+
+import math
+
+import numpy as np
+import torch
+
+
+class SegmentBuffer:
+    """Preallocated float32 vector holding a list of tensors end to end.
+
+    The vector and the segment of each of its elements are only rebuilt when
+    the tensors' shapes change, every step copies the tensors into it in
+    place with one fused copy.
+    """
+
+    def __init__(self):
+        self.shapes: list[torch.Size] = []
+        self.flat = torch.empty(0)
+        self.views: list[torch.Tensor] = []
+        self.segments = torch.empty(0, dtype=torch.int64)
+        self.counts = torch.empty(0)
+
+    def matches(self, tensors: list[torch.Tensor]) -> bool:
+        return (
+            [t.shape for t in tensors] == self.shapes
+            and self.flat.device == tensors[0].device
+        )
+
+    def load(self, tensors: list[torch.Tensor]) -> torch.Tensor:
+        if not self.matches(tensors):
+            device = tensors[0].device
+            sizes = [t.numel() for t in tensors]
+            self.shapes = [t.shape for t in tensors]
+            self.flat = torch.empty(sum(sizes), device=device)
+            self.views = [
+                view.view(shape)
+                for view, shape in zip(self.flat.split(sizes), self.shapes)
+            ]
+            self.segments = torch.repeat_interleave(
+                torch.arange(len(tensors), device=device),
+                torch.tensor(sizes, device=device),
+            )
+            self.counts = torch.tensor(sizes, device=device, dtype=torch.float32)
+        torch._foreach_copy_(self.views, [t.detach() for t in tensors])
+        return self.flat
+
+
+class ShadowParameters(SegmentBuffer):
+    """Previous values of the parameters, in the buffer they are reduced in.
+
+    Update rates compare the parameters with it before they are loaded into
+    it, so the float32 copy the segmented reductions need anyway is the only
+    copy of the parameters kept between steps.
+    """
+
+
+def segment_statistics(
+    tensors: list[torch.Tensor], buffer: SegmentBuffer | None = None
+) -> torch.Tensor:
+    """Mean, std, min and max of each tensor as (len(tensors), 4) rows.
+
+    The tensors are copied into `buffer`, or a new one, and reduced per
+    segment in a fixed number of kernels.
+    """
+    buffer = buffer or SegmentBuffer()
+    flat = buffer.load(tensors)
+    segments, counts = buffer.segments, buffer.counts
+
+    zeros = torch.zeros(len(tensors), device=flat.device)
+    mean = zeros.index_add(0, segments, flat) / counts
+    centered = flat - mean[segments]
+    std = torch.sqrt(zeros.index_add(0, segments, centered * centered) / counts)
+    low = zeros.scatter_reduce(0, segments, flat, "amin", include_self=False)
+    high = zeros.scatter_reduce(0, segments, flat, "amax", include_self=False)
+    return torch.stack([mean, std, low, high], dim=1)
+
+
+def layer_statistics(
+    params: list[torch.Tensor],
+    shadow: ShadowParameters | None = None,
+    grad_buffer: SegmentBuffer | None = None,
+) -> np.ndarray:
+    """Rows of `LayerStats` fields for each parameter, NaN for missing gradients.
+
+    Update rates are measured against `shadow`, which is then refreshed, and
+    are 0 when it does not hold the same parameters yet. Gradients are
+    reduced in `grad_buffer`, which callers keep across steps like `shadow`.
+    """
+    with torch.no_grad():
+        device = params[0].device
+        values = [p.detach() for p in params]
+        rates = torch.zeros(len(params), device=device)
+        if shadow is not None and shadow.matches(values):
+            diffs = torch.stack(
+                torch._foreach_norm(torch._foreach_sub(values, shadow.views))
+            )
+            norms = torch.stack(torch._foreach_norm(shadow.views))
+            rates = torch.where(norms > 0, diffs.float() / norms, rates)
+
+        # Refreshes the shadow with the current parameters
+        stats = segment_statistics(values, shadow)
+        grads = torch.full((len(params), 2), math.nan, device=device)
+        with_grad = [i for i, p in enumerate(params) if p.grad is not None]
+        if with_grad:
+            grad_stats = segment_statistics(
+                [params[i].grad for i in with_grad], grad_buffer  # type: ignore
+            )
+            grads[with_grad] = grad_stats[:, :2]
+
+        # The only transfer of the step
+        return torch.cat([stats, grads, rates[:, None]], dim=1).cpu().double().numpy()
@@ -0,0 +1,188 @@
+"""SQLite time series of the monitoring statistics.
+
+One database holds every layer's stats per step, the periodic convergence
+metrics and the anomalies, in tables clustered on (layer, step), so a layer's
+trend over a range of steps is one indexed read. Rows are only ever
+appended, each batch in one transaction, with write-ahead logging so readers
+do not block the writer.
+"""
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Iterable
+
+import numpy as np
+
+STAT_COLUMNS = ("mean", "std", "min", "max", "grad_mean", "grad_std", "update_rate")
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS layers (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS layer_stats (
+    layer INTEGER NOT NULL,
+    step INTEGER NOT NULL,
+    {", ".join(f"{column} REAL" for column in STAT_COLUMNS)},
+    PRIMARY KEY (layer, step)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS layer_stats_step ON layer_stats (step);
+CREATE TABLE IF NOT EXISTS convergence (
+    layer INTEGER NOT NULL,
+    step INTEGER NOT NULL,
+    stability REAL,
+    grad_trend REAL,
+    PRIMARY KEY (layer, step)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS anomalies (
+    layer INTEGER NOT NULL,
+    step INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    value REAL,
+    mean REAL,
+    std REAL
+);
+CREATE INDEX IF NOT EXISTS anomalies_layer_step ON anomalies (layer, step);
+CREATE INDEX IF NOT EXISTS anomalies_step ON anomalies (step);
+"""
+
+
+class StatsStore:
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Written from the monitoring worker, read from anywhere
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+        self._layer_ids: dict[str, int] = dict(
+            self._connection.execute("SELECT name, id FROM layers")
+        )
+
+    def _layer_id(self, name: str) -> int:
+        if name not in self._layer_ids:
+            cursor = self._connection.execute(
+                "INSERT INTO layers (name) VALUES (?)", (name,)
+            )
+            self._layer_ids[name] = cursor.lastrowid  # type: ignore
+        return self._layer_ids[name]
+
+    def append_stats(self, rows: Iterable[tuple[int, str, np.ndarray]]):
+        """Append (step, layer, stat row) records, NaN stats are stored as NULL."""
+        with self._lock, self._connection:
+            self._connection.executemany(
+                f"INSERT OR REPLACE INTO layer_stats VALUES "
+                f"(?, ?, {', '.join('?' * len(STAT_COLUMNS))})",
+                (
+                    (
+                        self._layer_id(name),
+                        step,
+                        *(None if np.isnan(value) else float(value) for value in row),
+                    )
+                    for step, name, row in rows
+                ),
+            )
+
+    def append_convergence(
+        self, step: int, metrics: dict[str, tuple[float, float | None]]
+    ):
+        """Append each layer's (stability, gradient trend) at `step`."""
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO convergence VALUES (?, ?, ?, ?)",
+                (
+                    (self._layer_id(name), step, stability, grad_trend)
+                    for name, (stability, grad_trend) in metrics.items()
+                ),
+            )
+
+    def append_anomalies(self, step: int, anomalies: dict[str, list[dict[str, Any]]]):
+        """Append anomalies found at `step`, or at the step they name."""
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT INTO anomalies VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        self._layer_id(name),
+                        anomaly.get("step", step),
+                        anomaly["type"],
+                        anomaly.get("value", anomaly.get("mean")),
+                        anomaly.get("mean"),
+                        anomaly.get("std"),
+                    )
+                    for name, found in anomalies.items()
+                    for anomaly in found
+                ),
+            )
+
+    def layers(self) -> list[str]:
+        with self._lock:
+            return [
+                name
+                for (name,) in self._connection.execute(
+                    "SELECT name FROM layers ORDER BY id"
+                )
+            ]
+
+    def last_step(self) -> int | None:
+        with self._lock:
+            return self._connection.execute(
+                "SELECT MAX(step) FROM layer_stats"
+            ).fetchone()[0]
+
+    def _range(self, start_step: int | None, end_step: int | None) -> tuple[int, int]:
+        return (
+            start_step if start_step is not None else -(2**63),
+            end_step if end_step is not None else 2**63 - 1,
+        )
+
+    def query(
+        self, layer: str, start_step: int | None = None, end_step: int | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Steps and stat rows of a layer between two steps, both included."""
+        with self._lock:
+            records = self._connection.execute(
+                f"SELECT step, {', '.join(STAT_COLUMNS)} FROM layer_stats "
+                "WHERE layer = (SELECT id FROM layers WHERE name = ?) "
+                "AND step BETWEEN ? AND ? ORDER BY step",
+                (layer, *self._range(start_step, end_step)),
+            ).fetchall()
+        data = np.array(records, dtype=np.float64).reshape(-1, 1 + len(STAT_COLUMNS))
+        return data[:, 0].astype(np.int64), data[:, 1:]
+
+    def convergence(
+        self, layer: str, start_step: int | None = None, end_step: int | None = None
+    ) -> list[tuple[int, float, float | None]]:
+        with self._lock:
+            return self._connection.execute(
+                "SELECT step, stability, grad_trend FROM convergence "
+                "WHERE layer = (SELECT id FROM layers WHERE name = ?) "
+                "AND step BETWEEN ? AND ? ORDER BY step",
+                (layer, *self._range(start_step, end_step)),
+            ).fetchall()
+
+    def anomalies(
+        self,
+        layer: str | None = None,
+        start_step: int | None = None,
+        end_step: int | None = None,
+    ) -> list[dict[str, Any]]:
+        condition = "step BETWEEN ? AND ?"
+        params: tuple[Any, ...] = self._range(start_step, end_step)
+        if layer is not None:
+            condition += " AND layer = (SELECT id FROM layers WHERE name = ?)"
+            params += (layer,)
+        with self._lock:
+            cursor = self._connection.execute(
+                "SELECT layers.name, step, type, value, mean, std FROM anomalies "
+                f"JOIN layers ON layers.id = anomalies.layer WHERE {condition} "
+                "ORDER BY step",
+                params,
+            )
+            columns = [column[0] for column in cursor.description]
+            columns[0] = "layer"
+            return [dict(zip(columns, record)) for record in cursor]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
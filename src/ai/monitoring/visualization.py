@@ -1,75 +1,90 @@
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import numpy as np
-from typing import Dict, List
+from typing import Dict
 import seaborn as sns
 from pathlib import Path
 
-from .parameter_stats import LayerStats
+from .stats_store import STAT_COLUMNS, StatsStore
+
+MEAN, STD, GRAD_MEAN, GRAD_STD, UPDATE_RATE = (
+    STAT_COLUMNS.index(column)
+    for column in ("mean", "std", "grad_mean", "grad_std", "update_rate")
+)
 
 
 class ParameterVisualizer:
-    def __init__(self, save_dir: str = "src/ai/monitoring/plots"):
+    """Renders monitoring plots to files from a `StatsStore`.
+
+    Each plot reads the steps from `start_step` to `end_step` with a range
+    query. Figures are built without pyplot and drawn by the Agg canvas, so
+    plots can be rendered off the main thread.
+    """
+
+    def __init__(self, store: StatsStore, save_dir: str = "src/ai/monitoring/plots"):
+        self.store = store
         self.save_dir = Path(save_dir)
         self.save_dir.mkdir(parents=True, exist_ok=True)
 
+    def _series(
+        self, start_step: int | None, end_step: int | None
+    ) -> Dict[str, tuple[np.ndarray, np.ndarray]]:
+        """Steps and stat rows of every layer with stats in the range."""
+        series = {
+            name: self.store.query(name, start_step, end_step)
+            for name in self.store.layers()
+        }
+        return {name: data for name, data in series.items() if len(data[0])}
+
     def plot_parameter_distributions(
-        self, history: Dict[str, List[LayerStats]], save_path: str | None = None
+        self,
+        save_path: str | None = None,
+        start_step: int | None = None,
+        end_step: int | None = None,
     ):
         """Plot parameter value distributions over time for each layer."""
+        history = self._series(start_step, end_step)
         num_layers = len(history)
-        _, axes = plt.subplots(num_layers, 1, figsize=(10, 4 * num_layers))  # type: ignore
-        if num_layers == 1:
-            axes = [axes]
+        if not num_layers:
+            return
+        figure = Figure(figsize=(10, 4 * num_layers))
+        axes = figure.subplots(num_layers, 1, squeeze=False)[:, 0]
 
-        for (name, layer_history), ax in zip(history.items(), axes):
-            means = [stats.mean for stats in layer_history]
-            stds = [stats.std for stats in layer_history]
-            steps = range(len(layer_history))
+        for (name, (steps, rows)), ax in zip(history.items(), axes):
+            means, stds = rows[:, MEAN], rows[:, STD]
 
             ax.plot(steps, means, label="Mean")
-            ax.fill_between(
-                steps,
-                [m - s for m, s in zip(means, stds)],
-                [m + s for m, s in zip(means, stds)],
-                alpha=0.3,
-            )
+            ax.fill_between(steps, means - stds, means + stds, alpha=0.3)
             ax.set_title(f"Parameter Distribution - {name}")
             ax.set_xlabel("Training Step")
             ax.set_ylabel("Value")
             ax.legend()
 
-        plt.tight_layout()
-        if save_path:
-            plt.savefig(self.save_dir / save_path)  # type: ignore
-        plt.close()
+        self._save(figure, save_path)
 
     def plot_gradient_flow(
-        self, history: Dict[str, List[LayerStats]], save_path: str | None = None
+        self,
+        save_path: str | None = None,
+        start_step: int | None = None,
+        end_step: int | None = None,
     ):
         """Plot gradient magnitudes over time for each layer."""
+        history = self._series(start_step, end_step)
         num_layers = len(history)
-        _, axes = plt.subplots(num_layers, 1, figsize=(10, 4 * num_layers))  # type: ignore
-        if num_layers == 1:
-            axes = [axes]
-
-        for (name, layer_history), ax in zip(history.items(), axes):
-            grad_means = [
-                stats.grad_mean
-                for stats in layer_history
-                if stats.grad_mean is not None
-            ]
-            grad_stds = [
-                stats.grad_std for stats in layer_history if stats.grad_std is not None
-            ]
-            steps = range(len(grad_means))
+        if not num_layers:
+            return
+        figure = Figure(figsize=(10, 4 * num_layers))
+        axes = figure.subplots(num_layers, 1, squeeze=False)[:, 0]
+
+        for (name, (steps, rows)), ax in zip(history.items(), axes):
+            # Steps without gradients are NaN and left out
+            has_grad = ~np.isnan(rows[:, GRAD_MEAN])
+            steps = steps[has_grad]
+            grad_means, grad_stds = rows[has_grad, GRAD_MEAN], rows[has_grad, GRAD_STD]
 
             ax.plot(steps, grad_means, label="Gradient Mean")
-            if grad_stds:
+            if len(grad_stds):
                 ax.fill_between(
-                    steps,
-                    [m - s for m, s in zip(grad_means, grad_stds)],
-                    [m + s for m, s in zip(grad_means, grad_stds)],
-                    alpha=0.3,
+                    steps, grad_means - grad_stds, grad_means + grad_stds, alpha=0.3
                 )
             ax.set_title(f"Gradient Flow - {name}")
             ax.set_xlabel("Training Step")
@@ -77,55 +92,50 @@ class ParameterVisualizer:
             ax.set_yscale("symlog")
             ax.legend()
 
-        plt.tight_layout()
-        if save_path:
-            plt.savefig(self.save_dir / save_path)  # type: ignore
-        plt.close()
+        self._save(figure, save_path)
 
     def plot_update_rates(
-        self, history: Dict[str, List[LayerStats]], save_path: str | None = None
+        self,
+        save_path: str | None = None,
+        start_step: int | None = None,
+        end_step: int | None = None,
     ):
         """Plot parameter update rates over time."""
-        plt.figure(figsize=(10, 6))  # type: ignore
-
-        for name, layer_history in history.items():
-            update_rates = [stats.update_rate for stats in layer_history]
-            plt.plot(update_rates, label=name)  # type: ignore
+        history = self._series(start_step, end_step)
+        if not history:
+            return
+        figure = Figure(figsize=(10, 6))
+        ax = figure.subplots()
 
-        plt.title("Parameter Update Rates")  # type: ignore
-        plt.xlabel("Training Step")  # type: ignore
-        plt.ylabel("Update Rate")  # type: ignore
-        plt.yscale("log")  # type: ignore
-        plt.legend(bbox_to_anchor=(1.05, 1), loc="upper left")  # type: ignore
-        plt.tight_layout()
+        for name, (steps, rows) in history.items():
+            ax.plot(steps, rows[:, UPDATE_RATE], label=name)  # type: ignore
 
-        if save_path:
-            plt.savefig(self.save_dir / save_path)  # type: ignore
-        plt.close()
+        ax.set_title("Parameter Update Rates")
+        ax.set_xlabel("Training Step")
+        ax.set_ylabel("Update Rate")
+        ax.set_yscale("log")
+        ax.legend(bbox_to_anchor=(1.05, 1), loc="upper left")
+        self._save(figure, save_path)
 
     def plot_convergence_heatmap(
         self,
-        history: Dict[str, List[LayerStats]],
         window_size: int = 100,
         save_path: str | None = None,
+        end_step: int | None = None,
     ):
-        """Plot convergence metrics as a heatmap."""
+        """Plot convergence metrics of the `window_size` steps up to `end_step` as a heatmap."""
+        if end_step is None:
+            end_step = self.store.last_step()
+            if end_step is None:
+                return
         metrics: Dict[str, Dict[str, float]] = {}
-        for name, layer_history in history.items():
-            if len(layer_history) < window_size:
+        for name, (_, rows) in self._series(end_step - window_size + 1, end_step).items():
+            if len(rows) < window_size:
                 continue
 
             # Calculate stability metrics
-            update_rates = np.array(
-                [stats.update_rate for stats in layer_history[-window_size:]]
-            )
-            grad_means = np.array(
-                [
-                    stats.grad_mean
-                    for stats in layer_history[-window_size:]
-                    if stats.grad_mean is not None
-                ]
-            )
+            update_rates = rows[:, UPDATE_RATE]
+            grad_means = rows[:, GRAD_MEAN][~np.isnan(rows[:, GRAD_MEAN])]
 
             metrics[name] = {
                 "update_stability": float(np.std(update_rates)),
@@ -140,18 +150,21 @@ class ParameterVisualizer:
         data = np.array(
             [[m["update_stability"], m["grad_stability"]] for m in metrics.values()]
         )
-        plt.figure(figsize=(8, len(metrics) * 0.5 + 2))  # type: ignore
+        figure = Figure(figsize=(8, len(metrics) * 0.5 + 2))
+        ax = figure.subplots()
         sns.heatmap(  # type: ignore
             data,
+            ax=ax,
             annot=True,
             fmt=".2e",
             xticklabels=["Update Stability", "Gradient Stability"],
             yticklabels=list(metrics.keys()),
             cmap="viridis",
         )
-        plt.title("Convergence Metrics Heatmap")  # type: ignore
-        plt.tight_layout()
+        ax.set_title("Convergence Metrics Heatmap")
+        self._save(figure, save_path)
 
+    def _save(self, figure: Figure, save_path: str | None):
+        figure.tight_layout()
         if save_path:
-            plt.savefig(self.save_dir / save_path)  # type: ignore
-        plt.close()
+            figure.savefig(self.save_dir / save_path)  # type: ignore
@@ -0,0 +1,93 @@
+"""Compare float32 and bfloat16 autocast training on CPU.
+
+Each run trains a shared-seat agent from the same seed on the same number of
+self-play deals and updates, timing the updates only, then plays seat 0 of
+`eval_deals` deals against heuristic opponents. Run from `src` with
+`python -m ai.precision_benchmark`.
+"""
+
+import random
+import time
+
+import numpy as np
+import torch
+
+from ai.distributed import choose_action, new_game, play_deal
+from ai.envs import HeuristicPolicy, SingleSeatEnv, encode_action
+from ai.models import CoincheAgent
+from ai.training import CoincheTrainer
+from ai.utils import CompactReplayBuffer, NStepAccumulator
+
+
+def train(
+    bf16: bool, deals: int, updates_per_deal: int, batch_size: int, seed: int
+) -> tuple[CoincheAgent, float]:
+    """Returns the trained agent and its updates/sec."""
+    torch.manual_seed(seed)
+    random.seed(seed)
+    rng = random.Random(seed)
+    agent = CoincheAgent(device="cpu", relative_seats=True, bf16=bf16)
+    trainer = CoincheTrainer(
+        agent,
+        batch_size=batch_size,
+        replay_buffer=CompactReplayBuffer(100_000, relative_seats=True, seed=seed),
+        fused=True,
+    )
+    accumulator = NStepAccumulator(trainer.replay_buffer, n=5, gamma=trainer.gamma)
+    game = new_game()
+
+    updates = 0
+    update_time = 0.0
+    for _ in range(deals):
+        play_deal(game, agent, accumulator, epsilon=0.1, rng=rng)
+        if len(trainer.replay_buffer) < batch_size:
+            continue
+        start = time.perf_counter()
+        for _ in range(updates_per_deal):
+            trainer.update_networks()
+        update_time += time.perf_counter() - start
+        updates += updates_per_deal
+    return agent, updates / update_time if update_time else 0.0
+
+
+def win_rate(agent: CoincheAgent, deals: int, num_envs: int = 16, seed: int = 0) -> float:
+    """Share of deals won by seat 0's team against heuristic opponents."""
+    env = SingleSeatEnv(num_envs, opponents=HeuristicPolicy(), seat=0, seed=seed)
+    env.reset()
+    won = played = 0
+    logged = [len(game.logs) for game in env.games]
+    while played < deals:
+        env.step(
+            np.array([encode_action(choose_action(agent, game, 0)) for game in env.games])
+        )
+        # Deals everybody passed leave no log
+        for i, game in enumerate(env.games):
+            if len(game.logs) == logged[i]:
+                continue
+            logged[i] = len(game.logs)
+            log = game.logs[-1]
+            assert log.bid.points is not None
+            attack_won = log.attack_points >= log.bid.points
+            won += attack_won == (log.bid.player % 2 == 0)
+            played += 1
+    return won / played
+
+
+def main(
+    deals: int = 200,
+    updates_per_deal: int = 8,
+    batch_size: int = 256,
+    eval_deals: int = 200,
+    seed: int = 0,
+):
+    for bf16 in (False, True):
+        agent, updates_per_sec = train(bf16, deals, updates_per_deal, batch_size, seed)
+        print(
+            f"{'bfloat16' if bf16 else 'float32'}: "
+            f"{updates_per_sec:.1f} updates/s, "
+            f"win rate {win_rate(agent, eval_deals, seed=seed):.2%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Torch-free inference for trained agents.
+
+`export_weights` flattens the three networks of a `CoincheAgent` into a single
+file (BatchNorm folded into the preceding linear layer, dropout dropped), and
+`NumpyAgent` runs the eval-mode forward pass from a read-only memory map of
+that file, so players only need NumPy and every process shares the same pages.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+
+from models import Bid, Card
+from game import CoincheGame
+from ai.encoding import candidate_bids, card_to_index, valid_cards
+from ai.symmetry import encode_view, from_canonical_bid
+
+if TYPE_CHECKING:
+    from ai.models import CoincheAgent
+
+MAGIC = b"COINCHE1"
+ALIGNMENT = 64
+NETWORKS = ("state_encoder", "bidding_network", "card_play_network")
+LAYERS = (("fc1", "bn1"), ("fc2", "bn2"), ("fc3", None))
+
+
+def _fold_layers(state_dict: dict[str, Any], eps: float = 1e-5) -> list[np.ndarray]:
+    """Return (weight, bias) pairs with BatchNorm folded in, weights as (in, out)."""
+    arrays: list[np.ndarray] = []
+    for fc, bn in LAYERS:
+        weight = state_dict[f"{fc}.weight"].detach().cpu().numpy().astype(np.float64)
+        bias = state_dict[f"{fc}.bias"].detach().cpu().numpy().astype(np.float64)
+        if bn is not None:
+            scale = state_dict[f"{bn}.weight"].detach().cpu().numpy() / np.sqrt(
+                state_dict[f"{bn}.running_var"].detach().cpu().numpy() + eps
+            )
+            weight = weight * scale[:, None]
+            bias = (
+                bias - state_dict[f"{bn}.running_mean"].detach().cpu().numpy()
+            ) * scale + state_dict[f"{bn}.bias"].detach().cpu().numpy()
+        arrays.append(np.ascontiguousarray(weight.T, dtype=np.float32))
+        arrays.append(bias.astype(np.float32))
+    return arrays
+
+
+def export_weights(agent: "CoincheAgent", path: str | Path):
+    """Write the agent's networks to a flat, memory-mappable weight file."""
+    tensors: dict[str, np.ndarray] = {}
+    for network in NETWORKS:
+        module = getattr(agent, network)
+        arrays = _fold_layers(module.state_dict(), eps=module.bn1.eps)
+        for (fc, _), weight, bias in zip(LAYERS, arrays[::2], arrays[1::2]):
+            tensors[f"{network}.{fc}.weight"] = weight
+            tensors[f"{network}.{fc}.bias"] = bias
+
+    layout: dict[str, dict[str, Any]] = {}
+    offset = 0
+    for name, array in tensors.items():
+        layout[name] = {"offset": offset, "shape": list(array.shape)}
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    header = json.dumps(
+        {
+            "relative_seats": agent.relative_seats,
+            "canonical_suits": agent.canonical_suits,
+            "tensors": layout,
+        }
+    ).encode()
+    data_start = -(-(len(MAGIC) + 8 + len(header)) // ALIGNMENT) * ALIGNMENT
+
+    path = Path(path)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(len(header).to_bytes(8, "little"))
+        f.write(header)
+        for name, array in tensors.items():
+            f.seek(data_start + layout[name]["offset"])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+
+
+def load_weights(path: str | Path) -> tuple[dict[str, np.ndarray], dict[str, Any]]:
+    """Map a weight file read-only; the returned arrays are views on the mapping."""
+    buffer = np.memmap(path, dtype=np.uint8, mode="r")
+    if bytes(buffer[: len(MAGIC)]) != MAGIC:
+        raise ValueError(f"{path} is not a coinche weight file")
+    header_len = int.from_bytes(bytes(buffer[len(MAGIC) : len(MAGIC) + 8]), "little")
+    header_end = len(MAGIC) + 8 + header_len
+    header = json.loads(bytes(buffer[len(MAGIC) + 8 : header_end]))
+    data_start = -(-header_end // ALIGNMENT) * ALIGNMENT
+
+    weights: dict[str, np.ndarray] = {}
+    for name, entry in header["tensors"].items():
+        shape = tuple(entry["shape"])
+        weights[name] = np.ndarray(
+            shape,
+            dtype=np.float32,
+            buffer=buffer,
+            offset=data_start + entry["offset"],
+        )
+    return weights, {k: v for k, v in header.items() if k != "tensors"}
+
+
+def _softmax(x: np.ndarray) -> np.ndarray:
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+class NumpyAgent:
+    """Eval-mode `CoincheAgent` running on exported weights."""
+
+    def __init__(self, path: str | Path):
+        self.weights, config = load_weights(path)
+        self.relative_seats: bool = config.get("relative_seats", False)
+        self.canonical_suits: bool = config.get("canonical_suits", False)
+
+    def _forward(self, network: str, x: np.ndarray) -> np.ndarray:
+        for i, (fc, _) in enumerate(LAYERS):
+            x = x @ self.weights[f"{network}.{fc}.weight"]
+            x += self.weights[f"{network}.{fc}.bias"]
+            if i < len(LAYERS) - 1 or network == "state_encoder":
+                np.maximum(x, 0, out=x)
+        return x
+
+    def encode(self, states: np.ndarray) -> np.ndarray:
+        return self._forward("state_encoder", np.atleast_2d(states))
+
+    def bid_probs(self, states: np.ndarray) -> np.ndarray:
+        return _softmax(self._forward("bidding_network", self.encode(states)))
+
+    def card_probs(self, states: np.ndarray) -> np.ndarray:
+        return _softmax(self._forward("card_play_network", self.encode(states)))
+
+    def encode_view(
+        self, game: CoincheGame, player_id: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Encoded state and the card permutation the networks see it through."""
+        return encode_view(game, player_id, self.relative_seats, self.canonical_suits)
+
+    def select_bid(self, game: CoincheGame, player_id: int) -> Bid:
+        bids = candidate_bids(game, player_id)
+        if not bids:
+            return Bid(player=player_id, is_pass=True, points=None, suit=None)
+        state, card_perm = self.encode_view(game, player_id)
+        bid_probs = self.bid_probs(state)[0]
+        bid = bids[int(np.argmax(bid_probs[: len(bids)]))]
+        return from_canonical_bid(bid, card_perm)
+
+    def select_card(self, game: CoincheGame, player_id: int) -> Card:
+        cards = valid_cards(game, player_id)
+        if not cards:
+            raise ValueError("No valid cards to play")
+        state, card_perm = self.encode_view(game, player_id)
+        card_probs = self.card_probs(state)[0]
+        return max(cards, key=lambda card: card_probs[card_perm[card_to_index(card)]])
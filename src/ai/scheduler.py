@@ -0,0 +1,101 @@
+import time
+
+from ai.training import CoincheTrainer
+from ai.utils import CompactReplayBuffer
+
+
+class TrainingScheduler:
+    """Decides how many gradient steps a trainer takes per collection round.
+
+    The target is `replay_ratio` replayed samples per collected transition:
+    after warm-up, every round runs the updates owed since the last one, at
+    most `updates_per_round`. Without a replay ratio every round runs exactly
+    `updates_per_round` updates. `bid_batch_size` and `card_batch_size` set
+    how many bids and card plays each batch holds, sampled apart from the
+    buffer; without them batches take the trainer's batch size in whatever
+    mix of phases the buffer holds. Only updates that trained a head count
+    as updates and replayed samples.
+    """
+
+    def __init__(
+        self,
+        trainer: CoincheTrainer,
+        replay_ratio: float | None = 8.0,
+        warmup: int = 1_000,
+        updates_per_round: int = 64,
+        bid_batch_size: int | None = None,
+        card_batch_size: int | None = None,
+    ):
+        if not isinstance(trainer.replay_buffer, CompactReplayBuffer):
+            raise ValueError("TrainingScheduler needs a slot-based replay buffer")
+        self.trainer = trainer
+        self.replay_buffer = trainer.replay_buffer
+        self.replay_ratio = replay_ratio
+        self.warmup = warmup
+        self.updates_per_round = updates_per_round
+        if (bid_batch_size is None) != (card_batch_size is None):
+            raise ValueError("Per-phase batch sizes are set together")
+        if bid_batch_size is not None:
+            trainer.bid_batch_size = bid_batch_size
+            trainer.card_batch_size = card_batch_size
+
+        self.collected = 0
+        self.updates = 0
+        self.replayed = 0
+        self._last_pushed = self.replay_buffer.pushed
+        self._start = time.perf_counter()
+        # Counters when timing started, rates only cover this run
+        self._start_counts = self.state_dict()
+
+    def step(self) -> int:
+        """Account for transitions pushed since the last round and train on them.
+
+        Returns the number of updates that trained.
+        """
+        self.collected += self.replay_buffer.pushed - self._last_pushed
+        self._last_pushed = self.replay_buffer.pushed
+        if len(self.replay_buffer) < max(self.warmup, self.trainer.total_batch_size):
+            return 0
+
+        done = 0
+        for _ in range(self.updates_per_round):
+            if not self._owed():
+                break
+            # Batches with fewer than two rows for each head train nothing
+            if self.trainer.update_networks():
+                self.replayed += self.trainer.total_batch_size
+                self.updates += 1
+                done += 1
+        return done
+
+    def _owed(self) -> bool:
+        if self.replay_ratio is None:
+            return True
+        owed = self.collected * self.replay_ratio
+        return self.replayed + self.trainer.total_batch_size <= owed
+
+    def state_dict(self) -> dict[str, int]:
+        return {
+            "collected": self.collected,
+            "updates": self.updates,
+            "replayed": self.replayed,
+        }
+
+    def load_state_dict(self, state: dict[str, int]):
+        self.collected = state["collected"]
+        self.updates = state["updates"]
+        self.replayed = state["replayed"]
+        self._start_counts = self.state_dict()
+
+    def report(self) -> dict[str, float]:
+        elapsed = time.perf_counter() - self._start
+        done = {
+            name: count - self._start_counts[name]
+            for name, count in self.state_dict().items()
+        }
+        return {
+            "transitions_per_sec": done["collected"] / elapsed,
+            "samples_per_sec": done["replayed"] / elapsed,
+            "updates_per_sec": done["updates"] / elapsed,
+            "replay_ratio": self.replayed / self.collected if self.collected else 0.0,
+        }
@@ -0,0 +1,79 @@
+import time
+from typing import Callable, TypeVar
+
+import torch
+
+from ai.models import CoincheAgent
+
+NETWORKS = ("state_encoder", "bidding_network", "card_play_network")
+
+T = TypeVar("T")
+
+
+class SharedWeights:
+    """Agent weights in one flat shared-memory tensor, guarded by a seqlock.
+
+    The single writer makes the sequence counter odd, copies every parameter
+    and floating point buffer into its slice of `flat`, then makes it even
+    again. Readers `attach` their networks once, their tensors then being
+    views into `flat`, and run inference through `read`, which retries when
+    the counter was odd or moved meanwhile. Readers never see a torn mix of
+    two versions, and neither copy nor pickle the weights. Pass the object
+    itself to the actor processes, the tensors travel as shared-memory handles.
+    """
+
+    def __init__(self, agent: CoincheAgent):
+        self.layout: list[tuple[str, str, int, int]] = []
+        offset = 0
+        for network, name, tensor in self._tensors(agent):
+            self.layout.append((network, name, offset, tensor.numel()))
+            offset += tensor.numel()
+        self.flat = torch.zeros(offset, dtype=torch.float32).share_memory_()
+        self.sequence = torch.zeros(1, dtype=torch.int64).share_memory_()
+        self.publish(agent)
+
+    @staticmethod
+    def _tensors(agent: CoincheAgent):
+        for network in NETWORKS:
+            module = getattr(agent, network)
+            tensors = {**dict(module.named_parameters()), **dict(module.named_buffers())}
+            for name, tensor in tensors.items():
+                # BatchNorm batch counters are not needed for inference
+                if tensor.is_floating_point():
+                    yield network, name, tensor
+
+    @property
+    def version(self) -> int:
+        return int(self.sequence.item()) // 2
+
+    @torch.no_grad()
+    def publish(self, agent: CoincheAgent):
+        self.sequence += 1
+        for (_, _, offset, numel), (_, _, tensor) in zip(
+            self.layout, self._tensors(agent)
+        ):
+            self.flat[offset : offset + numel].copy_(tensor.detach().reshape(-1))
+        self.sequence += 1
+
+    @torch.no_grad()
+    def attach(self, agent: CoincheAgent):
+        """Make the agent's weights views into `flat`, seeing every publish.
+
+        The agent must live on the CPU and only run inference, in eval mode,
+        through `read`.
+        """
+        for (_, _, offset, numel), (_, _, tensor) in zip(
+            self.layout, self._tensors(agent)
+        ):
+            tensor.data = self.flat[offset : offset + numel].view_as(tensor)
+
+    def read(self, fn: Callable[[], T]) -> T:
+        """Run `fn` on attached weights until no publish overlapped it."""
+        while True:
+            before = int(self.sequence.item())
+            if before % 2:
+                time.sleep(0)
+                continue
+            result = fn()
+            if int(self.sequence.item()) == before:
+                return result
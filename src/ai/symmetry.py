@@ -0,0 +1,115 @@
+"""Suit symmetries of encoded positions.
+
+Every suit scores the same way, so relabelling the suits maps a position to
+an equivalent one. A permutation is given per card index (`card_perm[old] =
+new`). It moves the three card blocks of a state and the card actions and
+mask slots. Bids are trained by points only and keep their slot, but the
+suit of a bid chosen in the canonical labelling is mapped back to the real
+one with `from_canonical_bid`.
+
+The canonical labelling puts trump in the first suit block, then orders the
+remaining suits by what the state shows of them, so that positions that are
+the same up to suit names share one encoding.
+"""
+
+from itertools import permutations
+
+import numpy as np
+
+from models import Bid, GameStage, Suit
+from game import CoincheGame
+from ai.encoding import (
+    STATE_DIM,
+    SUIT_OFFSET,
+    encode_game_state,
+    legal_action_mask,
+)
+
+NUM_CARD_BLOCKS = STATE_DIM // 32
+IDENTITY = np.arange(32)
+# Every relabelling of the four suits, as card permutations
+CARD_PERMUTATIONS = np.array(
+    [
+        (np.array(suit_perm)[:, None] * 8 + np.arange(8)).reshape(32)
+        for suit_perm in permutations(range(4))
+    ]
+)
+
+
+def canonical_permutation(state: np.ndarray, trump: Suit | None) -> np.ndarray:
+    """Card permutation taking `state` to its canonical suit labelling."""
+    blocks = state[:STATE_DIM].reshape(NUM_CARD_BLOCKS, 4, 8).transpose(1, 0, 2)
+    keys = [
+        int.from_bytes(np.packbits(block.astype(np.bool_)).tobytes(), "big")
+        for block in blocks
+    ]
+    trump_block = SUIT_OFFSET[trump] // 8 if trump is not None else -1
+    order = sorted(range(4), key=lambda block: (block != trump_block, -keys[block]))
+    suit_perm = np.empty(4, dtype=np.int64)
+    suit_perm[order] = np.arange(4)
+    return (suit_perm[:, None] * 8 + np.arange(8)).reshape(32)
+
+
+def permute_state(state: np.ndarray, card_perm: np.ndarray) -> np.ndarray:
+    inverse = np.argsort(card_perm)
+    permuted = state.copy()
+    cards = permuted[:STATE_DIM].reshape(NUM_CARD_BLOCKS, 32)
+    cards[:] = cards[:, inverse]
+    return permuted
+
+
+def permute_mask(mask: np.ndarray, card_perm: np.ndarray, is_card: bool) -> np.ndarray:
+    if not is_card:
+        return mask
+    permuted = mask.copy()
+    permuted[:32] = mask[:32][np.argsort(card_perm)]
+    return permuted
+
+
+def to_canonical_action(action: int, card_perm: np.ndarray, is_card: bool) -> int:
+    return int(card_perm[action]) if is_card else action
+
+
+def from_canonical_action(action: int, card_perm: np.ndarray, is_card: bool) -> int:
+    return int(np.argsort(card_perm)[action]) if is_card else action
+
+
+def from_canonical_bid(bid: Bid, card_perm: np.ndarray) -> Bid:
+    """The real bid for one chosen among the bids of the canonical labelling."""
+    if bid.suit is None:
+        return bid
+    block = int(np.argsort(card_perm)[SUIT_OFFSET[bid.suit]]) // 8
+    suit = next(suit for suit, offset in SUIT_OFFSET.items() if offset == block * 8)
+    return bid.model_copy(update={"suit": suit})
+
+
+def encode_view(
+    game: CoincheGame,
+    player_id: int,
+    relative_seats: bool = False,
+    canonical_suits: bool = False,
+) -> tuple[np.ndarray, np.ndarray]:
+    """State as the player's network sees it, with the card permutation used."""
+    state = encode_game_state(game, player_id, relative_seats)
+    if not canonical_suits:
+        return state, IDENTITY
+    trump = game.atout if game.phase == GameStage.GAME else None
+    card_perm = canonical_permutation(state, trump)
+    return permute_state(state, card_perm), card_perm
+
+
+def encode_decision(
+    game: CoincheGame,
+    player_id: int,
+    action_index: int,
+    relative_seats: bool = False,
+    canonical_suits: bool = False,
+) -> tuple[np.ndarray, int, np.ndarray]:
+    """State, action slot and legal mask of a decision, in the network's labelling."""
+    state, card_perm = encode_view(game, player_id, relative_seats, canonical_suits)
+    is_card = game.phase == GameStage.GAME
+    return (
+        state,
+        to_canonical_action(action_index, card_perm, is_card),
+        permute_mask(legal_action_mask(game, player_id), card_perm, is_card),
+    )
@@ -0,0 +1,100 @@
+import copy
+from typing import Any
+
+import numpy as np
+import torch
+
+from ai.models import CoincheAgent
+
+NETWORKS = ("state_encoder", "bidding_network", "card_play_network")
+
+
+class TargetNetwork:
+    """Frozen copy of an agent's networks, refreshed every `update_interval` steps.
+
+    `mode="hard"` copies the online weights, `mode="polyak"` moves the target
+    `tau` of the way towards them. `version` changes on every refresh so that
+    values computed with an older target can be recognised.
+    """
+
+    def __init__(
+        self,
+        agent: CoincheAgent,
+        mode: str = "hard",
+        update_interval: int = 1000,
+        tau: float = 0.005,
+    ):
+        if mode not in ("hard", "polyak"):
+            raise ValueError(f"Unknown target update mode {mode}")
+        self.mode = mode
+        self.update_interval = update_interval
+        self.tau = tau
+        self.version = 0
+        self.steps = 0
+        for name in NETWORKS:
+            network = copy.deepcopy(getattr(agent, name)).eval()
+            network.requires_grad_(False)
+            setattr(self, name, network)
+
+    def step(self, agent: CoincheAgent):
+        self.steps += 1
+        if self.steps % self.update_interval == 0:
+            self.refresh(agent)
+
+    @torch.no_grad()
+    def refresh(self, agent: CoincheAgent):
+        for name in NETWORKS:
+            target, online = getattr(self, name), getattr(agent, name)
+            if self.mode == "hard":
+                target.load_state_dict(online.state_dict())
+                continue
+            torch._foreach_lerp_(  # type: ignore
+                list(target.parameters()), list(online.parameters()), self.tau
+            )
+            # BatchNorm running statistics are copied as they are
+            for target_buffer, online_buffer in zip(target.buffers(), online.buffers()):
+                target_buffer.copy_(online_buffer)
+        self.version += 1
+
+    def state_dict(self) -> dict[str, Any]:
+        state: dict[str, Any] = {
+            name: getattr(self, name).state_dict() for name in NETWORKS
+        }
+        state["version"] = self.version
+        state["steps"] = self.steps
+        return state
+
+    def load_state_dict(self, state: dict[str, Any]):
+        for name in NETWORKS:
+            getattr(self, name).load_state_dict(state[name])
+        self.version = state["version"]
+        self.steps = state["steps"]
+
+
+class NextValueCache:
+    """Bootstrapped next-state values per replay slot.
+
+    An entry is valid while both the target version and the slot's write
+    stamp are unchanged, so only new transitions and transitions sampled
+    since the last refresh go through the target network. It only pays off
+    with hard updates or sparse polyak ones: a polyak target stepped every
+    update gets a new version each time and never hits.
+    """
+
+    def __init__(self, capacity: int):
+        self.values = np.zeros(capacity, dtype=np.float32)
+        self.versions = np.full(capacity, -1, dtype=np.int64)
+        self.stamps = np.full(capacity, -1, dtype=np.int64)
+
+    def lookup(
+        self, indices: np.ndarray, stamps: np.ndarray, version: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        hits = (self.versions[indices] == version) & (self.stamps[indices] == stamps)
+        return hits, self.values[indices]
+
+    def store(
+        self, indices: np.ndarray, stamps: np.ndarray, version: int, values: np.ndarray
+    ):
+        self.values[indices] = values
+        self.versions[indices] = version
+        self.stamps[indices] = stamps
@@ -0,0 +1,118 @@
+"""Content-addressed tensor storage for checkpoints.
+
+Every tensor is written once as a blob named after the SHA-256 of its dtype
+and bytes, so identical tensors across checkpoints and agents share one
+file. A checkpoint is a small JSON manifest holding the structure of the
+saved object with tensors replaced by blob references.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Iterable
+
+import numpy as np
+import torch
+
+
+class TensorStore:
+    def __init__(self, blob_dir: str | Path):
+        self.blob_dir = Path(blob_dir)
+
+    def _blob_path(self, key: str) -> Path:
+        return self.blob_dir / key[:2] / key
+
+    def put(self, tensor: torch.Tensor) -> str:
+        """Store the tensor's bytes unless an identical blob exists, returns its key."""
+        data = tensor.detach().cpu().contiguous().reshape(-1).view(torch.uint8).numpy()
+        digest = hashlib.sha256(str(tensor.dtype).encode())
+        digest.update(data)
+        key = digest.hexdigest()
+        path = self._blob_path(key)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(".tmp")
+            data.tofile(tmp_path)
+            os.replace(tmp_path, path)
+        return key
+
+    def get(self, key: str, dtype: torch.dtype, shape: list[int]) -> torch.Tensor:
+        path = self._blob_path(key)
+        if path.stat().st_size == 0:
+            return torch.empty(shape, dtype=dtype)
+        # Copy-on-write mapping, pages are read as the tensor is used
+        data = np.memmap(path, dtype=np.uint8, mode="c")
+        return torch.from_numpy(data).view(dtype).reshape(shape)
+
+    def save(self, value: Any, manifest_path: str | Path):
+        """Write the blobs of `value`, then its manifest atomically."""
+        keys: set[str] = set()
+        tree = self._encode(value, keys)
+        manifest = {"blobs": sorted(keys), "tree": tree}
+        manifest_path = Path(manifest_path)
+        tmp_path = manifest_path.with_suffix(manifest_path.suffix + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, manifest_path)
+
+    def load(self, manifest_path: str | Path) -> Any:
+        with open(manifest_path, "r") as f:
+            return self._decode(json.load(f)["tree"])
+
+    def collect_garbage(self, manifest_paths: Iterable[str | Path]) -> int:
+        """Delete blobs no manifest refers to, returns the bytes freed.
+
+        Blobs are written before their manifest, so this must not run while
+        another writer is saving into the same store.
+        """
+        referenced: set[str] = set()
+        for manifest_path in manifest_paths:
+            with open(manifest_path, "r") as f:
+                referenced.update(json.load(f)["blobs"])
+        freed = 0
+        for path in self.blob_dir.glob("*/*"):
+            if path.name not in referenced:
+                freed += path.stat().st_size
+                path.unlink()
+        return freed
+
+    def _encode(self, value: Any, keys: set[str]) -> Any:
+        if isinstance(value, torch.Tensor):
+            key = self.put(value)
+            keys.add(key)
+            return {
+                "__tensor__": key,
+                "dtype": str(value.dtype).removeprefix("torch."),
+                "shape": list(value.shape),
+            }
+        if isinstance(value, tuple):
+            return {"__tuple__": [self._encode(item, keys) for item in value]}
+        if isinstance(value, list):
+            return [self._encode(item, keys) for item in value]
+        if isinstance(value, dict):
+            if all(isinstance(k, str) and not k.startswith("__") for k in value):
+                return {k: self._encode(item, keys) for k, item in value.items()}
+            # Optimizer states are keyed by parameter number
+            return {
+                "__dict__": [
+                    [self._encode(k, keys), self._encode(item, keys)]
+                    for k, item in value.items()
+                ]
+            }
+        return value
+
+    def _decode(self, value: Any) -> Any:
+        if isinstance(value, list):
+            return [self._decode(item) for item in value]
+        if not isinstance(value, dict):
+            return value
+        if "__tensor__" in value:
+            return self.get(
+                value["__tensor__"], getattr(torch, value["dtype"]), value["shape"]
+            )
+        if "__tuple__" in value:
+            return tuple(self._decode(item) for item in value["__tuple__"])
+        if "__dict__" in value:
+            return {self._decode(k): self._decode(item) for k, item in value["__dict__"]}
+        return {k: self._decode(item) for k, item in value.items()}
@@ -1,11 +1,23 @@
+from pathlib import Path
+from typing import Any
+
+import numpy as np
 import torch
 import torch.nn.functional as F
 from torch.optim import Adam
 from torch.optim.lr_scheduler import StepLR
 
-from models import Bid, Card
-from ai.models import CoincheAgent
-from ai.utils import Experience, ReplayBuffer
+from ai.models import CoincheAgent, autocast
+from ai.symmetry import CARD_PERMUTATIONS
+from ai.target import NextValueCache, TargetNetwork
+from ai.utils import (
+    CompactReplayBuffer,
+    MmapReplayBuffer,
+    PrioritizedReplayBuffer,
+    ReplayBuffer,
+    TransitionBatch,
+    encode_experience,
+)
 
 
 class CoincheTrainer:
@@ -15,11 +27,74 @@ class CoincheTrainer:
         learning_rate: float = 0.001,
         gamma: float = 0.99,
         batch_size: int = 32,
+        bid_batch_size: int | None = None,
+        card_batch_size: int | None = None,
+        replay_buffer: ReplayBuffer | CompactReplayBuffer | None = None,
+        fused: bool = False,
+        target_update: str | None = None,
+        target_update_interval: int = 1000,
+        tau: float = 0.005,
+        bf16: bool | None = None,
+        augment_suits: bool = False,
     ):
         self.agent = agent
-        self.replay_buffer = ReplayBuffer()
+        self.replay_buffer = (
+            replay_buffer if replay_buffer is not None else ReplayBuffer()
+        )
+        if (
+            isinstance(self.replay_buffer, CompactReplayBuffer)
+            and self.replay_buffer.canonical_suits != agent.canonical_suits
+        ):
+            raise ValueError(
+                "The replay buffer must encode experiences in the agent's suit labelling"
+            )
         self.gamma = gamma
         self.batch_size = batch_size
+        # Rows of each phase per batch, sampled apart instead of `batch_size`
+        # rows in the buffer's mix of bids and card plays
+        self.bid_batch_size = bid_batch_size
+        self.card_batch_size = card_batch_size
+        if (bid_batch_size is None) != (card_batch_size is None):
+            raise ValueError("Per-phase batch sizes are set together")
+        if bid_batch_size is not None and not isinstance(
+            self.replay_buffer, CompactReplayBuffer
+        ):
+            raise ValueError("Per-phase batch sizes need a slot-based replay buffer")
+        # One encoder pass, one backward and one optimizer step per batch
+        self.fused = fused
+        # Forward passes under bfloat16 autocast, like the agent by default.
+        # Weights, gradients and optimizer state stay float32.
+        self.bf16 = agent.bf16 if bf16 is None else bf16
+        # Relabel the suits of every sampled transition at random
+        if augment_suits and agent.canonical_suits:
+            raise ValueError("Canonical suits leave nothing to augment")
+        self.augment_suits = augment_suits
+        self.rng = np.random.default_rng()
+
+        # Bootstrap from a frozen target ("hard" or "polyak") instead of the
+        # live networks, caching its values per replay slot between refreshes.
+        # A target refreshed on every update would never hit the cache.
+        self.target: TargetNetwork | None = None
+        self.next_value_cache: NextValueCache | None = None
+        if target_update is not None:
+            self.target = TargetNetwork(
+                agent, target_update, target_update_interval, tau
+            )
+            if (
+                isinstance(self.replay_buffer, CompactReplayBuffer)
+                and target_update_interval > 1
+            ):
+                self.next_value_cache = NextValueCache(self.replay_buffer.capacity)
+
+        if fused:
+            self.parameters = [
+                *agent.state_encoder.parameters(),
+                *agent.bidding_network.parameters(),
+                *agent.card_play_network.parameters(),
+            ]
+            self.optimizer = Adam(self.parameters, lr=learning_rate)
+            self.scheduler = StepLR(self.optimizer, step_size=100, gamma=0.95)
+            return
 
         # Initialize optimizers with proper parameters
         self.encoder_optimizer = Adam(
@@ -41,60 +116,218 @@ class CoincheTrainer:
         )
         self.card_scheduler = StepLR(self.card_optimizer, step_size=100, gamma=0.95)
 
-    def update_networks(self):
-        if len(self.replay_buffer) < self.batch_size:
-            return
+    def update_networks(self) -> bool:
+        """Train on one sampled batch, returns whether any head was trained."""
+        if len(self.replay_buffer) < self.total_batch_size:
+            return False
 
-        experiences = self.replay_buffer.sample(self.batch_size)
+        batch = self._sample_batch()
+        if self.fused:
+            td_errors, trained = self._fused_update(batch)
+        else:
+            td_errors, trained = self._split_update(batch)
 
-        # Separate bidding and card play experiences
-        bidding_exp = [e for e in experiences if isinstance(e.action, Bid)]
-        card_exp = [e for e in experiences if isinstance(e.action, Card)]
+        if self.target is not None and trained.any():
+            self.target.step(self.agent)
 
-        if bidding_exp:
-            self._update_bidding_network(bidding_exp)
-        if card_exp:
-            self._update_card_network(card_exp)
+        if isinstance(self.replay_buffer, PrioritizedReplayBuffer):
+            assert batch.indices is not None
+            trained_rows = trained.cpu().numpy()
+            self.replay_buffer.update_priorities(
+                batch.indices[trained_rows], td_errors[trained].cpu().numpy()
+            )
+        return bool(trained.any())
 
-    def _update_bidding_network(self, experiences: list[Experience]):
+    def _split_update(
+        self, batch: TransitionBatch
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        td_errors = torch.zeros(len(batch), device=self.agent.device)
+        trained = torch.zeros(len(batch), dtype=torch.bool, device=self.agent.device)
+
+        # Separate bidding and card play experiences, BatchNorm needs two samples
+        if (~batch.is_card).sum() > 1:
+            td_errors[~batch.is_card] = self._update_bidding_network(
+                batch.subset(~batch.is_card)
+            )
+            trained |= ~batch.is_card
+        if batch.is_card.sum() > 1:
+            td_errors[batch.is_card] = self._update_card_network(
+                batch.subset(batch.is_card)
+            )
+            trained |= batch.is_card
+
+        return td_errors, trained
+
+    def _fused_update(
+        self, batch: TransitionBatch
+    ) -> tuple[torch.Tensor, torch.Tensor]:
         self.agent.state_encoder.train()
         self.agent.bidding_network.train()
+        self.agent.card_play_network.train()
 
-        # Prepare batch data
-        states = torch.stack(
-            [
-                self.agent.encode_game_state(e.game, e.game.current_player)
-                for e in experiences
-            ]
-        )
-        next_states = torch.stack(
-            [
-                self.agent.encode_game_state(e.next_game, e.next_game.current_player)
-                for e in experiences
-            ]
-        )
-        actions = torch.tensor(
-            [e.action.points or 0 for e in experiences if isinstance(e.action, Bid)],
-            device=self.agent.device,
+        td_errors = torch.zeros(len(batch), device=self.agent.device)
+        trained = torch.zeros(len(batch), dtype=torch.bool, device=self.agent.device)
+
+        loss = torch.zeros((), device=self.agent.device)
+        with autocast(self.agent.device, self.bf16):
+            # One encoder pass over the current states builds the graph. Next
+            # states are encoded without one, or left to the target network.
+            state_features = self.agent.state_encoder(batch.states)
+            next_features = None
+            if self.target is None:
+                with torch.no_grad():
+                    next_features = self.agent.state_encoder(batch.next_states)
+
+            for head, rows in (
+                ("bidding_network", ~batch.is_card),
+                ("card_play_network", batch.is_card),
+            ):
+                # BatchNorm needs two samples
+                if rows.sum() <= 1:
+                    continue
+                subset = batch.subset(rows)
+                network = getattr(self.agent, head)
+                current_q = network(state_features[rows])
+                current_q = current_q.gather(1, subset.actions.unsqueeze(1))
+                current_q = current_q.squeeze(1).float()
+                with torch.no_grad():
+                    target_q = self._target_q(
+                        subset, None if next_features is None else next_features[rows]
+                    )
+
+                loss = loss + self._loss(current_q, target_q, subset)
+                td_errors[rows] = (target_q - current_q).detach()
+                trained |= rows
+
+        if not trained.any():
+            return td_errors, trained
+
+        self.optimizer.zero_grad()
+        loss.backward()  # type: ignore
+        torch.nn.utils.clip_grad_norm_(self.parameters, 1.0)
+        self.optimizer.step()  # type: ignore
+
+        return td_errors, trained
+
+    @property
+    def total_batch_size(self) -> int:
+        if self.bid_batch_size is None or self.card_batch_size is None:
+            return self.batch_size
+        return self.bid_batch_size + self.card_batch_size
+
+    def _sample_batch(self) -> TransitionBatch:
+        if self.bid_batch_size is not None and self.card_batch_size is not None:
+            assert isinstance(self.replay_buffer, CompactReplayBuffer)
+            sample = self.replay_buffer.sample_phases(
+                self.bid_batch_size, self.card_batch_size
+            )
+        else:
+            sample = self.replay_buffer.sample(self.batch_size)
+        if not isinstance(sample, TransitionBatch):
+            sample = TransitionBatch.from_transitions(
+                [
+                    encode_experience(
+                        e, self.agent.relative_seats, self.agent.canonical_suits
+                    )
+                    for e in sample
+                ]
+            )
+        if self.augment_suits:
+            choice = self.rng.integers(len(CARD_PERMUTATIONS), size=len(sample))
+            sample = sample.permute_suits(CARD_PERMUTATIONS[choice])
+        return sample.to(self.agent.device)
+
+    def _next_values(
+        self, networks: Any, next_features: torch.Tensor, batch: TransitionBatch
+    ) -> torch.Tensor:
+        """Best legal next action, valued by the head of the next decision's phase.
+
+        A bid's next decision is usually a card play, whose mask only has
+        meaning over the card head. Both heads see every row, which keeps
+        BatchNorm batches above one row, and each row keeps its phase's value.
+        """
+        bid_values = _best_legal(networks.bidding_network(next_features), batch.next_masks)
+        card_values = _best_legal(
+            networks.card_play_network(next_features), batch.next_masks
         )
-        rewards = torch.tensor(
-            [e.reward for e in experiences], device=self.agent.device
+        values = torch.where(batch.next_is_card, card_values, bid_values)
+        # Nothing to bootstrap from at the end of a deal
+        return torch.where(batch.dones, torch.zeros_like(values), values).float()
+
+    def _target_next_values(self, batch: TransitionBatch) -> torch.Tensor:
+        target = self.target
+        assert target is not None
+        # Cached values belong to the stored suit labelling
+        if (
+            self.next_value_cache is None
+            or batch.indices is None
+            or self.augment_suits
+        ):
+            return self._next_values(
+                target, target.state_encoder(batch.next_states), batch
+            )
+
+        assert isinstance(self.replay_buffer, CompactReplayBuffer)
+        stamps = self.replay_buffer.stamps[batch.indices]
+        hits, cached = self.next_value_cache.lookup(
+            batch.indices, stamps, target.version
         )
+        values = torch.from_numpy(cached).to(self.agent.device)
+        if not hits.all():
+            misses = torch.from_numpy(~hits).to(self.agent.device)
+            missed = batch.subset(misses)
+            # BatchNorm is in eval mode in the target, single rows are fine
+            values[misses] = self._next_values(
+                target, target.state_encoder(missed.next_states), missed
+            )
+            self.next_value_cache.store(
+                batch.indices[~hits],
+                stamps[~hits],
+                target.version,
+                values[misses].cpu().numpy(),
+            )
+        return values
+
+    def _target_q(
+        self, batch: TransitionBatch, next_features: torch.Tensor | None
+    ) -> torch.Tensor:
+        """Bootstrap from the target network, or the online `next_features`."""
+        if self.target is not None:
+            next_values = self._target_next_values(batch)
+        else:
+            assert next_features is not None
+            next_values = self._next_values(self.agent, next_features, batch)
+        return batch.rewards + self.gamma**batch.n_steps * next_values
+
+    def _loss(
+        self, current_q: torch.Tensor, target_q: torch.Tensor, batch: TransitionBatch
+    ) -> torch.Tensor:
+        if batch.weights is None:
+            return F.smooth_l1_loss(current_q, target_q)
+        # Correct the bias of prioritized sampling
+        losses = F.smooth_l1_loss(current_q, target_q, reduction="none")
+        return (batch.weights * losses).mean()
+
+    def _update_bidding_network(self, batch: TransitionBatch) -> torch.Tensor:
+        self.agent.state_encoder.train()
+        self.agent.bidding_network.train()
 
-        # Compute current Q values
-        state_features = self.agent.state_encoder(states)
-        current_q = self.agent.bidding_network(state_features)
-        current_q = current_q.gather(1, actions.unsqueeze(1))
+        with autocast(self.agent.device, self.bf16):
+            # Compute current Q values
+            state_features = self.agent.state_encoder(batch.states)
+            current_q = self.agent.bidding_network(state_features)
+            current_q = current_q.gather(1, batch.actions.unsqueeze(1))
 
-        # Compute target Q values
-        with torch.no_grad():
-            next_features = self.agent.state_encoder(next_states)
-            next_q = self.agent.bidding_network(next_features)
-            max_next_q = next_q.max(1)[0]
-            target_q = rewards + self.gamma * max_next_q
+            # Compute target Q values
+            with torch.no_grad():
+                next_features = None
+                if self.target is None:
+                    next_features = self.agent.state_encoder(batch.next_states)
+                target_q = self._target_q(batch, next_features)
 
         # Compute loss and update
-        loss = F.smooth_l1_loss(current_q.squeeze(), target_q)
+        current_q = current_q.squeeze(1).float()
+        loss = self._loss(current_q, target_q, batch)
 
         self.encoder_optimizer.zero_grad()
         self.bidding_optimizer.zero_grad()
@@ -104,49 +337,28 @@ class CoincheTrainer:
         self.encoder_optimizer.step()  # type: ignore
         self.bidding_optimizer.step()  # type: ignore
 
-    def _update_card_network(self, experiences: list[Experience]):
+        return (target_q - current_q).detach()
+
+    def _update_card_network(self, batch: TransitionBatch) -> torch.Tensor:
         self.agent.state_encoder.train()
         self.agent.card_play_network.train()
 
-        # Prepare batch data
-        states = torch.stack(
-            [
-                self.agent.encode_game_state(e.game, e.game.current_player)
-                for e in experiences
-            ]
-        )
-        next_states = torch.stack(
-            [
-                self.agent.encode_game_state(e.next_game, e.next_game.current_player)
-                for e in experiences
-            ]
-        )
-        actions = torch.tensor(
-            [
-                self.agent.card_to_index(e.action)
-                for e in experiences  # type: ignore
-                if isinstance(e.action, Card)
-            ],
-            device=self.agent.device,
-        )
-        rewards = torch.tensor(
-            [e.reward for e in experiences], device=self.agent.device
-        )
-
-        # Compute current Q values
-        state_features = self.agent.state_encoder(states)
-        current_q = self.agent.card_play_network(state_features)
-        current_q = current_q.gather(1, actions.unsqueeze(1))
+        with autocast(self.agent.device, self.bf16):
+            # Compute current Q values
+            state_features = self.agent.state_encoder(batch.states)
+            current_q = self.agent.card_play_network(state_features)
+            current_q = current_q.gather(1, batch.actions.unsqueeze(1))
 
-        # Compute target Q values
-        with torch.no_grad():
-            next_features = self.agent.state_encoder(next_states)
-            next_q = self.agent.card_play_network(next_features)
-            max_next_q = next_q.max(1)[0]
-            target_q = rewards + self.gamma * max_next_q
+            # Compute target Q values
+            with torch.no_grad():
+                next_features = None
+                if self.target is None:
+                    next_features = self.agent.state_encoder(batch.next_states)
+                target_q = self._target_q(batch, next_features)
 
         # Compute loss and update
-        loss = F.smooth_l1_loss(current_q.squeeze(), target_q)
+        current_q = current_q.squeeze(1).float()
+        loss = self._loss(current_q, target_q, batch)
 
         self.encoder_optimizer.zero_grad()
         self.card_optimizer.zero_grad()
@@ -156,7 +368,68 @@ class CoincheTrainer:
         self.encoder_optimizer.step()  # type: ignore
         self.card_optimizer.step()  # type: ignore
 
+        return (target_q - current_q).detach()
+
+    def _optimizers(self) -> dict[str, Adam | StepLR]:
+        if self.fused:
+            return {"optimizer": self.optimizer, "scheduler": self.scheduler}
+        return {
+            "encoder_optimizer": self.encoder_optimizer,
+            "bidding_optimizer": self.bidding_optimizer,
+            "card_optimizer": self.card_optimizer,
+            "encoder_scheduler": self.encoder_scheduler,
+            "bidding_scheduler": self.bidding_scheduler,
+            "card_scheduler": self.card_scheduler,
+        }
+
+    def state_dict(self) -> dict[str, Any]:
+        """Everything needed to resume training, besides the agent's weights.
+
+        Replay contents are only referenced: a memory-mapped buffer is
+        recorded by directory and size, and must be flushed up to there before
+        the state is written, an in-memory one is not saved.
+        """
+        state: dict[str, Any] = {
+            name: item.state_dict() for name, item in self._optimizers().items()
+        }
+        state["rng"] = self.rng.bit_generator.state
+        if self.target is not None:
+            state["target"] = self.target.state_dict()
+        if isinstance(self.replay_buffer, CompactReplayBuffer):
+            state["replay_rng"] = self.replay_buffer.rng.bit_generator.state
+        if isinstance(self.replay_buffer, MmapReplayBuffer):
+            state["replay"] = {
+                "save_dir": str(self.replay_buffer.save_dir.resolve()),
+                "size": len(self.replay_buffer),
+            }
+        return state
+
+    def load_state_dict(self, state: dict[str, Any]):
+        replay = state.get("replay")
+        if replay is not None and (
+            not isinstance(self.replay_buffer, MmapReplayBuffer)
+            or self.replay_buffer.save_dir.resolve() != Path(replay["save_dir"])
+        ):
+            raise ValueError(f"Training state expects the replay in {replay['save_dir']}")
+        for name, item in self._optimizers().items():
+            item.load_state_dict(state[name])
+        self.rng.bit_generator.state = state["rng"]
+        if self.target is not None and "target" in state:
+            self.target.load_state_dict(state["target"])
+        if isinstance(self.replay_buffer, CompactReplayBuffer) and "replay_rng" in state:
+            self.replay_buffer.rng.bit_generator.state = state["replay_rng"]
+
     def step_schedulers(self):
+        if self.fused:
+            self.scheduler.step()
+            return
         self.encoder_scheduler.step()
         self.bidding_scheduler.step()
         self.card_scheduler.step()
+
+
+def _best_legal(q_values: torch.Tensor, masks: torch.Tensor) -> torch.Tensor:
+    """Highest Q value among legal actions, 0 for rows without any."""
+    masks = masks[:, : q_values.shape[1]]
+    best = q_values.masked_fill(~masks, float("-inf")).max(1)[0]
+    return torch.where(masks.any(1), best, torch.zeros_like(best))
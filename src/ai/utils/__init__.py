@@ -1,4 +1,26 @@
-from .experience import Experience, ReplayBuffer
+from .experience import (
+    Experience,
+    ReplayBuffer,
+    Transition,
+    TransitionBatch,
+    encode_experience,
+)
+from .compact_replay import CompactReplayBuffer
+from .mmap_replay import MmapReplayBuffer
+from .prioritized_replay import PrioritizedReplayBuffer, SumTree
+from .nstep import NStepAccumulator
 from .rewards import calculate_reward
 
-__all__ = ["Experience", "ReplayBuffer", "calculate_reward"]
+__all__ = [
+    "Experience",
+    "ReplayBuffer",
+    "Transition",
+    "TransitionBatch",
+    "encode_experience",
+    "CompactReplayBuffer",
+    "MmapReplayBuffer",
+    "PrioritizedReplayBuffer",
+    "SumTree",
+    "NStepAccumulator",
+    "calculate_reward",
+]
@@ -0,0 +1,169 @@
+import numpy as np
+import torch
+
+from ai.encoding import NUM_BID_ACTIONS, state_dim
+from .experience import Experience, Transition, TransitionBatch, encode_experience
+
+
+def transition_dtype(relative_seats: bool = False) -> np.dtype:
+    """Record layout of one bit-packed transition."""
+    state_bytes = -(-state_dim(relative_seats) // 8)
+    return np.dtype(
+        [
+            ("state", np.uint8, (state_bytes,)),
+            ("next_state", np.uint8, (state_bytes,)),
+            ("next_mask", np.uint8, (NUM_BID_ACTIONS // 8,)),
+            ("reward", np.float32),
+            ("action", np.int16),
+            ("done", np.bool_),
+            ("is_card", np.bool_),
+            ("next_is_card", np.bool_),
+            ("n_steps", np.uint8),
+        ]
+    )
+
+
+def pack_transition(transition: Transition, record: np.ndarray):
+    record["state"] = np.packbits(transition.state.astype(np.bool_))
+    record["next_state"] = np.packbits(transition.next_state.astype(np.bool_))
+    record["next_mask"] = np.packbits(transition.next_mask)
+    record["reward"] = transition.reward
+    record["action"] = transition.action
+    record["done"] = transition.done
+    record["is_card"] = transition.is_card
+    record["next_is_card"] = transition.next_is_card
+    record["n_steps"] = transition.n_steps
+
+
+def unpack_records(records: np.ndarray, relative_seats: bool = False) -> TransitionBatch:
+    dim = state_dim(relative_seats)
+    return TransitionBatch(
+        states=torch.from_numpy(
+            np.unpackbits(records["state"], axis=1, count=dim).astype(np.float32)
+        ),
+        actions=torch.from_numpy(records["action"].astype(np.int64)),
+        rewards=torch.from_numpy(records["reward"].copy()),
+        next_states=torch.from_numpy(
+            np.unpackbits(records["next_state"], axis=1, count=dim).astype(np.float32)
+        ),
+        dones=torch.from_numpy(records["done"].copy()),
+        is_card=torch.from_numpy(records["is_card"].copy()),
+        next_masks=torch.from_numpy(
+            np.unpackbits(records["next_mask"], axis=1).astype(np.bool_)
+        ),
+        n_steps=torch.from_numpy(records["n_steps"].astype(np.int64)),
+        next_is_card=torch.from_numpy(records["next_is_card"].copy()),
+    )
+
+
+class CompactReplayBuffer:
+    """Ring buffer of bit-packed encoded transitions in one preallocated array.
+
+    A transition takes about 90 bytes, so a million of them fit in under 100 MB,
+    and states are encoded once at push time instead of on every update.
+    """
+
+    # Rounds of draws `sample_phases` makes before settling for a short phase
+    PHASE_DRAWS = 16
+
+    def __init__(
+        self,
+        capacity: int = 1_000_000,
+        relative_seats: bool = False,
+        seed: int | None = None,
+        canonical_suits: bool = False,
+    ):
+        self.capacity = capacity
+        self.relative_seats = relative_seats
+        # Pushed experiences are encoded in their canonical suit labelling
+        self.canonical_suits = canonical_suits
+        self.dtype = transition_dtype(relative_seats)
+        # np.zeros only commits pages once they are written
+        self.data = np.zeros(capacity, dtype=self.dtype)
+        # Push count at which each slot was last written
+        self.stamps = np.full(capacity, -1, dtype=np.int64)
+        # Phase of the transition in each slot, to sample bids and card plays apart
+        self.is_card = np.zeros(capacity, dtype=np.bool_)
+        self.pushed = 0
+        self.position = 0
+        self.size = 0
+        self.rng = np.random.default_rng(seed)
+
+    def push(self, experience: Experience):
+        self.push_transition(
+            encode_experience(experience, self.relative_seats, self.canonical_suits)
+        )
+
+    def push_transition(self, transition: Transition):
+        record = np.zeros(1, dtype=self.dtype)
+        pack_transition(transition, record)
+        self.push_records(record)
+
+    def push_records(self, records: np.ndarray):
+        """Append already packed records, e.g. received from self-play workers."""
+        # Only the newest `capacity` records survive, in their ring slots
+        skipped = max(len(records) - self.capacity, 0)
+        self.position = (self.position + skipped) % self.capacity
+        self.pushed += skipped
+        records = records[skipped:]
+        while len(records):
+            count = min(len(records), self.capacity - self.position)
+            self._write(self.position, records[:count])
+            self.stamps[self.position : self.position + count] = np.arange(
+                self.pushed, self.pushed + count
+            )
+            self.is_card[self.position : self.position + count] = records["is_card"][
+                :count
+            ]
+            self.pushed += count
+            self._advance(count)
+            records = records[count:]
+
+    def _write(self, start: int, records: np.ndarray):
+        self.data[start : start + len(records)] = records
+
+    def _gather(self, indices: np.ndarray) -> np.ndarray:
+        return self.data[indices]
+
+    def _advance(self, count: int):
+        self.position = (self.position + count) % self.capacity
+        self.size = min(self.size + count, self.capacity)
+
+    def clear(self):
+        self.position = 0
+        self.size = 0
+
+    def sample_indices(self, batch_size: int) -> np.ndarray:
+        return self.rng.integers(0, self.size, size=batch_size)
+
+    def sample(self, batch_size: int) -> TransitionBatch:
+        return self._batch(self.sample_indices(batch_size))
+
+    def sample_phases(
+        self, bid_batch_size: int, card_batch_size: int
+    ) -> TransitionBatch:
+        """Batch of `bid_batch_size` bids followed by `card_batch_size` card plays.
+
+        Slots are drawn like `sample` draws them and kept by phase, so each
+        head trains on its own batch size whatever the mix of the buffer. A
+        phase the buffer holds too little of is left short.
+        """
+        wanted = np.array([bid_batch_size, card_batch_size])
+        kept: list[list[np.ndarray]] = [[], []]
+        for _ in range(self.PHASE_DRAWS):
+            missing = wanted - [sum(map(len, rows)) for rows in kept]
+            if not missing.any():
+                break
+            indices = self.sample_indices(4 * int(missing.sum()))
+            for phase in (0, 1):
+                rows = indices[self.is_card[indices] == phase]
+                kept[phase].append(rows[: missing[phase]])
+        return self._batch(np.concatenate(kept[0] + kept[1]))
+
+    def _batch(self, indices: np.ndarray) -> TransitionBatch:
+        batch = unpack_records(self._gather(indices), self.relative_seats)
+        batch.indices = indices
+        return batch
+
+    def __len__(self) -> int:
+        return self.size
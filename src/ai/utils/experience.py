@@ -1,10 +1,20 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, fields, replace
 from collections import deque
 import random
 from typing import Deque
 
+import numpy as np
+import torch
+
 from game import CoincheGame
-from models import Card, Bid
+from models import Card, Bid, GameStage
+from ai.encoding import (
+    NUM_CARD_ACTIONS,
+    STATE_DIM,
+    action_to_index,
+    legal_action_mask,
+)
+from ai.symmetry import encode_decision, encode_view, permute_mask
 
 
 @dataclass
@@ -13,6 +23,152 @@ class Experience:
     action: Card | Bid
     reward: float
     next_game: CoincheGame
+    # Seat that took the action, defaults to the game's current player
+    player_id: int | None = None
+
+
+@dataclass
+class Transition:
+    """An experience encoded from the acting seat's point of view."""
+
+    state: np.ndarray
+    action: int
+    reward: float
+    next_state: np.ndarray
+    done: bool
+    is_card: bool
+    next_mask: np.ndarray
+    # Rewards summed over this many steps before bootstrapping
+    n_steps: int = 1
+    # Phase of the decision bootstrapped from, a bid is followed by card play
+    next_is_card: bool = False
+
+
+def encode_experience(
+    experience: Experience, relative_seats: bool = False, canonical_suits: bool = False
+) -> Transition:
+    """Encode as the acting seat's network sees it, in canonical suits if asked."""
+    player_id = (
+        experience.player_id
+        if experience.player_id is not None
+        else experience.game.current_player
+    )
+    state, action, _ = encode_decision(
+        experience.game,
+        player_id,
+        action_to_index(experience.action),
+        relative_seats,
+        canonical_suits,
+    )
+    next_game = experience.next_game
+    next_is_card = next_game.phase == GameStage.GAME
+    next_state, next_perm = encode_view(
+        next_game, player_id, relative_seats, canonical_suits
+    )
+    return Transition(
+        state=state,
+        action=action,
+        reward=experience.reward,
+        next_state=next_state,
+        done=len(next_game.tricks) == 8,
+        is_card=isinstance(experience.action, Card),
+        next_mask=permute_mask(
+            legal_action_mask(next_game, player_id), next_perm, next_is_card
+        ),
+        next_is_card=next_is_card,
+    )
+
+
+@dataclass
+class TransitionBatch:
+    """Batched transitions as tensors, ready for the trainer."""
+
+    states: torch.Tensor
+    actions: torch.Tensor
+    rewards: torch.Tensor
+    next_states: torch.Tensor
+    dones: torch.Tensor
+    is_card: torch.Tensor
+    next_masks: torch.Tensor
+    n_steps: torch.Tensor
+    next_is_card: torch.Tensor
+    # Replay slots the batch was gathered from, when the buffer has slots
+    indices: np.ndarray | None = None
+    # Importance-sampling weights from prioritized replay
+    weights: torch.Tensor | None = None
+
+    @classmethod
+    def from_transitions(cls, transitions: list[Transition]) -> "TransitionBatch":
+        return cls(
+            states=torch.from_numpy(np.stack([t.state for t in transitions])),
+            actions=torch.tensor([t.action for t in transitions], dtype=torch.long),
+            rewards=torch.tensor(
+                [t.reward for t in transitions], dtype=torch.float32
+            ),
+            next_states=torch.from_numpy(
+                np.stack([t.next_state for t in transitions])
+            ),
+            dones=torch.tensor([t.done for t in transitions]),
+            is_card=torch.tensor([t.is_card for t in transitions]),
+            next_masks=torch.from_numpy(np.stack([t.next_mask for t in transitions])),
+            n_steps=torch.tensor([t.n_steps for t in transitions]),
+            next_is_card=torch.tensor([t.next_is_card for t in transitions]),
+        )
+
+    def __len__(self) -> int:
+        return len(self.actions)
+
+    def to(self, device: str | torch.device) -> "TransitionBatch":
+        return replace(
+            self,
+            **{
+                f.name: value.to(device)
+                for f in fields(self)
+                if isinstance(value := getattr(self, f.name), torch.Tensor)
+            },
+        )
+
+    def permute_suits(self, card_perms: np.ndarray) -> "TransitionBatch":
+        """Relabel the suits of each row, `card_perms[row][old_card] = new_card`."""
+        perms = torch.from_numpy(card_perms).to(self.actions.device)
+        gather = torch.argsort(perms, dim=1)
+
+        def permute_cards(states: torch.Tensor) -> torch.Tensor:
+            cards = states[:, :STATE_DIM].reshape(len(self), -1, NUM_CARD_ACTIONS)
+            cards = cards.gather(2, gather.unsqueeze(1).expand_as(cards))
+            return torch.cat([cards.flatten(1), states[:, STATE_DIM:]], dim=1)
+
+        # Card-phase masks are permuted, bidding ones keep their slots
+        next_is_card = self.next_is_card
+        next_masks = self.next_masks.clone()
+        next_masks[next_is_card, :NUM_CARD_ACTIONS] = self.next_masks[
+            next_is_card, :NUM_CARD_ACTIONS
+        ].gather(1, gather[next_is_card])
+
+        # Bid slots go past the card range, clamped before being left alone
+        card_slots = self.actions.clamp(max=NUM_CARD_ACTIONS - 1).unsqueeze(1)
+        card_actions = perms.gather(1, card_slots).squeeze(1)
+        return replace(
+            self,
+            states=permute_cards(self.states),
+            next_states=permute_cards(self.next_states),
+            actions=torch.where(self.is_card, card_actions, self.actions),
+            next_masks=next_masks,
+        )
+
+    def subset(self, selection: torch.Tensor) -> "TransitionBatch":
+        """Select rows with a boolean mask or index tensor."""
+        cpu_selection = selection.cpu().numpy()
+        return replace(
+            self,
+            **{
+                f.name: value[selection]
+                if isinstance(value, torch.Tensor)
+                else value[cpu_selection]
+                for f in fields(self)
+                if (value := getattr(self, f.name)) is not None
+            },
+        )
 
 
 class ReplayBuffer:
@@ -0,0 +1,161 @@
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from .compact_replay import CompactReplayBuffer, transition_dtype
+
+
+class MmapReplayBuffer(CompactReplayBuffer):
+    """Compact replay buffer whose records live in memory-mapped segment files.
+
+    The ring is split into fixed-size segment files next to a small
+    `index.json` holding the write position and size. The index is only
+    rewritten (atomically) after the segments are flushed, so reopening after
+    a crash never exposes slots that were not fully written.
+    """
+
+    INDEX_FILE = "index.json"
+
+    def __init__(
+        self,
+        save_dir: str = "src/ai/replay",
+        capacity: int = 1_000_000,
+        segment_size: int = 65_536,
+        relative_seats: bool = False,
+        flush_interval: int = 10_000,
+        run_length: int = 1,
+        seed: int | None = None,
+        canonical_suits: bool = False,
+    ):
+        self.save_dir = Path(save_dir)
+        self.save_dir.mkdir(parents=True, exist_ok=True)
+        self.capacity = -(-capacity // segment_size) * segment_size
+        self.segment_size = segment_size
+        self.relative_seats = relative_seats
+        self.canonical_suits = canonical_suits
+        self.dtype = transition_dtype(relative_seats)
+        self.flush_interval = flush_interval
+        # Contiguous slots read per sampled position, > 1 trades sample
+        # independence for sequential reads
+        self.run_length = run_length
+        self.rng = np.random.default_rng(seed)
+        self.position = 0
+        self.size = 0
+        self._unflushed = 0
+        self.segments: list[np.memmap] = []
+
+        index_path = self.save_dir / self.INDEX_FILE
+        if index_path.exists():
+            self._load_index(index_path)
+        for i in range(self.capacity // segment_size):
+            self.segments.append(self._open_segment(i))
+        self.stamps = np.full(self.capacity, -1, dtype=np.int64)
+        self.is_card = np.concatenate([segment["is_card"] for segment in self.segments])
+        self.pushed = 0
+        # Records published by the last index written, flushes may come from
+        # a checkpoint writer thread too
+        self._published = 0
+        self._flush_lock = threading.Lock()
+
+    def _segment_path(self, i: int) -> Path:
+        return self.save_dir / f"segment_{i:05d}.bin"
+
+    def _open_segment(self, i: int) -> np.memmap:
+        path = self._segment_path(i)
+        expected = self.segment_size * self.dtype.itemsize
+        if path.exists() and path.stat().st_size != expected:
+            # Segment was never fully created, drop everything from it on
+            self.size = min(self.size, i * self.segment_size)
+            self.position = self.size % self.capacity
+            path.unlink()
+        mode = "r+" if path.exists() else "w+"
+        return np.memmap(path, dtype=self.dtype, mode=mode, shape=(self.segment_size,))
+
+    def _load_index(self, path: Path):
+        with open(path, "r") as f:
+            index: dict[str, Any] = json.load(f)
+        if (
+            index["segment_size"] != self.segment_size
+            or index["dtype"] != repr(self.dtype.descr)
+        ):
+            raise ValueError(f"Replay storage in {self.save_dir} has another layout")
+        # The ring keeps the capacity it was created with
+        self.capacity = index["capacity"]
+        self.position = index["position"]
+        self.size = index["size"]
+
+    def index(self) -> dict[str, Any]:
+        """The index publishing every record written so far."""
+        return {
+            "segment_size": self.segment_size,
+            "capacity": self.capacity,
+            "dtype": repr(self.dtype.descr),
+            "position": self.position,
+            "size": self.size,
+            "pushed": self.pushed,
+        }
+
+    def flush(self, index: dict[str, Any] | None = None):
+        """Persist written records, then publish them through the index.
+
+        An `index` taken earlier can be published from another thread while
+        records are still being pushed, unless a later one already was.
+        """
+        if index is None:
+            index = self.index()
+            self._unflushed = 0
+        with self._flush_lock:
+            if index["pushed"] < self._published:
+                return
+            for segment in self.segments:
+                segment.flush()
+            tmp_path = self.save_dir / (self.INDEX_FILE + ".tmp")
+            with open(tmp_path, "w") as f:
+                json.dump({k: v for k, v in index.items() if k != "pushed"}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.save_dir / self.INDEX_FILE)
+            self._published = index["pushed"]
+
+    def close(self):
+        self.flush()
+        self.segments = []
+
+    def _write(self, start: int, records: np.ndarray):
+        while len(records):
+            segment, offset = divmod(start, self.segment_size)
+            count = min(len(records), self.segment_size - offset)
+            self.segments[segment][offset : offset + count] = records[:count]
+            records = records[count:]
+            start += count
+
+    def _advance(self, count: int):
+        super()._advance(count)
+        self._unflushed += count
+        if self._unflushed >= self.flush_interval:
+            self.flush()
+
+    def sample_indices(self, batch_size: int) -> np.ndarray:
+        if self.run_length <= 1:
+            return self.rng.integers(0, self.size, size=batch_size)
+        starts = self.rng.integers(0, self.size, size=-(-batch_size // self.run_length))
+        runs = (starts[:, None] + np.arange(self.run_length)) % self.size
+        return runs.ravel()[:batch_size]
+
+    def _gather(self, indices: np.ndarray) -> np.ndarray:
+        # Read each segment in ascending slot order so the kernel can read ahead
+        order = np.argsort(indices, kind="stable")
+        sorted_indices = indices[order]
+        records = np.empty(len(indices), dtype=self.dtype)
+        segment_ids = sorted_indices // self.segment_size
+        bounds = np.flatnonzero(np.diff(segment_ids)) + 1
+        for chunk, rows in zip(
+            np.split(sorted_indices, bounds), np.split(order, bounds)
+        ):
+            segment = self.segments[chunk[0] // self.segment_size]
+            records[rows] = segment[chunk % self.segment_size]
+        return records
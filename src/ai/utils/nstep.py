@@ -0,0 +1,113 @@
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque
+
+import numpy as np
+
+from ai.encoding import NUM_BID_ACTIONS
+from .compact_replay import CompactReplayBuffer
+from .experience import Transition
+
+
+@dataclass
+class _Step:
+    state: np.ndarray
+    action: int
+    is_card: bool
+    reward: float = 0.0
+    next_state: np.ndarray | None = None
+    next_mask: np.ndarray | None = None
+    next_is_card: bool = False
+
+
+class NStepAccumulator:
+    """Turns each seat's stream of decisions and rewards into n-step transitions.
+
+    A seat's decision stays open until its next decision (or the end of the
+    deal) provides the next state, so bidding steps are chained to the card
+    play that follows. Transitions record the phase of the decision they
+    bootstrap from, which picks the head valuing their next state. Only the
+    last `n` closed steps per seat are kept, each n-step transition is pushed
+    as soon as its window is full, and the rest are flushed with shorter
+    horizons when the deal ends.
+
+    Returns are plain n-step returns. λ-returns are not built: they mix the
+    bootstrapped values of every state in the window, while a transition
+    only stores the one state it bootstraps from.
+    """
+
+    def __init__(self, replay_buffer: CompactReplayBuffer, n: int = 5, gamma: float = 0.99):
+        self.replay_buffer = replay_buffer
+        self.n = n
+        self.gamma = gamma
+        self.open_steps: dict[int, _Step] = {}
+        self.windows: dict[int, Deque[_Step]] = {}
+
+    def observe(
+        self, seat: int, state: np.ndarray, action: int, is_card: bool, mask: np.ndarray
+    ):
+        """Record a decision taken by `seat` in `state`, `mask` being its legal actions."""
+        if seat in self.open_steps:
+            self._close(seat, state, mask, is_card)
+        self.open_steps[seat] = _Step(state=state, action=action, is_card=is_card)
+
+    def reward(self, seat: int, reward: float):
+        """Credit a reward to the seat's latest decision."""
+        if seat in self.open_steps:
+            self.open_steps[seat].reward += reward
+
+    def end(self, seat: int):
+        """The deal is over for `seat`, flush its remaining steps as terminal."""
+        if seat in self.open_steps:
+            step = self.open_steps.pop(seat)
+            self._close_step(seat, step, np.zeros_like(step.state), None, False)
+        window = self.windows.pop(seat, deque())
+        while window:
+            self._emit(window, done=True)
+            window.popleft()
+
+    def _close(
+        self, seat: int, next_state: np.ndarray, next_mask: np.ndarray, next_is_card: bool
+    ):
+        self._close_step(
+            seat, self.open_steps.pop(seat), next_state, next_mask, next_is_card
+        )
+
+    def _close_step(
+        self,
+        seat: int,
+        step: _Step,
+        next_state: np.ndarray,
+        next_mask: np.ndarray | None,
+        next_is_card: bool,
+    ):
+        step.next_state = next_state
+        step.next_mask = next_mask
+        step.next_is_card = next_is_card
+        window = self.windows.setdefault(seat, deque())
+        window.append(step)
+        if len(window) == self.n and next_mask is not None:
+            self._emit(window, done=False)
+            window.popleft()
+
+    def _emit(self, window: Deque[_Step], done: bool):
+        first, last = window[0], window[-1]
+        reward = sum(self.gamma**k * step.reward for k, step in enumerate(window))
+        assert last.next_state is not None
+        self.replay_buffer.push_transition(
+            Transition(
+                state=first.state,
+                action=first.action,
+                reward=reward,
+                next_state=last.next_state,
+                done=done,
+                is_card=first.is_card,
+                next_mask=(
+                    last.next_mask
+                    if last.next_mask is not None
+                    else np.zeros(NUM_BID_ACTIONS, dtype=np.bool_)
+                ),
+                n_steps=len(window),
+                next_is_card=last.next_is_card,
+            )
+        )
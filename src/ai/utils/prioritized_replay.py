@@ -0,0 +1,100 @@
+import numpy as np
+import torch
+
+from .compact_replay import CompactReplayBuffer
+from .experience import TransitionBatch
+
+
+class SumTree:
+    """Array-backed binary tree of priorities, with sums in the inner nodes.
+
+    Node 1 is the root and the children of node i are 2i and 2i + 1, so leaf
+    j lives at `leaves + j`. Updates and lookups are vectorized over a batch
+    and walk one tree level per step, O(log n) each.
+    """
+
+    def __init__(self, capacity: int):
+        self.leaves = 1 << max(capacity - 1, 0).bit_length()
+        self.depth = self.leaves.bit_length() - 1
+        self.tree = np.zeros(2 * self.leaves, dtype=np.float64)
+
+    @property
+    def total(self) -> float:
+        return float(self.tree[1])
+
+    def priorities(self, indices: np.ndarray) -> np.ndarray:
+        return self.tree[self.leaves + indices]
+
+    def update(self, indices: np.ndarray, priorities: np.ndarray):
+        nodes = self.leaves + np.asarray(indices)
+        self.tree[nodes] = priorities
+        for _ in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values: np.ndarray) -> np.ndarray:
+        """Leaf index whose cumulative priority range contains each value."""
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = self.tree[2 * nodes]
+            go_right = values >= left
+            values -= np.where(go_right, left, 0.0)
+            nodes = 2 * nodes + go_right
+        return nodes - self.leaves
+
+
+class PrioritizedReplayBuffer(CompactReplayBuffer):
+    """Compact replay buffer sampling transitions proportionally to their TD error.
+
+    New transitions get the highest priority seen so far; `update_priorities`
+    sets |TD error| + eps raised to `alpha`. Batches carry importance-sampling
+    weights, with `beta` annealed to 1 over `beta_steps` samples.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 1_000_000,
+        relative_seats: bool = False,
+        alpha: float = 0.6,
+        beta: float = 0.4,
+        beta_steps: int = 100_000,
+        eps: float = 1e-3,
+        seed: int | None = None,
+        canonical_suits: bool = False,
+    ):
+        super().__init__(capacity, relative_seats, seed, canonical_suits)
+        self.tree = SumTree(capacity)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = (1.0 - beta) / beta_steps
+        self.eps = eps
+        self.max_priority = 1.0
+
+    def _write(self, start: int, records: np.ndarray):
+        super()._write(start, records)
+        self.tree.update(
+            np.arange(start, start + len(records)),
+            np.full(len(records), self.max_priority**self.alpha),
+        )
+
+    def sample_indices(self, batch_size: int) -> np.ndarray:
+        # One value per equal slice of the total priority mass
+        segment = self.tree.total / batch_size
+        values = (np.arange(batch_size) + self.rng.random(batch_size)) * segment
+        return np.minimum(self.tree.find(values), self.size - 1)
+
+    def _batch(self, indices: np.ndarray) -> TransitionBatch:
+        batch = super()._batch(indices)
+        probabilities = self.tree.priorities(indices) / self.tree.total
+        weights = (self.size * probabilities) ** -self.beta
+        batch.weights = torch.from_numpy((weights / weights.max()).astype(np.float32))
+        self.beta = min(1.0, self.beta + self.beta_increment * len(indices))
+        return batch
+
+    def update_priorities(self, indices: np.ndarray, td_errors: np.ndarray):
+        priorities = np.abs(td_errors) + self.eps
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        # Keep the last update when a slot was sampled more than once
+        indices, last = np.unique(indices[::-1], return_index=True)
+        self.tree.update(indices, priorities[::-1][last] ** self.alpha)
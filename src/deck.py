@@ -260,9 +260,9 @@ def create_deck() -> list[Card]:
     return [card for suit in Suit for card in cards[suit].values()]
 
 
-def shuffle_deck(deck: list[Card]) -> list[Card]:
+def shuffle_deck(deck: list[Card], rng: random.Random | None = None) -> list[Card]:
     shuffled = deck.copy()
-    random.shuffle(shuffled)
+    (rng or random).shuffle(shuffled)
     return shuffled
 
 
@@ -1,4 +1,6 @@
-from pydantic import BaseModel, ConfigDict
+import random
+
+from pydantic import BaseModel, ConfigDict, Field
 
 from game_rules import GameRules
 from deck import create_deck, shuffle_deck, deal_cards
@@ -21,6 +23,8 @@ class CoincheGame(BaseModel):
     scores: list[int] = [0, 0]
     atout: Suit | None = None
     logs: list[LogGame] = []
+    # Shuffles the deck, the random module when unset
+    rng: random.Random | None = Field(default=None, exclude=True)
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
     def add_player(self, player: Player):
@@ -48,7 +52,7 @@ class CoincheGame(BaseModel):
         self.current_trick = []
         self.current_player = 0
         self.atout = None
-        self.deck = shuffle_deck(self.deck)
+        self.deck = shuffle_deck(self.deck, self.rng)
         hands = deal_cards(self.deck.copy())
         for player, hand in zip(self.players, hands):
             player.hand = hand
@@ -1,18 +1,27 @@
 import random
 from itertools import product
 
-from models import GameStage, Player, Bid, Suit
+from models import Card, GameStage, Player, Bid, Suit
 from game import CoincheGame
 from game_rules import GameRules
 from ai.checkpoint import CheckpointManager
+from ai.encoding import action_to_index
 from ai.metrics import EpisodeMetrics, MetricsTracker
 from ai.models import CoincheAgent
 from ai.training import CoincheTrainer
 from ai.monitoring import NetworkMonitor
-from ai.utils import Experience, calculate_reward
+from ai.scheduler import TrainingScheduler
+from ai.symmetry import encode_decision
+from ai.utils import MmapReplayBuffer, NStepAccumulator, calculate_reward
 
 
-def main():
+def main(
+    shared_policy: bool = False,
+    n_step: int = 5,
+    replay_ratio: float | None = 8.0,
+    num_episodes: int = 1000,
+    save_frequency: int = 50,
+):
     # Initialize game and AI agents
     players = [Player(id=i, name=f"Player {i}", team=i % 2) for i in range(4)]
     game = CoincheGame()
@@ -21,24 +30,63 @@ def main():
     for player in players:
         game.add_player(player)
 
-    # Create AI agents for each player
-    agents = {i: CoincheAgent() for i in range(len(game.players))}
-    trainers = {i: CoincheTrainer(agent) for i, agent in agents.items()}
+    # Create AI agents for each player, or one agent serving every seat
+    if shared_policy:
+        shared_agent = CoincheAgent(relative_seats=True)
+        shared_trainer = CoincheTrainer(
+            shared_agent,
+            replay_buffer=MmapReplayBuffer(
+                "src/ai/replay/shared", relative_seats=True
+            ),
+        )
+        agents = {i: shared_agent for i in range(len(game.players))}
+        trainers = {i: shared_trainer for i in range(len(game.players))}
+    else:
+        agents = {i: CoincheAgent() for i in range(len(game.players))}
+        trainers = {
+            i: CoincheTrainer(
+                agent, replay_buffer=MmapReplayBuffer(f"src/ai/replay/agent_{i}")
+            )
+            for i, agent in agents.items()
+        }
+    # Seats owning a distinct agent and trainer
+    learner_seats = [0] if shared_policy else list(agents)
+    # Shared and per-seat networks differ in shape, so are saved apart
+    checkpoint_names = {
+        i: "shared" if shared_policy else f"agent_{i}" for i in learner_seats
+    }
+    # Stream each seat's decisions into n-step transitions for its trainer
+    accumulators = {
+        i: NStepAccumulator(trainers[i].replay_buffer, n_step, trainers[i].gamma)
+        for i in agents
+    }
+    # Gradient steps follow the amount of experience collected
+    schedulers = {
+        i: TrainingScheduler(trainers[i], replay_ratio=replay_ratio)
+        for i in learner_seats
+    }
     metrics_tracker = MetricsTracker()
     checkpoint_manager = CheckpointManager()
+    start_episode = 0
     try:
-        for agent in agents.values():
-            checkpoint_manager.load_checkpoint(agent)
+        for i in learner_seats:
+            state = checkpoint_manager.load_training_state(
+                trainers[i], name=checkpoint_names[i]
+            )
+            if "scheduler" in state:
+                schedulers[i].load_state_dict(state["scheduler"])
+            start_episode = state["episode"] + 1
+        # Drop metrics recorded after the checkpoint, then read the recent ones
+        metrics_tracker.truncate(
+            state.get("metrics_position", metrics_tracker.position)
+        )
         metrics_tracker.load_metrics()
         print("Resumed from previous checkpoint")
     except FileNotFoundError:
         print("Starting new training session")
-    # Training loop
 
     # Training loop
-    num_episodes = 1000
-    save_frequency = 50  # Save every 50 episodes
-    for episode in range(num_episodes):
+    for episode in range(start_episode, num_episodes):
         print(f"Episode {episode + 1}")
         episode_rewards = {i: 0.0 for i in range(4)}
         contracts_won = 0
@@ -59,8 +107,13 @@ def main():
                         bid = choose_random_bid(i1, game)
                     else:
                         bid = agents[i1].select_bid(game, i1)
+                    record_decision(accumulators[i1], game, i1, bid, agents[i1])
                     if bid.is_pass:
                         game.pass_bid(player)
+                        # Everybody passed and the cards were dealt again
+                        if not game.bids:
+                            for i4, accumulator in accumulators.items():
+                                accumulator.end(i4)
                     else:
                         game.place_bid(bid)
                     if game.phase == GameStage.GAME:  # type: ignore
@@ -70,30 +123,25 @@ def main():
                 continue
 
             for _ in range(8):  # 8 tricks
-                old_game = CoincheGame(**game.__dict__)
-                for i2 in range(4):  # 4 players per trick
+                for _ in range(4):  # 4 players per trick
                     current_player = game.current_player
                     player = game.get_current_player()
-                    # Generate random to compare AI
-                    card = agents[i2].select_card(game, current_player)
+                    agent = agents[current_player]
+                    card = agent.select_card(game, current_player)
+                    record_decision(
+                        accumulators[current_player], game, current_player, card, agent
+                    )
                     game.play_card(player, card)
 
                     # Store experience
                 if len(game.tricks) == 0:
                     break
                 for i3, _ in enumerate(game.players):
-                    card = game.tricks[-1][i3]
                     reward = calculate_reward(game, i3)
-
-                    trainers[i3].replay_buffer.push(
-                        Experience(
-                            game=old_game,
-                            action=card,
-                            reward=reward,
-                            next_game=game,
-                        )
-                    )
+                    accumulators[i3].reward(i3, reward)
                     episode_rewards[i3] += reward
+            for i4, accumulator in accumulators.items():
+                accumulator.end(i4)
             if len(game.tricks) == 0:
                 continue
             attack_points = game.logs[-1].attack_points
@@ -110,11 +158,11 @@ def main():
                 contracts_lost += 1
 
             # Update networks
-            for trainer in trainers.values():
-                trainer.update_networks()
+            for i in learner_seats:
+                schedulers[i].step()
                 # input()
             # Store experience
-            for agent in agents.values():
+            for agent in (agents[i] for i in learner_seats):
                 stats = monitor.update(agent.state_encoder)
                 stats.update(vars(agent.bidding_network))
                 stats.update(vars(agent.card_play_network))
@@ -140,18 +188,57 @@ def main():
 
             game.new_game()
 
+        for i in learner_seats:
+            throughput = schedulers[i].report()
+            print(
+                f"Agent {i}: {throughput['samples_per_sec']:.0f} samples/s, "
+                f"{throughput['updates_per_sec']:.1f} updates/s"
+            )
+
         # Save checkpoints and metrics periodically
         if (episode + 1) % save_frequency == 0:
             metrics_tracker.save_metrics()
             metrics_tracker.plot_metrics(
                 f"src/ai/training_metrics/episode_{episode+1}_plot.png"
             )
-            for i5, agent in agents.items():
+            for i5 in learner_seats:
+                # The checkpoint writer flushes the replay up to the saved size
                 checkpoint_manager.save_checkpoint(
-                    agent, episode, {"rewards": episode_rewards[i5]}
+                    agents[i5],
+                    episode,
+                    {"rewards": episode_rewards[i5]},
+                    name=checkpoint_names[i5],
+                    trainer=trainers[i5],
+                    state={
+                        "scheduler": schedulers[i5].state_dict(),
+                        "metrics_position": metrics_tracker.position,
+                    },
                 )
             print(f"Saved checkpoint at episode {episode + 1}")
 
+    # Let the last checkpoints and metrics reach the disk
+    checkpoint_manager.close()
+    metrics_tracker.close()
+    monitor.close()
+
+
+def record_decision(
+    accumulator: NStepAccumulator,
+    game: CoincheGame,
+    player_id: int,
+    action: Card | Bid,
+    agent: CoincheAgent,
+):
+    """Feed the state a decision was taken in to the seat's n-step accumulator."""
+    state, action_index, mask = encode_decision(
+        game,
+        player_id,
+        action_to_index(action),
+        agent.relative_seats,
+        agent.canonical_suits,
+    )
+    accumulator.observe(player_id, state, action_index, isinstance(action, Card), mask)
+
 
 def choose_random_bid(player_id: int, game: CoincheGame) -> Bid:
     bids_possible = [
@@ -0,0 +1,31 @@
+from typing import Callable
+
+import numpy as np
+import pytest
+
+from ai.encoding import NUM_BID_ACTIONS, STATE_DIM
+from ai.utils import CompactReplayBuffer, Transition
+
+
+def make_filled_buffer(size: int = 64) -> CompactReplayBuffer:
+    rng = np.random.default_rng(0)
+    buffer = CompactReplayBuffer(capacity=size, seed=0)
+    for i in range(size):
+        buffer.push_transition(
+            Transition(
+                state=rng.integers(0, 2, STATE_DIM).astype(np.float32),
+                action=int(rng.integers(0, 32)),
+                reward=float(rng.normal()),
+                next_state=rng.integers(0, 2, STATE_DIM).astype(np.float32),
+                done=i % 8 == 7,
+                is_card=i % 4 != 0,
+                next_mask=rng.integers(0, 2, NUM_BID_ACTIONS).astype(np.bool_),
+            )
+        )
+    return buffer
+
+
+@pytest.fixture
+def filled_buffer() -> Callable[..., CompactReplayBuffer]:
+    """Builds replay buffers of random transitions, the same ones every call."""
+    return make_filled_buffer
@@ -0,0 +1,165 @@
+import threading
+
+import pytest
+import torch
+
+from ai.checkpoint import CheckpointManager
+from ai.models import CoincheAgent
+from ai.training import CoincheTrainer
+from ai.utils import MmapReplayBuffer
+
+
+def test_checkpoints_rotate_per_agent(tmp_path):
+    manager = CheckpointManager(str(tmp_path), keep_last=2, keep_every=10)
+    agents = [CoincheAgent(device="cpu") for _ in range(2)]
+    for episode in range(0, 30, 5):
+        for i, agent in enumerate(agents):
+            manager.save_checkpoint(agent, episode, {"episode": episode}, f"agent_{i}")
+    manager.wait()
+
+    for i in range(2):
+        names = sorted(p.name for p in (tmp_path / f"agent_{i}").glob("*.pt"))
+        assert names == [
+            "checkpoint_ep0.pt",
+            "checkpoint_ep10.pt",
+            "checkpoint_ep20.pt",
+            "checkpoint_ep25.pt",
+        ]
+
+    restored = CoincheAgent(device="cpu")
+    metrics = manager.load_checkpoint(restored, name="agent_1")
+    manager.close()
+    assert metrics == {"episode": 25}
+    for source, target in zip(
+        agents[1].state_encoder.state_dict().values(),
+        restored.state_encoder.state_dict().values(),
+    ):
+        assert torch.equal(source, target)
+
+
+def test_training_state_resumes(tmp_path, filled_buffer):
+    agent = CoincheAgent(device="cpu")
+    buffer = MmapReplayBuffer(str(tmp_path / "replay"), capacity=64, segment_size=32)
+    buffer.push_records(filled_buffer().data)
+    trainer = CoincheTrainer(agent, batch_size=32, replay_buffer=buffer, fused=True)
+    for _ in range(3):
+        trainer.update_networks()
+        trainer.step_schedulers()
+
+    manager = CheckpointManager(str(tmp_path / "checkpoints"))
+    manager.save_checkpoint(agent, 7, trainer=trainer, state={"metrics_position": 4})
+    manager.wait()
+    expected = (trainer.rng.random(), torch.rand(1), buffer.rng.random())
+
+    reopened = MmapReplayBuffer(str(tmp_path / "replay"), capacity=64, segment_size=32)
+    resumed = CoincheTrainer(
+        CoincheAgent(device="cpu"), batch_size=32, replay_buffer=reopened, fused=True
+    )
+    state = manager.load_training_state(resumed)
+    manager.close()
+
+    assert state["episode"] == 7 and state["metrics_position"] == 4
+    assert len(reopened) == len(buffer)
+    assert resumed.scheduler.last_epoch == 3
+    for name, value in trainer.optimizer.state_dict()["state"][0].items():
+        assert torch.equal(value, resumed.optimizer.state_dict()["state"][0][name])
+    assert (resumed.rng.random(), torch.rand(1), reopened.rng.random()) == expected
+
+
+def test_replay_is_flushed_by_the_writer(tmp_path, filled_buffer):
+    records = filled_buffer().data
+    buffer = MmapReplayBuffer(
+        str(tmp_path / "replay"), capacity=64, segment_size=32, flush_interval=1000
+    )
+    buffer.push_records(records[:40])
+    trainer = CoincheTrainer(CoincheAgent(device="cpu"), replay_buffer=buffer)
+    threads = []
+    flush = buffer.flush
+
+    def recording_flush(*args):
+        threads.append(threading.current_thread())
+        flush(*args)
+
+    buffer.flush = recording_flush  # type: ignore
+    manager = CheckpointManager(str(tmp_path / "checkpoints"))
+    manager.save_checkpoint(trainer.agent, 1, trainer=trainer)
+    # Pushed after the save, not published by the checkpoint's index
+    buffer.push_records(records[40:])
+    manager.close()
+
+    assert threads and threading.main_thread() not in threads
+    reopened = MmapReplayBuffer(str(tmp_path / "replay"), capacity=64, segment_size=32)
+    assert len(reopened) == 40
+
+
+def test_manifest_tracks_saved_checkpoints(tmp_path):
+    manager = CheckpointManager(str(tmp_path), keep_last=2)
+    agent = CoincheAgent(device="cpu")
+    for episode in range(3):
+        manager.save_checkpoint(agent, episode, {"reward": float(episode)}, "agent_0")
+    manifest = manager.manifest("agent_0")
+
+    assert manifest["latest"] == 2
+    assert sorted(manifest["checkpoints"]) == ["1", "2"]
+    entry = manifest["checkpoints"]["2"]
+    assert entry["size"] == (tmp_path / "agent_0" / entry["file"]).stat().st_size
+    assert manager.load_checkpoint(agent, name="agent_0", verify=True) == {
+        "reward": 2.0
+    }
+
+    with open(tmp_path / "agent_0" / entry["file"], "r+b") as f:
+        last = f.seek(-1, 2)
+        flipped = f.read(1)[0] ^ 0xFF
+        f.seek(last)
+        f.write(bytes([flipped]))
+    with pytest.raises(ValueError):
+        manager.load_checkpoint(agent, name="agent_0", verify=True)
+    manager.close()
+
+
+def test_dedup_checkpoints_share_blobs(tmp_path, filled_buffer):
+    manager = CheckpointManager(str(tmp_path), keep_last=1, dedup=True)
+    agent = CoincheAgent(device="cpu")
+    twin = CoincheAgent(device="cpu")
+    twin.state_encoder.load_state_dict(agent.state_encoder.state_dict())
+    twin.bidding_network.load_state_dict(agent.bidding_network.state_dict())
+    twin.card_play_network.load_state_dict(agent.card_play_network.state_dict())
+    trainer = CoincheTrainer(agent, batch_size=32, replay_buffer=filled_buffer())
+    trainer.update_networks()
+
+    manager.save_checkpoint(twin, 0, name="agent_1")
+    manager.save_checkpoint(agent, 0, name="agent_0", trainer=trainer)
+    manager.wait()
+    blobs = {path: path.read_bytes() for path in (tmp_path / "blobs").glob("*/*")}
+
+    # Unchanged weights are not written again, replaced ones are collected
+    manager.save_checkpoint(twin, 1, name="agent_1")
+    manager.wait()
+    assert set((tmp_path / "blobs").glob("*/*")) == set(blobs)
+    old_weight = twin.state_encoder.fc1.weight.detach().numpy().tobytes()
+    torch.nn.init.zeros_(twin.state_encoder.fc1.weight)
+    manager.save_checkpoint(twin, 2, name="agent_1")
+    manager.wait()
+    current = set((tmp_path / "blobs").glob("*/*"))
+    assert len(current - set(blobs)) == 1
+    # Only the retired checkpoint referred to the previous fc1 weights
+    (collected,) = set(blobs) - current
+    assert blobs[collected] == old_weight
+
+    resumed = CoincheTrainer(CoincheAgent(device="cpu"), replay_buffer=filled_buffer())
+    manager.load_training_state(resumed, name="agent_0")
+    restored = CoincheAgent(device="cpu")
+    manager.load_checkpoint(restored, name="agent_1")
+    manager.close()
+    assert not restored.state_encoder.fc1.weight.any()
+    for name, value in trainer.encoder_optimizer.state_dict()["state"][0].items():
+        assert torch.equal(value, resumed.encoder_optimizer.state_dict()["state"][0][name])
+
+
+def test_plain_checkpoints_have_no_blob_store(tmp_path):
+    manager = CheckpointManager(str(tmp_path), keep_last=1)
+    for episode in range(2):
+        manager.save_checkpoint(CoincheAgent(device="cpu"), episode)
+    manager.close()
+    assert manager.store is None
+    assert not (tmp_path / "blobs").exists()
@@ -0,0 +1,81 @@
+import random
+
+import torch
+
+from ai.distributed import ActorLearner, ActorLearnerConfig, new_game, play_deal
+from ai.models import CoincheAgent
+from ai.shared_weights import SharedWeights
+from ai.utils import CompactReplayBuffer, NStepAccumulator
+
+
+def test_play_deal_records_every_decision():
+    agent = CoincheAgent(device="cpu", relative_seats=True)
+    buffer = CompactReplayBuffer(capacity=256, relative_seats=True)
+    game = new_game()
+
+    accumulator = NStepAccumulator(buffer, n=3)
+    play_deal(game, agent, accumulator, epsilon=0.5, rng=random.Random(0))
+
+    records = buffer.data[: len(buffer)]
+    # 32 cards were played and every seat ended the deal on a terminal step
+    assert records["is_card"].sum() == 32
+    assert (~records["is_card"]).sum() >= 4
+    assert records["done"].sum() >= 4
+    assert game.logs and len(game.tricks) == 0
+
+
+def test_shared_weights_are_viewed_by_attached_agents():
+    source = CoincheAgent(device="cpu", relative_seats=True)
+    target = CoincheAgent(device="cpu", relative_seats=True)
+    weights = SharedWeights(source)
+    assert weights.version == 1
+
+    weights.attach(target)
+    source_state = source.bidding_network.state_dict()
+    for name, tensor in target.bidding_network.state_dict().items():
+        if tensor.is_floating_point():
+            assert torch.equal(tensor, source_state[name])
+
+    with torch.no_grad():
+        for p in source.card_play_network.parameters():
+            p.add_(1.0)
+    weights.publish(source)
+    # Published weights are seen without copying them into the target
+    assert weights.version == 2
+    shared = weights.flat.untyped_storage().data_ptr()
+    for a, b in zip(
+        source.card_play_network.parameters(), target.card_play_network.parameters()
+    ):
+        assert torch.equal(a, b)
+        assert b.untyped_storage().data_ptr() == shared
+
+    # A read a publish overlapped runs again on the new weights
+    calls = []
+
+    def infer() -> int:
+        calls.append(weights.version)
+        if len(calls) == 1:
+            weights.publish(source)
+        return len(calls)
+
+    assert weights.read(infer) == 2
+    assert calls == [2, 3]
+
+
+def test_actor_learner_trains_on_actor_transitions():
+    learner = ActorLearner(
+        ActorLearnerConfig(
+            num_actors=1,
+            total_updates=4,
+            weight_sync_interval=2,
+            batch_size=16,
+            replay_capacity=1024,
+            warmup=64,
+        )
+    )
+    stats = learner.run()
+
+    assert learner.deals > 0 and stats["transitions"] >= 64
+    assert learner.updates == 4
+    # Published after the second and the fourth update
+    assert learner.weights.version == 3
@@ -0,0 +1,127 @@
+import random
+
+import numpy as np
+
+from models import GameStage
+from ai.encoding import BID_POINTS, action_to_index
+from ai.envs import (
+    NUM_ACTIONS,
+    PASS_ACTION,
+    HeuristicPolicy,
+    RandomPolicy,
+    SingleSeatEnv,
+    SnapshotPolicy,
+    SubprocVectorEnv,
+    VectorEnv,
+    action_mask,
+    encode_action,
+)
+from ai.envs.actions import apply_action, decode_action, new_game
+from ai.models import CoincheAgent
+from ai.runtime import export_weights
+from ai.symmetry import encode_view
+
+
+def random_actions(rng: np.random.Generator, masks: np.ndarray) -> np.ndarray:
+    return np.array([rng.choice(np.flatnonzero(mask)) for mask in masks])
+
+
+def test_actions_round_trip():
+    game = new_game()
+    bids = np.flatnonzero(action_mask(game, 0))
+    assert bids.tolist() == [PASS_ACTION, *BID_POINTS]
+    for action in bids:
+        assert encode_action(decode_action(game, 0, action)) == action
+
+    apply_action(game, 80)
+    for _ in range(3):
+        apply_action(game, PASS_ACTION)
+    assert game.phase == GameStage.GAME
+    player = game.current_player
+    for action in np.flatnonzero(action_mask(game, player)):
+        card = decode_action(game, player, action)
+        assert encode_action(card) == action_to_index(card) == action
+
+
+def test_vector_env_seeds_its_own_decks():
+    state = random.getstate()
+    hands = [
+        [list(player.hand) for player in VectorEnv(2, seed=7).games[1].players]
+        for _ in range(2)
+    ]
+    assert hands[0] == hands[1]
+    assert random.getstate() == state
+
+
+def test_vector_env_auto_resets():
+    env = VectorEnv(4, relative_seats=True, seed=0)
+    rng = np.random.default_rng(0)
+    step = env.reset()
+    assert step.observations.shape == (4, env.observation_dim)
+    assert step.masks.shape == (4, NUM_ACTIONS)
+
+    dones = 0
+    for _ in range(400):
+        step = env.step(random_actions(rng, step.masks))
+        dones += int(step.dones.sum())
+        assert step.masks.any(axis=1).all()
+    assert dones == env.deals + env.redeals
+    assert env.deals > 0
+
+
+def test_subprocess_env_matches_shards():
+    with SubprocVectorEnv(3, num_workers=2, seed=0) as env:
+        step = env.reset()
+        assert step.observations.shape == (3, env.observation_dim)
+        step = env.step(random_actions(np.random.default_rng(0), step.masks))
+        assert step.rewards.shape == (3, 4)
+
+
+def test_single_seat_env_waits_on_the_learner(tmp_path):
+    agent = CoincheAgent(device="cpu")
+    export_weights(agent, tmp_path / "snapshot.bin")
+    opponents = {
+        1: HeuristicPolicy(),
+        2: SnapshotPolicy(tmp_path / "snapshot.bin"),
+        3: HeuristicPolicy(),
+    }
+    env = SingleSeatEnv(3, opponents=opponents, seat=0)
+    rng = np.random.default_rng(0)
+    step = env.reset()
+
+    deals = 0
+    for _ in range(200):
+        assert all(game.current_player == 0 for game in env.games)
+        step = env.step(random_actions(rng, step.masks))
+        deals += int(step.dones.sum())
+    assert step.rewards.shape == (3,)
+    assert deals > 0
+
+
+def test_single_seat_env_plays_through_redeals():
+    env = SingleSeatEnv(2, opponents=RandomPolicy(pass_probability=1.0), seat=0)
+    step = env.reset()
+    assert step.masks[:, PASS_ACTION].all()
+
+    # Everybody passes, the cards are dealt again and the learner bids anew
+    step = env.step(np.full(2, PASS_ACTION))
+    assert env.redeals == 2
+    assert not step.dones.any()
+    for game in env.games:
+        assert game.current_player == 0 and game.bids == []
+    assert step.masks[:, PASS_ACTION].all()
+
+
+def test_canonical_env_matches_the_agent_view():
+    env = VectorEnv(3, seed=0, canonical_suits=True)
+    rng = np.random.default_rng(0)
+    step = env.reset()
+    for _ in range(200):
+        for game, player, observation in zip(
+            env.games, step.players, step.observations
+        ):
+            state, _ = encode_view(game, player, canonical_suits=True)
+            assert np.array_equal(observation, state)
+        # Canonical card actions are mapped back to cards in hand
+        step = env.step(random_actions(rng, step.masks))
+    assert env.deals > 0
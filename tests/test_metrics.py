@@ -0,0 +1,107 @@
+import numpy as np
+
+from ai.metrics import BucketedSeries, EpisodeMetrics, MetricsTracker
+from ai.metrics_log import MetricsLog
+
+
+def record(episode: int, step: int = 0) -> dict:
+    return {"episode": episode, "step": step}
+
+
+def test_metrics_log_reads_ranges_and_tail(tmp_path):
+    log = MetricsLog(tmp_path / "metrics.jsonl", buffer_size=7, index_stride=4)
+    for episode in range(50):
+        for step in range(3):
+            log.append(record(episode, step))
+
+    assert log.tail(4) == [record(48, 2), record(49, 0), record(49, 1), record(49, 2)]
+    assert log.read(10, 11) == [record(e, s) for e in (10, 11) for s in range(3)]
+    assert len(log.read()) == 150
+    log.close()
+
+    # A crash in the middle of a record
+    with open(tmp_path / "metrics.jsonl", "ab") as f:
+        f.write(b'{"episode": 5')
+    log = MetricsLog(tmp_path / "metrics.jsonl", index_stride=4)
+    assert log.count == 150
+    log.truncate(100)
+    assert log.tail(1) == [record(33, 0)]
+    log.append(record(33, 1))
+    assert log.read(33) == [record(33, 0), record(33, 1)]
+    log.close()
+    assert MetricsLog(tmp_path / "metrics.jsonl", index_stride=4).count == 101
+
+
+def test_metrics_tracker_resumes_from_log(tmp_path):
+    tracker = MetricsTracker(str(tmp_path))
+    for episode in range(10):
+        tracker.add_episode_metrics(
+            EpisodeMetrics(episode, {0: 1.0, 1: -1.0}, 0.0, 0.5, 80.0, 1, 1)
+        )
+    tracker.save_metrics()
+    position = tracker.position
+    tracker.add_episode_metrics(EpisodeMetrics(10, {}, 0.0, 0.0, 0.0, 0, 0))
+    tracker.close()
+
+    tracker = MetricsTracker(str(tmp_path))
+    tracker.load_metrics()
+    tracker.truncate(position)
+    assert [m.episode for m in tracker.metrics] == list(range(10))
+    tracker.load_metrics(last=3)
+    assert [m.episode for m in tracker.metrics] == [7, 8, 9]
+    # The summary covers the whole log, not only the loaded metrics
+    assert len(tracker.summary.total_reward.buckets) == 10
+    tracker.plot_metrics(str(tmp_path / "plot.png"))
+    assert (tmp_path / "plot.png").exists()
+    tracker.close()
+
+
+def test_bucketed_series_stays_bounded():
+    series = BucketedSeries(max_buckets=8)
+    values = np.sin(np.arange(1000) / 50)
+    for x, y in enumerate(values):
+        series.add(x, y)
+
+    x, mean, low, high = series.arrays()
+    assert len(series.buckets) <= 8 and series.width == 128
+    assert sum(bucket[0] for bucket in series.buckets) == 1000
+    assert np.isclose(mean[0], values[:128].mean())
+    assert low[0] == values[:128].min() and high[0] == values[:128].max()
+    assert x[-1] == np.arange(896, 1000).mean()
+
+
+def test_metrics_tracker_memory_is_bounded(tmp_path):
+    tracker = MetricsTracker(str(tmp_path), window=4)
+    for episode in range(10):
+        tracker.add_episode_metrics(
+            EpisodeMetrics(episode, {0: float(episode)}, 0.0, 0.5, 80.0, 1, 1)
+        )
+    assert [m.episode for m in tracker.metrics] == [6, 7, 8, 9]
+    tracker.save_metrics()
+    for episode in range(10, 12):
+        tracker.add_episode_metrics(EpisodeMetrics(episode, {}, 1.0, 0.0, 0.0, 0, 0))
+    expected = tracker.summary.state_dict()
+    tracker.close()
+
+    tracker = MetricsTracker(str(tmp_path), window=4)
+    starts = []
+    records_after = tracker.log.records_after
+
+    def recording_records_after(count: int):
+        starts.append(count)
+        return records_after(count)
+
+    tracker.log.records_after = recording_records_after  # type: ignore
+    tracker.load_metrics()
+    # Only the records logged after the saved summary are read again
+    assert starts == [10]
+    assert tracker.summary.state_dict() == expected
+    assert [m.episode for m in tracker.metrics] == [8, 9, 10, 11]
+
+    # Truncating below the saved summary rebuilds it from the log
+    tracker.truncate(5)
+    assert starts[-1] == 0
+    assert len(tracker.summary.total_reward.buckets) == 5
+    tracker.load_metrics()
+    assert [m.episode for m in tracker.metrics] == [1, 2, 3, 4]
+    tracker.close()
@@ -0,0 +1,86 @@
+import pytest
+import torch
+
+from ai.monitoring import NetworkMonitor, ParameterStats, StatsStore
+
+
+def test_parameter_stats_memory_is_bounded(tmp_path):
+    torch.manual_seed(0)
+    model = torch.nn.Linear(4, 2)
+    stats = ParameterStats(str(tmp_path), capacity=8, chunk_size=5)
+    for step in range(1, 24):
+        with torch.no_grad():
+            # One unusually large update
+            scale = 0.5 if step == 20 else 1e-3
+            model.weight.add_(scale * torch.randn_like(model.weight))
+        stats.update_stats(model)
+
+    assert len(stats.history["weight"]) == 8
+    assert [s.mean for s in stats.history["weight"]][-1] == pytest.approx(
+        model.weight.mean().item()
+    )
+    anomalies = stats.detect_anomalies()
+    assert [a["step"] for a in anomalies["weight"]] == [20]
+    assert stats.detect_anomalies() == {}
+
+    # Every step reaches the disk in chunks
+    stats.flush()
+    steps, rows = stats.load_history("weight")
+    assert list(steps) == list(range(1, 24))
+    assert rows[-1, 0] == stats.history["weight"][-1].mean
+
+
+def test_fused_stats_match_host_stats(tmp_path):
+    torch.manual_seed(0)
+    model = torch.nn.Sequential(torch.nn.Linear(4, 8), torch.nn.Linear(8, 2))
+    fused = ParameterStats(str(tmp_path / "fused"))
+    host = ParameterStats(str(tmp_path / "host"), fused=False)
+    for step in range(3):
+        model(torch.randn(16, 4)).sum().backward()
+        with torch.no_grad():
+            model[0].weight.add_(0.01 * torch.randn_like(model[0].weight))
+        expected = host.update_stats(model)
+        for name, stats in fused.update_stats(model).items():
+            assert list(vars(stats).values()) == pytest.approx(
+                list(vars(expected[name]).values()), rel=1e-5, abs=1e-7
+            )
+        model.zero_grad(set_to_none=True)
+        # The parameters are reduced in the shadow, allocated once
+        if step == 0:
+            shadow = fused.shadow.flat.data_ptr()
+        assert fused.shadow.flat.data_ptr() == shadow
+    assert fused.shadow.flat.numel() == sum(p.numel() for p in model.parameters())
+    assert stats.update_rate == 0.0
+    assert fused.history["0.weight"][-1].update_rate > 0
+
+
+def test_monitor_drops_oldest_snapshots_in_background(tmp_path):
+    model = torch.nn.Linear(4, 2)
+    monitor = NetworkMonitor(
+        str(tmp_path), visualization_interval=20, stats_interval=5, queue_size=4
+    )
+    model.bias.grad = torch.zeros_like(model.bias)
+    # Hold the worker back so the queue fills up
+    with monitor._condition:
+        for _ in range(10):
+            stats = monitor.update(model)
+        assert monitor.dropped == 6
+    assert set(stats) == {"weight", "bias"}
+    monitor.wait()
+    for _ in range(10):
+        monitor.update(model)
+    monitor.wait()
+    monitor.close()
+
+    # Steps 7 to 10 survived the first burst
+    assert monitor.stats.history["weight"].total + monitor.dropped == 20
+    assert (tmp_path / "plots" / "grad_flow_20.png").exists()
+
+    store = StatsStore(tmp_path / "stats" / "stats.sqlite")
+    steps, rows = store.query("weight", 5, 10)
+    assert list(steps) == [7, 8, 9, 10]
+    assert rows[-1, 0] == pytest.approx(model.weight.mean().item())
+    anomalies = store.anomalies("bias", 10, 10)
+    assert [(a["step"], a["type"]) for a in anomalies] == [(10, "vanishing_gradient")]
+    assert store.anomalies("weight") == []
+    store.close()
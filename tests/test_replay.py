@@ -0,0 +1,286 @@
+import numpy as np
+import pytest
+import torch
+
+from game import CoincheGame
+from models import Bid, Player, Suit
+from ai.encoding import NUM_BID_ACTIONS, STATE_DIM, card_to_index
+from ai.models import CoincheAgent
+from ai.symmetry import encode_view
+from ai.training import CoincheTrainer
+from ai.utils import (
+    CompactReplayBuffer,
+    Experience,
+    MmapReplayBuffer,
+    NStepAccumulator,
+    PrioritizedReplayBuffer,
+    SumTree,
+    Transition,
+    encode_experience,
+)
+from ai.utils.compact_replay import unpack_records
+
+
+def init_game_in_play() -> CoincheGame:
+    game = CoincheGame()
+    for i in range(4):
+        game.add_player(Player(id=i, name=str(i), team=i % 2))
+    game.place_bid(Bid(player=0, points=80, suit=Suit.HEARTS))
+    game.end_bidding()
+    return game
+
+
+def random_transition(i: int) -> Transition:
+    rng = np.random.default_rng(i)
+    return Transition(
+        state=rng.integers(0, 2, STATE_DIM).astype(np.float32),
+        action=i % 32,
+        reward=float(i),
+        next_state=rng.integers(0, 2, STATE_DIM).astype(np.float32),
+        done=i % 3 == 0,
+        is_card=i % 2 == 0,
+        next_mask=rng.integers(0, 2, NUM_BID_ACTIONS).astype(np.bool_),
+    )
+
+
+def test_compact_buffer_round_trip():
+    buffer = CompactReplayBuffer(capacity=8)
+    transitions = [random_transition(i) for i in range(8)]
+    for t in transitions:
+        buffer.push_transition(t)
+
+    batch = buffer.sample(16)
+    assert batch.indices is not None
+    for row, index in enumerate(batch.indices):
+        t = transitions[index]
+        np.testing.assert_array_equal(batch.states[row].numpy(), t.state)
+        np.testing.assert_array_equal(batch.next_states[row].numpy(), t.next_state)
+        np.testing.assert_array_equal(batch.next_masks[row].numpy(), t.next_mask)
+        assert batch.actions[row] == t.action
+        assert batch.rewards[row] == t.reward
+        assert batch.dones[row] == t.done
+        assert batch.is_card[row] == t.is_card
+
+
+def test_compact_buffer_wraps_around():
+    buffer = CompactReplayBuffer(capacity=4)
+    source = CompactReplayBuffer(capacity=6)
+    for i in range(6):
+        source.push_transition(random_transition(i))
+
+    buffer.push_records(source.data)
+    assert len(buffer) == 4
+    assert buffer.position == 2
+    assert sorted(buffer.data["reward"].tolist()) == [2.0, 3.0, 4.0, 5.0]
+
+
+def test_trainer_updates_from_compact_buffer():
+    game = init_game_in_play()
+    agent = CoincheAgent(device="cpu")
+    buffer = CompactReplayBuffer(capacity=64)
+    trainer = CoincheTrainer(agent, batch_size=8, replay_buffer=buffer)
+    card = agent.select_card(game, 0)
+    for _ in range(8):
+        buffer.push(Experience(game=game, action=card, reward=1.0, next_game=game))
+
+    before = [p.clone() for p in agent.card_play_network.parameters()]
+    trainer.update_networks()
+    after = list(agent.card_play_network.parameters())
+    assert any(not torch.equal(b, a) for b, a in zip(before, after))
+
+
+def test_encode_experience_masks_legal_cards():
+    game = init_game_in_play()
+    card = game.players[0].hand[0]
+    transition = encode_experience(
+        Experience(game=game, action=card, reward=0.0, next_game=game, player_id=0)
+    )
+    assert transition.is_card
+    assert transition.next_mask.sum() == 8
+
+
+def test_canonical_agent_replays_its_own_view():
+    game = init_game_in_play()
+    state, card_perm = encode_view(game, 0, canonical_suits=True)
+    # A deal whose canonical labelling differs from the real one
+    while np.array_equal(card_perm, np.arange(32)):
+        game = init_game_in_play()
+        state, card_perm = encode_view(game, 0, canonical_suits=True)
+    agent = CoincheAgent(device="cpu", canonical_suits=True)
+    card = agent.select_card(game, 0)
+    buffer = CompactReplayBuffer(capacity=8, canonical_suits=True)
+    buffer.push(Experience(game=game, action=card, reward=0.0, next_game=game))
+
+    batch = unpack_records(buffer.data[:1])
+    assert torch.equal(batch.states[0], torch.from_numpy(state))
+    assert batch.actions[0] == card_perm[card_to_index(card)]
+    assert batch.next_masks[0, batch.actions[0]]
+
+    with pytest.raises(ValueError):
+        CoincheTrainer(agent, replay_buffer=CompactReplayBuffer(capacity=8))
+
+
+def test_phase_samples_hold_each_phase_apart():
+    buffer = PrioritizedReplayBuffer(capacity=16, seed=0)
+    for i in range(16):
+        buffer.push_transition(random_transition(i))
+
+    batch = buffer.sample_phases(4, 12)
+    assert batch.weights is not None and len(batch.weights) == 16
+    assert batch.is_card.tolist() == [False] * 4 + [True] * 12
+    for row, index in enumerate(batch.indices):
+        assert batch.is_card[row] == (index % 2 == 0)
+
+    # Without bids in the buffer, the bid phase stays empty
+    buffer = CompactReplayBuffer(capacity=8)
+    for i in range(0, 16, 2):
+        buffer.push_transition(random_transition(i))
+    assert buffer.sample_phases(4, 4).is_card.tolist() == [True] * 4
+
+
+def test_mmap_buffer_reopens_flushed_records(tmp_path):
+    buffer = MmapReplayBuffer(str(tmp_path), capacity=8, segment_size=4)
+    for i in range(6):
+        buffer.push_transition(random_transition(i))
+    buffer.flush()
+    # Written after the last flush, so lost when reopening after a crash
+    buffer.push_transition(random_transition(6))
+
+    reopened = MmapReplayBuffer(str(tmp_path), capacity=8, segment_size=4)
+    assert len(reopened) == 6
+    assert reopened.position == 6
+    # Phases are read back from the segments for phase sampling
+    assert reopened.is_card[:6].tolist() == [i % 2 == 0 for i in range(6)]
+    batch = reopened.sample(32)
+    for row, index in enumerate(batch.indices):
+        assert batch.rewards[row] == float(index)
+        np.testing.assert_array_equal(
+            batch.states[row].numpy(), random_transition(int(index)).state
+        )
+
+
+def test_mmap_buffer_samples_contiguous_runs(tmp_path):
+    buffer = MmapReplayBuffer(str(tmp_path), capacity=16, segment_size=4, run_length=4)
+    for i in range(16):
+        buffer.push_transition(random_transition(i))
+    indices = buffer.sample_indices(8)
+    assert len(indices) == 8
+    assert all((indices[1:4] - indices[0]) % 16 == np.arange(1, 4))
+
+
+def test_sum_tree_find_and_update():
+    tree = SumTree(5)
+    tree.update(np.arange(5), np.array([1.0, 0.0, 2.0, 3.0, 4.0]))
+    assert tree.total == 10.0
+    values = np.array([0.0, 0.99, 1.0, 2.99, 3.0, 5.99, 6.0, 9.99])
+    np.testing.assert_array_equal(tree.find(values), [0, 0, 2, 2, 3, 3, 4, 4])
+
+    tree.update(np.array([0, 4]), np.array([0.0, 1.0]))
+    assert tree.total == 6.0
+    np.testing.assert_array_equal(tree.find(np.array([0.5, 5.5])), [2, 4])
+
+
+def test_prioritized_buffer_samples_by_priority():
+    buffer = PrioritizedReplayBuffer(capacity=8, alpha=1.0, eps=0.0, seed=0)
+    for i in range(8):
+        buffer.push_transition(random_transition(i))
+    buffer.update_priorities(np.arange(8), np.array([0.0] * 7 + [1.0]))
+
+    batch = buffer.sample(16)
+    assert batch.weights is not None
+    assert set(batch.indices.tolist()) == {7}
+    torch.testing.assert_close(batch.weights, torch.ones(16))
+
+
+def test_trainer_updates_priorities():
+    game = init_game_in_play()
+    agent = CoincheAgent(device="cpu")
+    buffer = PrioritizedReplayBuffer(capacity=64)
+    trainer = CoincheTrainer(agent, batch_size=8, replay_buffer=buffer)
+    card = agent.select_card(game, 0)
+    for _ in range(8):
+        buffer.push(Experience(game=game, action=card, reward=5.0, next_game=game))
+
+    trainer.update_networks()
+    assert not np.allclose(buffer.tree.priorities(np.arange(8)), 1.0)
+
+
+def test_n_step_accumulator_chains_decisions_per_seat():
+    buffer = CompactReplayBuffer(capacity=16)
+    accumulator = NStepAccumulator(buffer, n=2, gamma=0.5)
+    states = [np.full(STATE_DIM, i % 2, dtype=np.float32) for i in range(4)]
+    mask = np.ones(NUM_BID_ACTIONS, dtype=np.bool_)
+
+    accumulator.observe(0, states[0], 90, False, mask)
+    accumulator.observe(1, states[1], 80, False, mask)
+    accumulator.observe(0, states[1], 3, True, mask)
+    accumulator.reward(0, 4.0)
+    assert len(buffer) == 0
+    accumulator.observe(0, states[2], 5, True, mask)
+    accumulator.reward(0, 8.0)
+    # Seat 0 bid, reward 0 then 4 on its first card
+    assert len(buffer) == 1
+    accumulator.end(0)
+    accumulator.end(1)
+
+    records = buffer.data[: len(buffer)]
+    np.testing.assert_array_equal(records["action"], [90, 3, 5, 80])
+    np.testing.assert_array_equal(records["reward"], [2.0, 8.0, 8.0, 0.0])
+    np.testing.assert_array_equal(records["n_steps"], [2, 2, 1, 1])
+    np.testing.assert_array_equal(records["done"], [False, True, True, True])
+    np.testing.assert_array_equal(records["is_card"], [False, True, True, False])
+
+
+def test_n_step_window_spans_bids_and_cards():
+    buffer = CompactReplayBuffer(capacity=16)
+    accumulator = NStepAccumulator(buffer, n=3, gamma=0.5)
+    states = [np.full(STATE_DIM, i % 2, dtype=np.float32) for i in range(5)]
+    bid_mask = np.zeros(NUM_BID_ACTIONS, dtype=np.bool_)
+    bid_mask[[0, 90]] = True
+    card_mask = np.zeros(NUM_BID_ACTIONS, dtype=np.bool_)
+    card_mask[[3, 5]] = True
+
+    accumulator.observe(0, states[0], 90, False, bid_mask)
+    accumulator.observe(0, states[1], 3, True, card_mask)
+    accumulator.reward(0, 4.0)
+    accumulator.observe(0, states[2], 5, True, card_mask)
+    accumulator.reward(0, 8.0)
+    accumulator.observe(0, states[3], 7, True, card_mask)
+    accumulator.end(0)
+
+    records = buffer.data[: len(buffer)]
+    np.testing.assert_array_equal(records["action"], [90, 3, 5, 7])
+    np.testing.assert_array_equal(records["reward"], [0 + 2.0 + 2.0, 4.0 + 4.0, 8.0, 0.0])
+    np.testing.assert_array_equal(records["n_steps"], [3, 3, 2, 1])
+    np.testing.assert_array_equal(records["done"], [False, True, True, True])
+    # The bid bootstraps from the third card play, in the card phase
+    np.testing.assert_array_equal(records["is_card"], [False, True, True, True])
+    np.testing.assert_array_equal(records["next_is_card"][0], True)
+    np.testing.assert_array_equal(records["next_state"][0], np.packbits(states[3] > 0))
+
+
+def test_n_step_redeal_ends_open_windows():
+    buffer = CompactReplayBuffer(capacity=16)
+    accumulator = NStepAccumulator(buffer, n=5, gamma=0.5)
+    states = [np.full(STATE_DIM, i % 2, dtype=np.float32) for i in range(3)]
+    mask = np.zeros(NUM_BID_ACTIONS, dtype=np.bool_)
+    mask[[0, 80]] = True
+
+    # Everybody passes, the cards are dealt again mid-window
+    for seat in range(4):
+        accumulator.observe(seat, states[0], 0, False, mask)
+    for seat in range(4):
+        accumulator.end(seat)
+    assert len(buffer) == 4
+    records = buffer.data[:4]
+    np.testing.assert_array_equal(records["done"], [True] * 4)
+    np.testing.assert_array_equal(records["n_steps"], [1] * 4)
+
+    # Decisions of the new deal are not chained to the passes
+    accumulator.observe(0, states[1], 80, False, mask)
+    accumulator.observe(0, states[2], 3, True, mask)
+    accumulator.end(0)
+    records = buffer.data[4 : len(buffer)]
+    np.testing.assert_array_equal(records["action"], [80, 3])
+    np.testing.assert_array_equal(records["n_steps"], [2, 1])
+    np.testing.assert_array_equal(records["state"][0], np.packbits(states[1] > 0))
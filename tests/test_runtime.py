@@ -0,0 +1,75 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from game import CoincheGame
+from models import Bid, Player, Suit
+from ai.encoding import encode_game_state
+from ai.models import CoincheAgent
+from ai.runtime import NumpyAgent, export_weights
+
+
+def init_game_with_players():
+    game = CoincheGame()
+    for i in range(4):
+        game.add_player(Player(id=i, name=str(i), team=i % 2))
+    return game
+
+
+def trained_agent() -> CoincheAgent:
+    agent = CoincheAgent(device="cpu")
+    # Give BatchNorm non-trivial running statistics
+    for network in (agent.state_encoder, agent.bidding_network, agent.card_play_network):
+        for module in network.modules():
+            if isinstance(module, torch.nn.BatchNorm1d):
+                module.running_mean.uniform_(-0.5, 0.5)
+                module.running_var.uniform_(0.5, 2.0)
+                module.weight.data.uniform_(0.5, 1.5)
+                module.bias.data.uniform_(-0.1, 0.1)
+    return agent
+
+
+def test_numpy_forward_matches_torch(tmp_path):
+    agent = trained_agent()
+    path = tmp_path / "weights.bin"
+    export_weights(agent, path)
+    runtime = NumpyAgent(path)
+
+    states = np.random.randint(0, 2, size=(5, 96)).astype(np.float32)
+    for network in (agent.state_encoder, agent.bidding_network, agent.card_play_network):
+        network.eval()
+    with torch.no_grad():
+        features = agent.state_encoder(torch.from_numpy(states))
+        bid_probs = agent.bidding_network(features).numpy()
+        card_probs = agent.card_play_network(features).numpy()
+
+    np.testing.assert_allclose(runtime.encode(states), features.numpy(), atol=1e-5)
+    np.testing.assert_allclose(runtime.bid_probs(states), bid_probs, atol=1e-5)
+    np.testing.assert_allclose(runtime.card_probs(states), card_probs, atol=1e-5)
+
+
+def test_numpy_agent_selects_same_actions(tmp_path):
+    agent = trained_agent()
+    path = tmp_path / "weights.bin"
+    export_weights(agent, path)
+    runtime = NumpyAgent(path)
+
+    game = init_game_with_players()
+    assert runtime.select_bid(game, 0) == agent.select_bid(game, 0)
+    np.testing.assert_array_equal(
+        encode_game_state(game, 0), agent.encode_game_state(game, 0).detach().numpy()
+    )
+
+    game.place_bid(Bid(player=0, points=80, suit=Suit.HEARTS))
+    game.end_bidding()
+    assert runtime.select_card(game, 0) == agent.select_card(game, 0)
+
+
+def test_runtime_does_not_import_torch():
+    code = "import sys, ai.runtime; assert 'torch' not in sys.modules"
+    subprocess.run(
+        [sys.executable, "-c", code], check=True, cwd=Path(__file__).parents[1] / "src"
+    )
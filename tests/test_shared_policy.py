@@ -0,0 +1,54 @@
+import numpy as np
+import torch
+
+from models import Bid, Player, Suit
+from game import CoincheGame
+from ai.checkpoint import CheckpointManager
+from ai.encoding import encode_game_state, state_dim
+from main_ai import main
+
+
+def game_with_hands(hands: dict[int, list], bidder: int) -> CoincheGame:
+    game = CoincheGame()
+    for i in range(4):
+        game.add_player(Player(id=i, name=str(i), team=i % 2))
+    for player_id, hand in hands.items():
+        game.players[player_id].hand = hand
+    game.current_player = bidder
+    game.place_bid(Bid(player=bidder, points=80, suit=Suit.HEARTS))
+    return game
+
+
+def test_relative_encoding_matches_equivalent_seats():
+    hand = game_with_hands({}, 0).players[0].hand
+    # Seat 0 with the contract on its left, and seat 2 in the same spot
+    first = game_with_hands({0: hand}, bidder=1)
+    second = game_with_hands({2: hand}, bidder=3)
+    assert np.array_equal(
+        encode_game_state(first, 0, relative_seats=True),
+        encode_game_state(second, 2, relative_seats=True),
+    )
+    # The contract held by the partner instead is told apart
+    partner = game_with_hands({0: hand}, bidder=2)
+    assert not np.array_equal(
+        encode_game_state(first, 0, relative_seats=True),
+        encode_game_state(partner, 0, relative_seats=True),
+    )
+
+
+def test_shared_policy_trains_a_single_agent(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "src" / "ai").mkdir(parents=True)
+    main(shared_policy=True, num_episodes=3, save_frequency=3)
+
+    checkpoints = tmp_path / "src" / "ai" / "checkpoints"
+    assert [p.name for p in checkpoints.iterdir() if p.is_dir()] == ["shared"]
+    manifest = CheckpointManager(str(checkpoints)).manifest("shared")
+    assert manifest["latest"] == 2
+    checkpoint = torch.load(
+        checkpoints / "shared" / manifest["checkpoints"]["2"]["file"],
+        weights_only=True,
+    )
+    # One agent, trained from the decisions of every seat
+    assert checkpoint["state"]["scheduler"]["updates"] > 0
+    assert checkpoint["state_encoder"]["fc1.weight"].shape[1] == state_dim(True)
@@ -0,0 +1,115 @@
+import random
+
+import numpy as np
+import torch
+
+from models import Card, Suit
+from deck import create_deck
+from game import CoincheGame
+from ai.distributed import new_game, play_deal
+from ai.encoding import SUIT_OFFSET, encode_game_state
+from ai.models import CoincheAgent
+from ai.runtime import NumpyAgent, export_weights
+from ai.symmetry import (
+    CARD_PERMUTATIONS,
+    IDENTITY,
+    canonical_permutation,
+    encode_view,
+    permute_state,
+)
+from ai.utils import CompactReplayBuffer, NStepAccumulator
+
+SUITS = {offset // 8: suit for suit, offset in SUIT_OFFSET.items()}
+
+
+def played_transitions(agent: CoincheAgent) -> CompactReplayBuffer:
+    buffer = CompactReplayBuffer(capacity=256, relative_seats=agent.relative_seats)
+    accumulator = NStepAccumulator(buffer, n=1)
+    play_deal(new_game(), agent, accumulator, epsilon=0.5, rng=random.Random(0))
+    return buffer
+
+
+def test_relabelled_positions_share_a_canonical_state():
+    state = encode_game_state(new_game(), 0)
+    canonical = permute_state(state, canonical_permutation(state, None))
+    for card_perm in CARD_PERMUTATIONS:
+        relabelled = permute_state(state, card_perm)
+        assert np.array_equal(
+            permute_state(relabelled, canonical_permutation(relabelled, None)),
+            canonical,
+        )
+
+
+def test_augmented_transitions_stay_consistent():
+    buffer = played_transitions(CoincheAgent(device="cpu"))
+    batch = buffer.sample(len(buffer))
+    card_perms = CARD_PERMUTATIONS[np.arange(len(batch)) % len(CARD_PERMUTATIONS)]
+    augmented = batch.permute_suits(card_perms)
+
+    rows = torch.nonzero(batch.is_card).squeeze(1)
+    # The played card is still in hand and was legal in the relabelled state
+    assert augmented.states[rows, augmented.actions[rows]].all()
+    assert not torch.equal(augmented.states, batch.states)
+    # Legal next cards are still cards in the next hand
+    playing = augmented.next_states[:, 32:96].any(1)
+    hands = augmented.next_states[playing, :32].bool()
+    assert (augmented.next_masks[playing, :32] <= hands).all()
+    # Bids are not affected
+    assert torch.equal(augmented.actions[~batch.is_card], batch.actions[~batch.is_card])
+
+    restored = augmented.permute_suits(np.argsort(card_perms, axis=1))
+    assert torch.equal(restored.states, batch.states)
+    assert torch.equal(restored.next_states, batch.next_states)
+    assert torch.equal(restored.next_masks, batch.next_masks)
+    assert torch.equal(restored.actions, batch.actions)
+
+
+def test_canonical_agent_plays_a_deal():
+    agent = CoincheAgent(device="cpu", canonical_suits=True)
+    buffer = played_transitions(agent)
+    records = buffer.data[: len(buffer)]
+    assert records["is_card"].sum() == 32
+
+
+def relabel_suit(suit: Suit, card_perm: np.ndarray) -> Suit:
+    return SUITS[int(card_perm[SUIT_OFFSET[suit]]) // 8]
+
+
+def relabelled_game(game: CoincheGame, card_perm: np.ndarray) -> CoincheGame:
+    deck = {(card.suit, card.name): card for card in create_deck()}
+
+    def relabel(card: Card) -> Card:
+        return deck[relabel_suit(card.suit, card_perm), card.name]
+
+    relabelled = new_game()
+    for player, original in zip(relabelled.players, game.players):
+        player.hand = [relabel(card) for card in original.hand]
+    return relabelled
+
+
+def distinct_suits_game() -> CoincheGame:
+    """A deal whose suits are told apart by the hand, in another canonical order."""
+    for seed in range(100):
+        game = new_game(random.Random(seed))
+        state, card_perm = encode_view(game, 0, canonical_suits=True)
+        # A tie between two suits would leave their relabelling ambiguous
+        blocks = {state[:32].reshape(4, 8)[block].tobytes() for block in range(4)}
+        if len(blocks) == 4 and not np.array_equal(card_perm, IDENTITY):
+            return game
+    raise AssertionError("No deal with four distinct suits")
+
+
+def test_canonical_bids_are_made_in_the_real_suits(tmp_path):
+    agent = CoincheAgent(device="cpu", canonical_suits=True)
+    export_weights(agent, tmp_path / "agent.bin")
+    numpy_agent = NumpyAgent(tmp_path / "agent.bin")
+    game = distinct_suits_game()
+
+    for select_bid in (agent.select_bid, numpy_agent.select_bid):
+        bid = select_bid(game, 0)
+        assert bid.suit is not None
+        for card_perm in CARD_PERMUTATIONS[1:]:
+            # Same canonical position, so the same bid in relabelled suits
+            relabelled = select_bid(relabelled_game(game, card_perm), 0)
+            assert relabelled.points == bid.points
+            assert relabelled.suit == relabel_suit(bid.suit, card_perm)
@@ -0,0 +1,174 @@
+import numpy as np
+import torch
+
+from ai.encoding import NUM_BID_ACTIONS, STATE_DIM
+from ai.models import CoincheAgent
+from ai.scheduler import TrainingScheduler
+from ai.training import CoincheTrainer
+from ai.utils import CompactReplayBuffer, NStepAccumulator
+from ai.utils.compact_replay import unpack_records
+
+
+def networks(agent: CoincheAgent) -> list[torch.nn.Module]:
+    return [agent.state_encoder, agent.bidding_network, agent.card_play_network]
+
+
+def snapshot(agent: CoincheAgent) -> list[list[torch.Tensor]]:
+    return [[p.detach().clone() for p in n.parameters()] for n in networks(agent)]
+
+
+def changed(before: list[torch.Tensor], after: list[torch.Tensor]) -> bool:
+    return any(not torch.equal(b, a) for b, a in zip(before, after))
+
+
+def test_fused_update_trains_all_networks(filled_buffer):
+    agent = CoincheAgent(device="cpu")
+    trainer = CoincheTrainer(
+        agent, batch_size=32, replay_buffer=filled_buffer(), fused=True
+    )
+    before = snapshot(agent)
+    trainer.update_networks()
+    trainer.step_schedulers()
+
+    for network_before, network_after in zip(before, snapshot(agent)):
+        assert changed(network_before, network_after)
+
+
+def test_target_values_are_cached_until_refresh(filled_buffer):
+    agent = CoincheAgent(device="cpu")
+    buffer = filled_buffer()
+    trainer = CoincheTrainer(
+        agent,
+        batch_size=32,
+        replay_buffer=buffer,
+        target_update="hard",
+        target_update_interval=3,
+    )
+    assert trainer.target is not None and trainer.next_value_cache is not None
+
+    trainer.update_networks()
+    cached = trainer.next_value_cache.versions == 0
+    assert cached.any()
+    values = trainer.next_value_cache.values.copy()
+
+    # The target is frozen, so cached values must not move until it refreshes
+    trainer.update_networks()
+    still_cached = trainer.next_value_cache.versions == 0
+    np.testing.assert_array_equal(
+        trainer.next_value_cache.values[cached & still_cached],
+        values[cached & still_cached],
+    )
+
+    trainer.update_networks()
+    assert trainer.target.version == 1
+    for target, online in zip(
+        trainer.target.state_encoder.parameters(), agent.state_encoder.parameters()
+    ):
+        assert torch.equal(target, online)
+
+
+def test_polyak_target_moves_towards_online_networks(filled_buffer):
+    agent = CoincheAgent(device="cpu")
+    trainer = CoincheTrainer(
+        agent,
+        batch_size=32,
+        replay_buffer=filled_buffer(),
+        fused=True,
+        target_update="polyak",
+        target_update_interval=1,
+        tau=0.5,
+    )
+    assert trainer.target is not None
+    # Refreshed on every update, cached values could never be reused
+    assert trainer.next_value_cache is None
+    initial = [p.clone() for p in trainer.target.card_play_network.parameters()]
+    trainer.update_networks()
+
+    for before, target, online in zip(
+        initial,
+        trainer.target.card_play_network.parameters(),
+        agent.card_play_network.parameters(),
+    ):
+        torch.testing.assert_close(target, (before + online) / 2)
+
+
+def test_scheduler_follows_replay_ratio(filled_buffer):
+    buffer = filled_buffer()
+    trainer = CoincheTrainer(CoincheAgent(device="cpu"), replay_buffer=buffer)
+    scheduler = TrainingScheduler(
+        trainer,
+        replay_ratio=2.0,
+        warmup=32,
+        updates_per_round=3,
+        bid_batch_size=8,
+        card_batch_size=24,
+    )
+    # Nothing collected since the scheduler started
+    assert scheduler.step() == 0
+
+    buffer.push_records(buffer.data.copy())
+    # 128 samples are owed: three batches of 8 bids and 24 card plays, then one
+    assert scheduler.step() == 3
+    assert scheduler.step() == 1
+    assert scheduler.step() == 0
+    assert scheduler.report()["replay_ratio"] == 2.0
+    # The buffer holds three card plays for a bid, batches their own mix
+    batch = trainer._sample_batch()
+    assert batch.is_card.tolist() == [False] * 8 + [True] * 24
+
+    # Updates that train nothing are not counted
+    trainer.update_networks = lambda: False  # type: ignore
+    buffer.push_records(buffer.data.copy())
+    assert scheduler.step() == 0
+    assert scheduler.state_dict()["updates"] == 4
+
+
+def test_bf16_update_keeps_float32_weights(filled_buffer):
+    agent = CoincheAgent(device="cpu", bf16=True)
+    for fused in (True, False):
+        trainer = CoincheTrainer(
+            agent,
+            batch_size=32,
+            replay_buffer=filled_buffer(),
+            fused=fused,
+            target_update="hard",
+        )
+        before = snapshot(agent)
+        trainer.update_networks()
+
+        assert changed(before[0], snapshot(agent)[0])
+        assert all(
+            p.dtype == torch.float32 for n in networks(agent) for p in n.parameters()
+        )
+
+
+def test_bid_followed_by_card_play_bootstraps_from_card_head():
+    agent = CoincheAgent(device="cpu")
+    trainer = CoincheTrainer(agent)
+    buffer = CompactReplayBuffer(capacity=8)
+    accumulator = NStepAccumulator(buffer, n=1)
+    rng = np.random.default_rng(0)
+    states = [rng.integers(0, 2, STATE_DIM).astype(np.float32) for _ in range(3)]
+    bid_mask = np.zeros(NUM_BID_ACTIONS, dtype=np.bool_)
+    bid_mask[[0, 90]] = True
+    card_mask = np.zeros(NUM_BID_ACTIONS, dtype=np.bool_)
+    card_mask[5] = True
+
+    accumulator.observe(0, states[0], 90, False, bid_mask)
+    accumulator.observe(0, states[1], 5, True, card_mask)
+    accumulator.observe(1, states[0], 0, False, bid_mask)
+    accumulator.observe(1, states[2], 90, False, bid_mask)
+    batch = unpack_records(buffer.data[: len(buffer)])
+    assert batch.is_card.tolist() == [False, False]
+    assert batch.next_is_card.tolist() == [True, False]
+
+    for network in networks(agent):
+        network.eval()
+    with torch.no_grad():
+        features = agent.state_encoder(batch.next_states)
+        values = trainer._next_values(agent, features, batch)
+        card_q = agent.card_play_network(features)
+        bid_q = agent.bidding_network(features)
+    # The card play's mask is read on the card head, never on the bidding head
+    assert values[0] == card_q[0, 5]
+    assert values[1] == bid_q[1, [0, 90]].max()